@@ -0,0 +1,89 @@
+'''Compara a limpeza original (pd.read_csv + clean_database com máscaras
+encadeadas) com o pipeline atual (read_database + clean_database).
+
+Uso: python -m benchmarks.bench_clean --rows 5000000
+'''
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import write_orders
+from utils.data import clean_database, read_database
+
+
+def clean_database_legacy(dataframe):
+    # Implementação original das páginas, mantida como referência
+    linhas_selecionadas = dataframe['Delivery_person_Age'] != 'NaN '
+    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
+
+    linhas_selecionadas = dataframe['multiple_deliveries'] != 'NaN '
+    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
+
+    linhas_selecionadas = dataframe['Road_traffic_density'] != 'NaN '
+    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
+
+    linhas_selecionadas = dataframe['City'] != 'NaN '
+    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
+
+    linhas_selecionadas = dataframe['Festival'] != 'NaN '
+    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
+
+    dataframe['Time_taken(min)'] = dataframe['Time_taken(min)'].apply(
+        lambda x: x.split('(min) ')[1])
+
+    dataframe['Delivery_person_Age'] = dataframe['Delivery_person_Age'].astype(
+        int)
+    dataframe['multiple_deliveries'] = dataframe['multiple_deliveries'].astype(
+        int)
+    dataframe['Delivery_person_Ratings'] = dataframe['Delivery_person_Ratings'].astype(
+        float)
+    dataframe['Time_taken(min)'] = dataframe['Time_taken(min)'].astype(int)
+
+    dataframe['Order_Date'] = pd.to_datetime(
+        dataframe['Order_Date'], format='%d-%m-%Y')
+
+    dataframe = dataframe.reset_index(drop=True)
+
+    for column in ['ID', 'Road_traffic_density', 'Type_of_order',
+                   'Type_of_vehicle', 'City', 'Festival']:
+        dataframe.loc[:, column] = dataframe.loc[:, column].str.strip()
+
+    return dataframe
+
+
+def _timed(label, n_rows, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<10} {elapsed:8.2f} s  {n_rows / elapsed:12,.0f} linhas/s')
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--csv', help='CSV existente (senão gera um sintético)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = args.csv
+        if path is None:
+            path = write_orders(os.path.join(tmpdir, 'train.csv'), args.rows)
+
+        n_rows = sum(1 for _ in open(path)) - 1
+        print(f'{n_rows:,} linhas em {path}')
+
+        legacy, t_legacy = _timed(
+            'original', n_rows, lambda: clean_database_legacy(pd.read_csv(path)))
+        current, t_current = _timed(
+            'atual', n_rows, lambda: clean_database(read_database(path)))
+
+    pd.testing.assert_frame_equal(current, legacy, check_dtype=False)
+    print(f'speedup    {t_legacy / t_current:8.2f}x (resultados idênticos)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+'''Compara o cálculo de distância por linha (DataFrame.apply + haversine)
+com o kernel vetorizado utils.geo.haversine_km e confere a tolerância de
+1e-9 km entre os dois.
+
+Uso: python -m benchmarks.bench_distance --rows 200000
+'''
+import argparse
+import time
+
+import numpy as np
+from haversine import haversine
+
+from benchmarks.synthetic import generate_orders
+from utils.data import clean_database
+from utils.geo import DISTANCE_COLUMNS, delivery_distance
+
+TOLERANCE_KM = 1e-9
+
+
+def distance_apply(df):
+    # Implementação original da página de restaurantes
+    return df.loc[:, DISTANCE_COLUMNS].apply(lambda x: haversine(
+        (x['Restaurant_latitude'], x['Restaurant_longitude']), (x['Delivery_location_latitude'], x['Delivery_location_longitude'])), axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200_000)
+    args = parser.parse_args()
+
+    df = clean_database(generate_orders(args.rows))
+    n_rows = len(df)
+
+    start = time.perf_counter()
+    expected = distance_apply(df).to_numpy()
+    t_apply = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = delivery_distance(df)
+    t_vector = time.perf_counter() - start
+
+    max_error = np.max(np.abs(result - expected))
+    print(f'apply      {t_apply:8.3f} s  {n_rows / t_apply:14,.0f} linhas/s')
+    print(f'vetorizado {t_vector:8.3f} s  {n_rows / t_vector:14,.0f} linhas/s')
+    print(f'speedup    {t_apply / t_vector:8.1f}x  erro máximo {max_error:.2e} km')
+
+    assert max_error <= TOLERANCE_KM, max_error
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+'''Compara a memória ocupada pelo Dataframe limpo em cada representação:
+a original (strings como objetos Python, int64/float64), a do pipeline
+vetorizado antes do schema compacto e a do load_dataset (categorias, strings
+Arrow e inteiros/floats estreitos, ver utils.schema).
+
+Uso: python -m benchmarks.bench_frame_memory --rows 1000000
+'''
+import argparse
+import os
+import tempfile
+
+import pandas as pd
+
+from benchmarks.bench_clean import clean_database_legacy
+from benchmarks.synthetic import write_orders
+from utils.data import build_store, clean_database, load_dataset, read_database
+
+
+def _frame_mb(dataframe):
+    return dataframe.memory_usage(deep=True).sum() / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = write_orders(os.path.join(tmpdir, 'train.csv'), args.rows)
+
+        legacy = clean_database_legacy(pd.read_csv(path))
+        results = {'original': _frame_mb(legacy)}
+        del legacy
+
+        wide = clean_database(read_database(path))
+        results['vetorizado'] = _frame_mb(wide)
+        del wide
+
+        build_store(path)
+        compact = load_dataset(path=path)
+        results['schema compacto'] = _frame_mb(compact)
+
+        print(f'{len(compact):,} linhas')
+        print(compact.dtypes.to_string())
+
+    print()
+    for label, size_mb in results.items():
+        reduction = results['original'] / size_mb
+        print(f'{label:<16} {size_mb:9.1f} MB  ({reduction:.1f}x menor)')
+
+
+if __name__ == '__main__':
+    main()
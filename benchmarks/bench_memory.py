@@ -0,0 +1,84 @@
+'''Mede o pico de memória (RSS) da ingestão em streaming (build_store) e da
+leitura completa (read_database + clean_database) para CSVs de tamanhos
+crescentes. Na ingestão em streaming o pico deve ficar estável, limitado pelo
+tamanho do pedaço; na leitura completa ele cresce com o arquivo.
+
+Cada medição roda em um processo separado.
+
+Uso: python -m benchmarks.bench_memory --rows 400000 1200000 2400000 --chunk-size 16
+'''
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.synthetic import write_orders
+
+MODES = ['streaming', 'completo']
+
+
+def _peak_rss_mb():
+    # VmHWM (Linux) é o pico de RSS do processo atual; o ru_maxrss herdaria o
+    # pico do processo pai que gerou os CSVs
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run(mode, path, chunk_size):
+    from utils.data import build_store, clean_database, read_database
+
+    if mode == 'streaming':
+        build_store(path, chunk_size=chunk_size)
+    else:
+        clean_database(read_database(path))
+
+    print(f'{_peak_rss_mb():.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+',
+                        default=[400_000, 1_200_000, 2_400_000])
+    parser.add_argument('--chunk-size', type=int, default=16,
+                        help='tamanho (MB) de cada pedaço lido do CSV')
+    parser.add_argument('--run', nargs=2, metavar=('MODO', 'CSV'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    chunk_size = args.chunk_size * 2**20
+
+    if args.run:
+        _run(args.run[0], args.run[1], chunk_size)
+        return
+
+    print(f'{"linhas":>10} {"CSV (MB)":>9} ' + ' '.join(f'{mode:>12}' for mode in MODES))
+    streaming_peaks = []
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n_rows in args.rows:
+            path = write_orders(os.path.join(tmpdir, f'train_{n_rows}.csv'), n_rows)
+            size_mb = os.path.getsize(path) / 2**20
+
+            peaks = []
+            for mode in MODES:
+                output = subprocess.run(
+                    [sys.executable, '-m', 'benchmarks.bench_memory',
+                     '--chunk-size', str(args.chunk_size), '--run', mode, path],
+                    check=True, capture_output=True, text=True).stdout
+                peaks.append(float(output.split()[-1]))
+
+            streaming_peaks.append(peaks[0])
+            print(f'{n_rows:>10,} {size_mb:>9.0f} '
+                  + ' '.join(f'{peak:>9.0f} MB' for peak in peaks))
+
+    growth = max(streaming_peaks) / min(streaming_peaks)
+    print(f'variação do pico em streaming: {growth:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+'''Mede o tempo da ingestão (build_store: leitura, limpeza, distância, cubo e
+gravação do arquivo colunar) com 1, 2, 4 e 8 processos sobre um CSV
+sintético e confere que todos os modos gravam o mesmo resultado.
+
+O ganho depende dos núcleos livres da máquina: acima de os.cpu_count()
+processos não há o que acelerar.
+
+Uso: python -m benchmarks.bench_parallel --rows 2000000 --workers 1 2 4 8
+'''
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import write_orders
+from utils.data import build_store
+from utils.rollup import ROLLUP_KEYS
+from utils.store import open_store, read_rollup, rollup_path, store_path
+
+
+def _summary(path):
+    # Quantidade de linhas e pedidos por célula do cubo, para comparar os modos
+    cube = read_rollup(rollup_path(path)).sort_values(ROLLUP_KEYS)
+
+    return open_store(store_path(path)).num_rows, cube['orders'].tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--chunk-size', type=int, default=16,
+                        help='tamanho (MB) de cada pedaço lido do CSV')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = write_orders(os.path.join(tmpdir, 'train.csv'), args.rows)
+        size_mb = os.path.getsize(path) / 2**20
+        print(f'{args.rows:,} linhas, CSV de {size_mb:.0f} MB, '
+              f'{os.cpu_count()} núcleos disponíveis')
+
+        print(f'{"processos":>9} {"tempo (s)":>10} {"linhas/s":>12} {"speedup":>8}')
+        baseline = reference = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            build_store(path, chunk_size=args.chunk_size * 2**20, workers=workers)
+            elapsed = time.perf_counter() - start
+
+            summary = _summary(path)
+            if reference is None:
+                baseline, reference = elapsed, summary
+            elif summary != reference:
+                raise AssertionError(f'resultado diferente com {workers} processos')
+
+            print(f'{workers:>9} {elapsed:>10.2f} {args.rows / elapsed:>12,.0f} '
+                  f'{baseline / elapsed:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
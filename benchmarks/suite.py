@@ -0,0 +1,163 @@
+'''Suíte de benchmarks reproduzível: para cada escala gera um CSV sintético
+(benchmarks.synthetic, semente fixa) e mede a ingestão, o clean_database, a
+distância, o ranking de entregadores (substituto do top_delivers) e cada
+função de dados/gráfico da Visão Empresa. Os tempos são gravados em JSON e
+comparados com a baseline salva; etapas mais lentas que a baseline além da
+tolerância são marcadas como regressão (código de saída 1).
+
+Uso: python -m benchmarks.suite --rows 10000 100000 1000000
+     python -m benchmarks.suite --rows 10000 100000 --save-baseline
+'''
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import write_orders
+from utils.data import build_store, clean_database, load_dataset, load_rollup, read_database_chunks
+from utils.geo import DISTANCE_COLUMNS, delivery_distance
+from utils.precompute import page_functions
+from utils.ranking import top_couriers
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+PAGE_PATH = os.path.join(BENCH_DIR, '..', 'pages', '01_visao_empresa.py')
+
+# Diferenças abaixo deste tempo (s) são ruído e nunca contam como regressão
+NOISE_SECONDS = 0.005
+
+
+def _best(func, *args, repeat=3, **kwargs):
+    # Menor tempo entre as repetições (menos sujeito a ruído)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def _clean_seconds(path):
+    # Somente a limpeza, pedaço a pedaço (o CSV inteiro não cabe em memória
+    # nas escalas maiores)
+    total = 0.0
+    for raw in read_database_chunks(path):
+        start = time.perf_counter()
+        clean_database(raw)
+        total += time.perf_counter() - start
+
+    return total
+
+
+def run_scale(n_rows, tmpdir, repeat):
+    '''Mede todas as etapas em uma escala.
+
+        Input: quantidade de linhas, diretório temporário e repetições
+        Output: dict etapa -> segundos
+    '''
+    path = write_orders(os.path.join(tmpdir, f'train_{n_rows}.csv'), n_rows)
+    page = page_functions(PAGE_PATH)
+    results = {}
+
+    results['ingest'] = _best(build_store, path, repeat=1)
+    results['clean_database'] = _clean_seconds(path)
+
+    coordinates = load_dataset(DISTANCE_COLUMNS, path=path)
+    results['distance'] = _best(delivery_distance, coordinates, repeat=repeat)
+
+    couriers = load_dataset(['City', 'Delivery_person_ID', 'Time_taken(min)'], path=path)
+    results['top_couriers'] = _best(top_couriers, couriers, repeat=repeat)
+
+    cube = load_rollup(path)
+    for name in ['order_metric', 'trafic_order_share', 'trafic_order_city', 'order_by_week']:
+        results[name] = _best(page[name], cube, repeat=repeat)
+    results['order_share_by_week'] = _best(page['order_share_by_week'], cube, True, repeat=repeat)
+    results['order_share_by_week_hll'] = _best(page['order_share_by_week'], cube, False, repeat=repeat)
+
+    df = load_dataset(page['COLUMNS'], path=path)
+    for name in ['map_medians', 'map_points', 'map_density', 'spatial_index']:
+        results[name] = _best(page[name], df, repeat=repeat)
+
+    os.remove(path)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    '''Compara os tempos com a baseline, escala a escala.
+
+        Input: resultados e baseline (dict linhas -> etapa -> segundos) e
+               tolerância relativa
+        Output: lista de (linhas, etapa, baseline, atual, razão) das regressões
+    '''
+    regressions = []
+    for rows, stages in results.items():
+        for name, seconds in stages.items():
+            reference = baseline.get(rows, {}).get(name)
+            if reference is None:
+                continue
+
+            if seconds > reference * (1 + tolerance) and seconds - reference > NOISE_SECONDS:
+                regressions.append((rows, name, reference, seconds, seconds / reference))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='aumento relativo tolerado antes de marcar regressão')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='grava os resultados como nova baseline')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for n_rows in args.rows:
+            results[str(n_rows)] = run_scale(n_rows, tmpdir, args.repeat)
+
+            print(f'\n{n_rows:,} linhas')
+            for name, seconds in results[str(n_rows)].items():
+                print(f'  {name:<26} {seconds * 1000:>10.1f} ms')
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump({'python': sys.version.split()[0], 'machine': platform.platform(),
+                   'cpus': os.cpu_count(), 'results': results}, file, indent=2)
+    print(f'\nresultados gravados em {output}')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump({'results': results}, file, indent=2)
+        print(f'baseline gravada em {args.baseline}')
+        return
+
+    if not os.path.exists(args.baseline):
+        print('sem baseline para comparar (use --save-baseline)')
+        return
+
+    with open(args.baseline, encoding='utf-8') as file:
+        baseline = json.load(file)['results']
+
+    regressions = compare(results, baseline, args.tolerance)
+    for rows, name, reference, seconds, ratio in regressions:
+        print(f'REGRESSÃO {int(rows):,} linhas {name}: '
+              f'{reference * 1000:.1f} ms -> {seconds * 1000:.1f} ms ({ratio:.2f}x)')
+
+    if regressions:
+        sys.exit(1)
+
+    print(f'nenhuma regressão acima de {args.tolerance:.0%}')
+
+
+if __name__ == '__main__':
+    main()
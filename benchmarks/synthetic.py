@@ -0,0 +1,116 @@
+'''Gerador de pedidos sintéticos com o schema e os formatos sujos do
+train.csv, reproduzível pela semente e gravado em blocos (de 10 mil a dezenas
+de milhões de linhas com memória limitada pelo bloco).
+
+Uso: python -m benchmarks.synthetic --rows 50000000 --out ./dataset/sintetico.csv
+'''
+import argparse
+
+import numpy as np
+import pandas as pd
+
+CITIES = ['Metropolitian ', 'Urban ', 'Semi-Urban ']
+TRAFFIC = ['Low ', 'Medium ', 'High ', 'Jam ']
+WEATHER = ['Sunny', 'Stormy', 'Sandstorms', 'Cloudy', 'Fog', 'Windy', 'NaN']
+ORDERS = ['Snack ', 'Meal ', 'Drinks ', 'Buffet ']
+VEHICLES = ['motorcycle ', 'scooter ', 'electric_scooter ', 'bicycle ']
+FESTIVAL = ['No ', 'Yes ']
+REGIONS = ['INDO', 'BANG', 'COIMB', 'CHEN', 'HYD', 'RANCHI', 'MYS', 'DEH',
+           'KOC', 'PUNE', 'LUDH', 'KNP', 'MUM', 'KOL', 'JAP', 'SUR', 'GOA',
+           'AURG', 'AGR', 'VAD', 'ALH', 'BHP']
+
+NAN_TEXT = 'NaN '
+
+
+def _with_nan(values, rate, rng):
+    values = values.astype(object)
+    values[rng.random(len(values)) < rate] = NAN_TEXT
+    return values
+
+
+def generate_orders(n_rows, seed=0, start_date='2022-02-11', days=55):
+    '''Gera pedidos sintéticos com o mesmo schema e os mesmos formatos sujos
+        do train.csv: sentinelas 'NaN ', espaços no fim dos textos, datas
+        no formato dd-mm-aaaa e tempos como '(min) 24'.
+
+        Input: quantidade de linhas, semente e intervalo de datas
+        Output: Dataframe no formato bruto do CSV
+    '''
+    rng = np.random.default_rng(seed)
+
+    couriers = np.array([f'{region}RES{res:02d}DEL{num:02d} '
+                         for region in REGIONS
+                         for res in range(1, 21)
+                         for num in range(1, 4)])
+
+    age = rng.integers(18, 40, n_rows).astype(str).astype(object)
+    ratings = np.round(rng.uniform(2.5, 5.0, n_rows), 1).astype(str).astype(object)
+    missing_person = rng.random(n_rows) < 0.04
+    age[missing_person] = NAN_TEXT
+    ratings[missing_person] = NAN_TEXT
+
+    restaurant_lat = rng.uniform(10.0, 31.0, n_rows)
+    restaurant_lon = rng.uniform(72.0, 88.5, n_rows)
+
+    order_date = (pd.Timestamp(start_date)
+                  + pd.to_timedelta(rng.integers(0, days, n_rows), unit='D'))
+
+    time_taken = np.char.add('(min) ',
+                             rng.integers(10, 55, n_rows).astype(str))
+
+    return pd.DataFrame({
+        'ID': np.char.add(np.char.add('0x', np.char.mod('%x', np.arange(n_rows) + 0x1000)), ' '),
+        'Delivery_person_ID': couriers[rng.integers(0, len(couriers), n_rows)],
+        'Delivery_person_Age': age,
+        'Delivery_person_Ratings': ratings,
+        'Restaurant_latitude': restaurant_lat,
+        'Restaurant_longitude': restaurant_lon,
+        'Delivery_location_latitude': restaurant_lat + rng.uniform(-0.15, 0.15, n_rows),
+        'Delivery_location_longitude': restaurant_lon + rng.uniform(-0.15, 0.15, n_rows),
+        'Order_Date': order_date.strftime('%d-%m-%Y'),
+        'Time_Orderd': '11:30:00',
+        'Time_Order_picked': '11:45:00',
+        'Weatherconditions': np.char.add('conditions ', rng.choice(WEATHER, n_rows)),
+        'Road_traffic_density': _with_nan(rng.choice(TRAFFIC, n_rows), 0.01, rng),
+        'Vehicle_condition': rng.integers(0, 4, n_rows),
+        'Type_of_order': rng.choice(ORDERS, n_rows),
+        'Type_of_vehicle': rng.choice(VEHICLES, n_rows),
+        'multiple_deliveries': _with_nan(rng.integers(0, 4, n_rows).astype(str), 0.02, rng),
+        'Festival': _with_nan(rng.choice(FESTIVAL, n_rows, p=[0.98, 0.02]), 0.005, rng),
+        'City': _with_nan(rng.choice(CITIES, n_rows), 0.03, rng),
+        'Time_taken(min)': time_taken,
+    })
+
+
+def write_orders(path, n_rows, seed=0, chunk_rows=500_000):
+    '''Grava um CSV sintético em disco, gerado em blocos de chunk_rows
+        linhas para não precisar do arquivo inteiro em memória.
+
+        Input: caminho de saída, quantidade de linhas, semente e tamanho
+               do bloco
+        Output: caminho do arquivo gravado
+    '''
+    for number, start in enumerate(range(0, n_rows, chunk_rows)):
+        chunk = generate_orders(min(chunk_rows, n_rows - start),
+                                seed=seed + number)
+        chunk['ID'] = np.char.add(np.char.add(
+            '0x', np.char.mod('%x', np.arange(len(chunk)) + start + 0x1000)), ' ')
+        chunk.to_csv(path, index=False, header=number == 0,
+                     mode='w' if number == 0 else 'a')
+
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, required=True)
+    parser.add_argument('--out', required=True, help='CSV de saída')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-rows', type=int, default=500_000)
+    args = parser.parse_args()
+
+    print(write_orders(args.out, args.rows, seed=args.seed, chunk_rows=args.chunk_rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,145 +1,287 @@
-import folium
 from datetime import datetime
-from PIL import Image
-from streamlit_folium import folium_static
+import numpy as np
 import pandas as pd
+from PIL import Image
 import plotly.express as px
+import pydeck as pdk
 import streamlit as st
+from utils.cache import memoize
+from utils.data import dataset_version, load_rollup, pin_dataset
+from utils.geo import build_grid_index, grid_cells, grid_density, nearest_query, radius_query
+from utils.layout import render_dataset_version, render_profile, render_tabs
+from utils.profiling import profiled, start_trace
+from utils.refresh import start_refresher
+from utils.rollup import filter_rollup, unique_couriers
+from utils.sketch import HLL_ERROR, approx_unique
+from utils.sqlstore import (SqlQuery, filtered_source, sql_frame, sql_grid_density,
+                            sql_quantile, sql_sample)
 
 st.set_page_config(page_title='Visão Empresa', page_icon='📈', layout='wide')
 
 
-def clean_database(dataframe):
-    '''Esta função tem a responsabilidade de limpar o dataframe
-        Tipos de limpeza:
-        1 - Remoção dos dados NaN
-        2 - Mudança do tipo da coluna de dados
-        3 - Remoção dos espaços das variáveis de texto
-        4 - Formatação da coluna de datas
-        5 - Limpeza da coluna de tempo (remoção do texto da variável numérica)
+@profiled
+def order_metric(cube):
+    # Pedidos por dia direto do cubo diário
+    df_aux = cube.loc[:, ['Order_Date', 'orders']].groupby(
+        'Order_Date').sum().reset_index()
+    fig = px.bar(df_aux, x='Order_Date', y='orders')
 
-        Input: Dataframe
-        Output: Dataframe
-    '''
-    # Removendo linhas com NaN da base de dados
-    linhas_selecionadas = dataframe['Delivery_person_Age'] != 'NaN '
-    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
+    return fig
 
-    linhas_selecionadas = dataframe['multiple_deliveries'] != 'NaN '
-    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
 
-    linhas_selecionadas = dataframe['Road_traffic_density'] != 'NaN '
-    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
+@profiled
+def trafic_order_share(cube):
+    df_aux = cube.loc[:, ['orders', 'Road_traffic_density']].groupby(
+        'Road_traffic_density', observed=True).sum().reset_index()
+    df_aux = df_aux.loc[df_aux['Road_traffic_density'] != "NaN", :]
+    df_aux['entregas_perc'] = df_aux['orders'] / df_aux['orders'].sum()
+    fig = px.pie(df_aux, values='entregas_perc', names='Road_traffic_density')
 
-    linhas_selecionadas = dataframe['City'] != 'NaN '
-    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
+    return fig
 
-    linhas_selecionadas = dataframe['Festival'] != 'NaN '
-    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
 
-    # Remover o texto de numeros --> '(min) 24'
-    dataframe['Time_taken(min)'] = dataframe['Time_taken(min)'].apply(
-        lambda x: x.split('(min) ')[1])
+@profiled
+def trafic_order_city(cube):
+    df_aux = cube.loc[:, ['orders', 'City', 'Road_traffic_density']].groupby(
+        ['City', 'Road_traffic_density'], observed=True).sum().reset_index()
+    fig = px.scatter(df_aux, x='City', y='Road_traffic_density',
+                     size='orders', color='City')
 
-    # Converter os tipos das colunas
-    dataframe['Delivery_person_Age'] = dataframe['Delivery_person_Age'].astype(
-        int)
+    return fig
 
-    dataframe['multiple_deliveries'] = dataframe['multiple_deliveries'].astype(
-        int)
 
-    dataframe['Delivery_person_Ratings'] = dataframe['Delivery_person_Ratings'].astype(
-        float)
+@profiled
+def order_by_week(cube):
+    # A coluna week_of_day já vem calculada no cubo
+    df_aux = cube.loc[:, ['week_of_day', 'orders']].groupby(
+        'week_of_day').sum().reset_index()
+    fig = px.line(df_aux, x='week_of_day', y='orders')
+    return fig
 
-    dataframe['Time_taken(min)'] = dataframe['Time_taken(min)'].astype(int)
 
-    # Precisa usar a biblioteca pandas quando se trata de converter em data
-    dataframe['Order_Date'] = pd.to_datetime(
-        dataframe['Order_Date'], format='%d-%m-%Y')
+@profiled
+def order_share_by_week(cube, exact):
+    # Entregadores únicos da semana = união das células: conjuntos (exato)
+    # ou sketches HyperLogLog (aproximado)
+    couriers = ('couriers', unique_couriers) if exact else ('hll', approx_unique)
+    df_aux = cube.groupby('week_of_day').agg(
+        orders=('orders', 'sum'),
+        Delivery_person_ID=couriers).reset_index()
+    df_aux['order_by_deliver'] = df_aux['orders'] / df_aux['Delivery_person_ID']
+    fig = px.line(df_aux, x='week_of_day', y='order_by_deliver')
+    return fig
 
-    # Resetar o index
-    dataframe = dataframe.reset_index(drop=True)
 
-    # Remover os espaços em branco dentro das strings de ID
-    dataframe.loc[:, 'ID'] = dataframe.loc[:, 'ID'].str.strip()
-    dataframe.loc[:, 'Road_traffic_density'] = dataframe.loc[:,
-                                                             'Road_traffic_density'].str.strip()
-    dataframe.loc[:, 'Type_of_order'] = dataframe.loc[:,
-                                                      'Type_of_order'].str.strip()
-    dataframe.loc[:, 'Type_of_vehicle'] = dataframe.loc[:,
-                                                        'Type_of_vehicle'].str.strip()
-    dataframe.loc[:, 'City'] = dataframe.loc[:, 'City'].str.strip()
-    dataframe.loc[:, 'Festival'] = dataframe.loc[:, 'Festival'].str.strip()
+# Modos do mapa: medianas por (cidade, trânsito), pontos de entrega ou densidade
+MAP_MODES = ['Medianas', 'Pontos', 'Densidade']
+
+# Limite de pontos enviados ao navegador no modo de pontos
+MAP_POINTS = 50_000
+
+# Lado da célula (graus) da grade usada no modo de densidade
+DENSITY_CELL_DEG = 0.25
+
+
+@profiled
+def map_medians(df):
+    if isinstance(df, SqlQuery):
+        # Medianas calculadas no banco, uma consulta por coordenada
+        by = ('City', 'Road_traffic_density')
+        df_aux = pd.concat([sql_quantile(df, column, by, 0.5, interpolation='midpoint')
+                            for column in ['Delivery_location_latitude',
+                                           'Delivery_location_longitude']], axis=1).reset_index()
+    else:
+        df_aux = df.loc[:, ['City', 'Road_traffic_density', 'Delivery_location_latitude',
+                            'Delivery_location_longitude']].groupby(['City', 'Road_traffic_density'], observed=True).median().reset_index()
+
+    df_aux['City'] = df_aux['City'].astype(str)
+    df_aux['Road_traffic_density'] = df_aux['Road_traffic_density'].astype(str)
+
+    return df_aux
+
+
+@profiled
+def map_points(df):
+    # Amostra fixa (mesma semente) para não travar o navegador; nomes curtos e
+    # 5 casas decimais (~1 m) deixam o JSON enviado ao navegador menor
+    columns = ['Delivery_location_latitude', 'Delivery_location_longitude']
+    if isinstance(df, SqlQuery):
+        # Mesma amostra, sorteada no Python e buscada no banco
+        df_aux = sql_sample(df, columns, MAP_POINTS, seed=0)
+    else:
+        df_aux = df.loc[:, columns]
+        if len(df_aux) > MAP_POINTS:
+            df_aux = df_aux.sample(n=MAP_POINTS, random_state=0)
 
-    return dataframe
+    df_aux.columns = ['lat', 'lon']
 
+    return df_aux.round(5).reset_index(drop=True)
 
-def order_metric(df):
-    cols = ['ID', 'Order_Date']
-    # Selecao de linhas
-    df_aux = df.loc[:, cols].groupby('Order_Date').count().reset_index()
-    fig = px.bar(df_aux, x='Order_Date', y='ID')
 
-    return fig
+@profiled
+def map_density(df):
+    # Contagem por célula feita no servidor (ou no banco); o navegador só
+    # agrupa as células
+    if isinstance(df, SqlQuery):
+        return sql_grid_density(df, 'Delivery_location_latitude',
+                                'Delivery_location_longitude', DENSITY_CELL_DEG)
 
+    return grid_density(df['Delivery_location_latitude'].to_numpy(),
+                        df['Delivery_location_longitude'].to_numpy(),
+                        DENSITY_CELL_DEG)
 
-def trafic_order_share(df):
-    df_aux = df.loc[:, ['ID',  'Road_traffic_density']].groupby(
-        'Road_traffic_density').count().reset_index()
-    df_aux = df_aux.loc[df_aux['Road_traffic_density'] != "NaN", :]
-    df_aux['entregas_perc'] = df_aux['ID'] / df_aux['ID'].sum()
-    fig = px.pie(df_aux, values='entregas_perc', names='Road_traffic_density')
 
-    return fig
+@profiled
+def contry_maps(df_aux, mode):
+    # Uma única camada com todos os pontos, em vez de um Marker por linha
+    if mode == 'Medianas':
+        layer = pdk.Layer('ScatterplotLayer', df_aux,
+                          get_position=['Delivery_location_longitude',
+                                        'Delivery_location_latitude'],
+                          get_fill_color=[200, 30, 0, 200],
+                          get_radius=5000, radius_min_pixels=5, pickable=True)
+        tooltip = {'text': '{City}\n{Road_traffic_density}'}
+        lat, lon = 'Delivery_location_latitude', 'Delivery_location_longitude'
 
+    elif mode == 'Pontos':
+        layer = pdk.Layer('ScatterplotLayer', df_aux, get_position=['lon', 'lat'],
+                          get_fill_color=[200, 30, 0, 120],
+                          get_radius=200, radius_min_pixels=1)
+        tooltip = None
+        lat, lon = 'lat', 'lon'
 
-def trafic_order_city(df):
-    df_aux = df.loc[:, ['ID', 'City', 'Road_traffic_density']].groupby(
-        ['City', 'Road_traffic_density']).count().reset_index()
-    fig = px.scatter(df_aux, x='City', y='Road_traffic_density',
-                     size='ID', color='City')
+    else:
+        layer = pdk.Layer('HexagonLayer', df_aux, get_position=['lon', 'lat'],
+                          get_color_weight='count', color_aggregation='SUM',
+                          get_elevation_weight='count', elevation_aggregation='SUM',
+                          radius=30000, elevation_scale=100, extruded=True,
+                          pickable=True)
+        tooltip = {'text': '{elevationValue} entregas'}
+        lat, lon = 'lat', 'lon'
 
-    return fig
+    if len(df_aux) > 0:
+        view = pdk.ViewState(latitude=float(df_aux[lat].median()),
+                             longitude=float(df_aux[lon].median()), zoom=4, pitch=0)
+    else:
+        view = pdk.ViewState(latitude=20.0, longitude=79.0, zoom=4)
 
+    st.pydeck_chart(pdk.Deck(layers=[layer], initial_view_state=view,
+                             tooltip=tooltip), use_container_width=True)
 
-def order_by_week(df):
-    # Criar a coluna dia da semana
-    df['week_of_day'] = df['Order_Date'].dt.strftime('%U')
-    df_aux = df.loc[:, ['week_of_day', 'ID']].groupby(
-        'week_of_day').count().reset_index()
-    fig = px.line(df_aux, x='week_of_day', y='ID')
-    return fig
 
+# Ponto de referência inicial das consultas espaciais (centro da Índia)
+REFERENCE_POINT = (20.0, 79.0)
+
+
+@profiled
+def spatial_index(df):
+    # Índices em grade dos restaurantes e dos locais de entrega; cada
+    # restaurante aparece em vários pedidos, então a grade dos restaurantes
+    # usa as coordenadas distintas (as posições apontam para 'restaurants')
+    restaurants = (df.loc[:, ['City', 'Restaurant_latitude', 'Restaurant_longitude']]
+                   .drop_duplicates(['Restaurant_latitude', 'Restaurant_longitude'])
+                   .reset_index(drop=True))
+
+    return {'restaurants': restaurants,
+            'restaurant': build_grid_index(restaurants['Restaurant_latitude'].to_numpy(),
+                                           restaurants['Restaurant_longitude'].to_numpy()),
+            'delivery': build_grid_index(df['Delivery_location_latitude'].to_numpy(),
+                                         df['Delivery_location_longitude'].to_numpy())}
+
+
+@profiled
+def courier_coverage(df, grid):
+    # Entregas e entregadores distintos por célula da grade dos locais de entrega
+    cells = np.repeat(np.arange(len(grid['cells'])), np.diff(grid['offsets']))
+    couriers = df['Delivery_person_ID'].cat.codes.to_numpy()[grid['order']]
+
+    df_aux = grid_cells(grid).rename(columns={'count': 'entregas'})
+    df_aux['entregadores'] = pd.Series(couriers).groupby(cells).nunique().to_numpy()
+
+    return df_aux.sort_values('entregadores', ascending=False).reset_index(drop=True)
+
+
+# Import dataset (somente as colunas usadas nesta página)
+COLUMNS = ['Order_Date', 'City', 'Road_traffic_density', 'Delivery_person_ID',
+           'Restaurant_latitude', 'Restaurant_longitude',
+           'Delivery_location_latitude', 'Delivery_location_longitude']
+
+# Dados de cada modo do mapa
+MAP_PAYLOADS = {'Medianas': map_medians, 'Pontos': map_points,
+                'Densidade': map_density}
 
-def order_share_by_week(df):
-    df_aux1 = df.loc[:, ['ID', 'week_of_day']].groupby(
-        'week_of_day').count().reset_index()
-    df_aux2 = df.loc[:, ['Delivery_person_ID', 'week_of_day']
-                     ].groupby('week_of_day').nunique().reset_index()
-    df_aux = pd.merge(df_aux1, df_aux2, how='inner')
-    df_aux['order_by_deliver'] = df_aux['ID'] / df_aux['Delivery_person_ID']
-    fig = px.line(df_aux, x='week_of_day', y='order_by_deliver')
-    return fig
 
+# ===============================================================================
+# Dados das abas (guardados por estado dos filtros)
+# ===============================================================================
+
+def page_sources(date_start, date_slider, traffic_options):
+    '''Fontes da página para um estado dos filtros da barra lateral: pedidos
+        filtrados (Dataframe compartilhado entre as sessões ou consulta no
+        banco), fatia do cubo diário e chave do cache de gráficos.
+
+        Input: data inicial, data limite e condições de trânsito
+        Output: (pedidos, cubo, filtros)
+    '''
+    df1 = filtered_source(COLUMNS, date_slider, traffic_options, date_start)
+    cube = filter_rollup(load_rollup(), date_slider, traffic_options, date_start)
+
+    # Chave do cache de gráficos: versão do dataset + filtros da barra lateral
+    filters = (dataset_version(), date_start, date_slider,
+               tuple(sorted(traffic_options)))
+
+    return df1, cube, filters
 
-def contry_maps(df):
-    df_aux = df.loc[:, ['City', 'Road_traffic_density', 'Delivery_location_latitude',
-                        'Delivery_location_longitude']].groupby(['City', 'Road_traffic_density']).median().reset_index()
 
-    map = folium.Map()
+def management_charts(cube, filters):
+    # Pedidos por dia, por trânsito e por cidade e trânsito
+    return (memoize('order_metric', filters, order_metric, cube),
+            memoize('trafic_order_share', filters, trafic_order_share, cube),
+            memoize('trafic_order_city', filters, trafic_order_city, cube))
 
-    for index, location_info in df_aux.iterrows():
-        folium.Marker([location_info['Delivery_location_latitude'], location_info['Delivery_location_longitude']],
-                      popup=location_info[['City', 'Road_traffic_density']]).add_to(map)
 
-    folium_static(map, width=1024, height=600)
+def tactical_charts(cube, filters, exact):
+    # Pedidos por semana e pedidos por entregador na semana
+    return (memoize('order_by_week', filters, order_by_week, cube),
+            memoize(f'order_share_by_week_{exact}', filters,
+                    order_share_by_week, cube, exact))
 
 
-# Import dataset
-df = pd.read_csv('./dataset/train.csv')
+def map_data(df1, filters, mode):
+    # Dados do mapa guardados por estado dos filtros e modo
+    return memoize(f'contry_maps_{mode}', filters, MAP_PAYLOADS[mode], df1)
 
-# Limpando os dados
-df1 = clean_database(df)
+
+def spatial_data(df1, filters):
+    # O índice em grade fica na memória: no backend SQL só o filtro vai para
+    # o banco e as linhas filtradas voltam para montar o índice
+    points = df1
+    if isinstance(df1, SqlQuery):
+        points = memoize('spatial_points', filters, sql_frame, df1, COLUMNS,
+                         snapshot=False)
+
+    grids = memoize('spatial_index', filters, spatial_index, points,
+                    snapshot=False)
+    coverage = memoize('courier_coverage', filters, courier_coverage, points,
+                       grids['delivery'])
+
+    return grids, coverage
+
+
+def precompute_page(date_start, date_slider, traffic_options):
+    '''Calcula todos os gráficos e tabelas da página para um estado dos
+        filtros, com cada opção dos widgets das abas, sem executar o layout
+        (ver utils.precompute).
+
+        Input: data inicial, data limite e condições de trânsito
+    '''
+    df1, cube, filters = page_sources(date_start, date_slider, traffic_options)
+
+    management_charts(cube, filters)
+    tactical_charts(cube, filters, exact=False)
+    for mode in MAP_MODES:
+        map_data(df1, filters, mode)
+    spatial_data(df1, filters)
 
 
 # ===============================================================================
@@ -157,10 +299,10 @@ st.sidebar.markdown('## Fastest Delivery in Town')
 st.sidebar.markdown('''---''')
 
 
-st.sidebar.markdown('## Selecione uma data limite')
-date_slider = st.sidebar.slider(
-    'Até qual valor?',
-    value=datetime(2022, 4, 13),
+st.sidebar.markdown('## Selecione o período')
+date_start, date_slider = st.sidebar.slider(
+    'De qual data até qual valor?',
+    value=(datetime(2022, 2, 11), datetime(2022, 4, 13)),
     min_value=datetime(2022, 2, 11),
     max_value=datetime(2022, 4, 6),
     format='DD-MM-YYYY'
@@ -174,59 +316,112 @@ traffic_options = st.sidebar.multiselect(
     default=['Low', 'Medium', 'High', 'Jam']
 )
 
+st.sidebar.markdown('''---''')
+
+# Entregadores únicos exatos (conjuntos) ou aproximados (sketches)
+exact_counts = st.sidebar.checkbox('Contagem exata de entregadores únicos', value=False)
+
+# Somente a aba selecionada é calculada (desligado: todas as abas, como no st.tabs)
+lazy_tabs = st.sidebar.checkbox('Calcular somente a aba selecionada', value=True)
+
+# Painel de depuração: tempo, linhas e alocações de cada etapa do rerun
+debug = st.sidebar.checkbox('Painel de depuração', value=False)
+debug_memory = debug and st.sidebar.checkbox('Medir alocações (mais lento)', value=False)
+start_trace(debug, memory=debug_memory, name='01_visao_empresa')
+
+# Versão do dataset fixada para todo o rerun; as versões novas são abertas
+# em segundo plano e trocadas atomicamente (ver utils.refresh)
+start_refresher()
+version = pin_dataset()
+
+# Versão do dataset usada neste rerun
+render_dataset_version(version)
+
 st.sidebar.markdown('''---''')
 st.sidebar.markdown('### Powered by Robson ❤️')
 
 # =========================
 # Filtros
 # =========================
-# Filtro de data
-linhas_selecionadas = df1['Order_Date'] < date_slider
-df1 = df1.loc[linhas_selecionadas, :]
-
-# Filtro de tânsito
-linhas_selecionadas = df1['Road_traffic_density'].isin(traffic_options)
-df1 = df1.loc[linhas_selecionadas, :]
+# Filtro de período e de trânsito aplicado aos pedidos e ao cubo diário
+# pré-agregado usado pelos gráficos das visões gerencial e tática
+df1, cube, filters = page_sources(date_start, date_slider, traffic_options)
 
 # ===============================================================================
 # layout - Streamlit
 # ===============================================================================
 
 
-tab1, tab2, tab3 = st.tabs(
-    ['Visão Gerencial', 'Visão Tática', 'Visão Geográfica'])
+def visao_gerencial():
+    fig_day, fig_share, fig_city = management_charts(cube, filters)
 
-with tab1:
     with st.container():
         # Order Metric
-        fig = order_metric(df1)
         st.header('Orders by Day')
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig_day, use_container_width=True)
 
     with st.container():
 
         col1, col2 = st.columns(2)
         with col1:
-            fig = trafic_order_share(df1)
             st.header('Traffic Order Share')
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(fig_share, use_container_width=True)
 
         with col2:
-            fig = trafic_order_city(df1)
             st.header('Traffic Order City')
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(fig_city, use_container_width=True)
+
+
+def visao_tatica():
+    fig_week, fig_share = tactical_charts(cube, filters, exact_counts)
 
-with tab2:
     with st.container():
-        fig = order_by_week(df1)
         st.header('Order by Week')
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig_week, use_container_width=True)
 
     with st.container():
-        fig = order_share_by_week(df1)
         st.header('Order Share by Week')
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig_share, use_container_width=True)
+        if not exact_counts:
+            st.caption(f'Entregadores únicos estimados (HyperLogLog, erro padrão ~{HLL_ERROR:.1%})')
 
-with tab3:
+
+def visao_geografica():
     st.header('Country Maps')
-    contry_maps(df1)
+    mode = st.radio('Modo do mapa', MAP_MODES, horizontal=True)
+    contry_maps(map_data(df1, filters, mode), mode)
+
+    st.markdown('''---''')
+    st.header('Consultas Espaciais')
+
+    # Índices espaciais e cobertura guardados por estado dos filtros
+    grids, coverage = spatial_data(df1, filters)
+
+    col1, col2, col3, col4 = st.columns(4)
+    lat = col1.number_input('Latitude', -90.0, 90.0, REFERENCE_POINT[0], format='%.6f')
+    lon = col2.number_input('Longitude', -180.0, 180.0, REFERENCE_POINT[1], format='%.6f')
+    radius = col3.slider('Raio (km)', 1, 200, 50)
+    k = col4.number_input('Restaurantes mais próximos', 1, 50, 5)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        positions, dist = radius_query(grids['delivery'], lat, lon, radius)
+        st.metric(f'Entregas a até {radius} km do ponto', len(positions))
+
+        st.markdown('##### Restaurantes mais próximos do ponto')
+        positions, dist = nearest_query(grids['restaurant'], lat, lon, k)
+        df_aux = grids['restaurants'].iloc[positions]
+        df_aux['distancia_km'] = dist.round(2)
+        st.dataframe(df_aux.reset_index(drop=True))
+
+    with col2:
+        st.markdown('##### Cobertura de entregadores por célula')
+        st.dataframe(coverage)
+
+
+render_tabs({'Visão Gerencial': visao_gerencial,
+             'Visão Tática': visao_tatica,
+             'Visão Geográfica': visao_geografica},
+            lazy=lazy_tabs)
+
+render_profile()
@@ -3,94 +3,99 @@ from PIL import Image
 import pandas as pd
 import plotly.express as px
 import streamlit as st
+from utils.aggregate import aggregate
+from utils.cache import memoize
+from utils.data import dataset_version, pin_dataset
+from utils.layout import render_dataset_version, render_profile, render_tabs
+from utils.profiling import profiled, start_trace
+from utils.ranking import RANKING_METRICS, top_couriers
+from utils.refresh import start_refresher
+from utils.sqlstore import filtered_source
 
 st.set_page_config(page_title='Visão Entregadores',
                    page_icon='🚚', layout='wide')
 
 
-def clean_database(dataframe):
-    '''Esta função tem a responsabilidade de limpar o dataframe
-        Tipos de limpeza:
-        1 - Remoção dos dados NaN
-        2 - Mudança do tipo da coluna de dados
-        3 - Remoção dos espaços das variáveis de texto
-        4 - Formatação da coluna de datas
-        5 - Limpeza da coluna de tempo (remoção do texto da variável numérica)
+# Métricas da página (nome -> função, coluna, agrupamento), calculadas
+# juntas em uma única varredura
+COURIER_METRICS = {
+    'maior_idade': ('max', 'Delivery_person_Age', None),
+    'menor_idade': ('min', 'Delivery_person_Age', None),
+    'melhor_condicao': ('max', 'Vehicle_condition', None),
+    'pior_condicao': ('min', 'Vehicle_condition', None),
+    'rating_mean_by_courier': ('mean', 'Delivery_person_Ratings', 'Delivery_person_ID'),
+    'rating_mean_by_traffic': ('mean', 'Delivery_person_Ratings', 'Road_traffic_density'),
+    'rating_std_by_traffic': ('std', 'Delivery_person_Ratings', 'Road_traffic_density'),
+    'rating_mean_by_weather': ('mean', 'Delivery_person_Ratings', 'Weatherconditions'),
+    'rating_std_by_weather': ('std', 'Delivery_person_Ratings', 'Weatherconditions'),
+}
 
-        Input: Dataframe
-        Output: Dataframe
-    '''
-    # Removendo linhas com NaN da base de dados
-    linhas_selecionadas = dataframe['Delivery_person_Age'] != 'NaN '
-    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
 
-    linhas_selecionadas = dataframe['multiple_deliveries'] != 'NaN '
-    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
+@profiled
+def avg_ratings_per_deliver(metrics):
+    df_aux = metrics['rating_mean_by_courier'].reset_index()
 
-    linhas_selecionadas = dataframe['Road_traffic_density'] != 'NaN '
-    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
+    return df_aux
 
-    linhas_selecionadas = dataframe['City'] != 'NaN '
-    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
 
-    linhas_selecionadas = dataframe['Festival'] != 'NaN '
-    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
+@profiled
+def avg_std_rating(metrics, by):
+    df_aux = pd.DataFrame({'delirery_mean': metrics[f'rating_mean_by_{by}'],
+                           'delirery_std': metrics[f'rating_std_by_{by}']})
 
-    # Remover o texto de numeros --> '(min) 24'
-    dataframe['Time_taken(min)'] = dataframe['Time_taken(min)'].apply(
-        lambda x: x.split('(min) ')[1])
+    return df_aux
 
-    # Converter os tipos das colunas
-    dataframe['Delivery_person_Age'] = dataframe['Delivery_person_Age'].astype(
-        int)
 
-    dataframe['multiple_deliveries'] = dataframe['multiple_deliveries'].astype(
-        int)
+# Import dataset (somente as colunas usadas nesta página)
+COLUMNS = ['Delivery_person_ID', 'Delivery_person_Age', 'Delivery_person_Ratings',
+           'Vehicle_condition', 'Weatherconditions', 'Order_Date', 'City',
+           'Road_traffic_density', 'Time_taken(min)']
 
-    dataframe['Delivery_person_Ratings'] = dataframe['Delivery_person_Ratings'].astype(
-        float)
 
-    dataframe['Time_taken(min)'] = dataframe['Time_taken(min)'].astype(int)
+# ===============================================================================
+# Dados das abas (guardados por estado dos filtros)
+# ===============================================================================
 
-    # Precisa usar a biblioteca pandas quando se trata de converter em data
-    dataframe['Order_Date'] = pd.to_datetime(
-        dataframe['Order_Date'], format='%d-%m-%Y')
+def page_sources(date_start, date_slider, traffic_options):
+    '''Fontes da página para um estado dos filtros da barra lateral: pedidos
+        filtrados (Dataframe compartilhado entre as sessões ou consulta no
+        banco) e chave do cache de gráficos.
 
-    # Resetar o index
-    dataframe = dataframe.reset_index(drop=True)
+        Input: data inicial, data limite e condições de trânsito
+        Output: (pedidos, filtros)
+    '''
+    df1 = filtered_source(COLUMNS, date_slider, traffic_options, date_start)
 
-    # Remover os espaços em branco dentro das strings de ID
-    dataframe.loc[:, 'ID'] = dataframe.loc[:, 'ID'].str.strip()
-    dataframe.loc[:, 'Road_traffic_density'] = dataframe.loc[:,
-                                                             'Road_traffic_density'].str.strip()
-    dataframe.loc[:, 'Type_of_order'] = dataframe.loc[:,
-                                                      'Type_of_order'].str.strip()
-    dataframe.loc[:, 'Type_of_vehicle'] = dataframe.loc[:,
-                                                        'Type_of_vehicle'].str.strip()
-    dataframe.loc[:, 'City'] = dataframe.loc[:, 'City'].str.strip()
-    dataframe.loc[:, 'Festival'] = dataframe.loc[:, 'Festival'].str.strip()
+    # Chave do cache de gráficos: versão do dataset + filtros da barra lateral
+    filters = (dataset_version(), date_start, date_slider,
+               tuple(sorted(traffic_options)))
 
-    return dataframe
+    return df1, filters
 
 
-def top_delivers(df, top_asc):
-    df = df.loc[:, ['Delivery_person_ID', 'City', 'Time_taken(min)']].groupby(
-        ['City', 'Delivery_person_ID']).max().sort_values(['City', 'Time_taken(min)'], ascending=top_asc).reset_index()
+def courier_metrics(df1, filters):
+    # Todas as métricas da aba em uma passada
+    return memoize('courier_metrics', filters, aggregate, df1, COURIER_METRICS)
 
-    df_aux1 = df.loc[df['City'] == 'Metropolitian', :].head(10)
-    df_aux2 = df.loc[df['City'] == 'Urban', :].head(10)
-    df_aux3 = df.loc[df['City'] == 'Semi-Urban', :].head(10)
 
-    df = pd.concat([df_aux1, df_aux2, df_aux3]).reset_index()
+def courier_ranking(df1, filters, metric):
+    # Mais rápidos e mais lentos de cada cidade calculados juntos
+    return memoize(f'top_couriers_{RANKING_METRICS[metric]}', filters,
+                   top_couriers, df1, k=10, metric=RANKING_METRICS[metric])
 
-    return df
 
+def precompute_page(date_start, date_slider, traffic_options):
+    '''Calcula todos os gráficos e tabelas da página para um estado dos
+        filtros, com cada opção dos widgets das abas, sem executar o layout
+        (ver utils.precompute).
 
-# Import dataset
-df = pd.read_csv('./dataset/train.csv')
+        Input: data inicial, data limite e condições de trânsito
+    '''
+    df1, filters = page_sources(date_start, date_slider, traffic_options)
 
-# Limpando os dados
-df1 = clean_database(df)
+    courier_metrics(df1, filters)
+    for metric in RANKING_METRICS:
+        courier_ranking(df1, filters, metric)
 
 # ===============================================================================
 # Barra lateral - Streamlit
@@ -107,10 +112,10 @@ st.sidebar.markdown('## Fastest Delivery in Town')
 st.sidebar.markdown('''---''')
 
 
-st.sidebar.markdown('## Selecione uma data limite')
-date_slider = st.sidebar.slider(
-    'Até qual valor?',
-    value=datetime(2022, 4, 13),
+st.sidebar.markdown('## Selecione o período')
+date_start, date_slider = st.sidebar.slider(
+    'De qual data até qual valor?',
+    value=(datetime(2022, 2, 11), datetime(2022, 4, 13)),
     min_value=datetime(2022, 2, 11),
     max_value=datetime(2022, 4, 6),
     format='DD-MM-YYYY'
@@ -124,27 +129,40 @@ traffic_options = st.sidebar.multiselect(
     default=['Low', 'Medium', 'High', 'Jam']
 )
 
+st.sidebar.markdown('''---''')
+
+# Somente a aba selecionada é calculada (desligado: todas as abas, como no st.tabs)
+lazy_tabs = st.sidebar.checkbox('Calcular somente a aba selecionada', value=True)
+
+# Painel de depuração: tempo, linhas e alocações de cada etapa do rerun
+debug = st.sidebar.checkbox('Painel de depuração', value=False)
+debug_memory = debug and st.sidebar.checkbox('Medir alocações (mais lento)', value=False)
+start_trace(debug, memory=debug_memory, name='02_visao_entregadores')
+
+# Versão do dataset fixada para todo o rerun; as versões novas são abertas
+# em segundo plano e trocadas atomicamente (ver utils.refresh)
+start_refresher()
+version = pin_dataset()
+
+# Versão do dataset usada neste rerun
+render_dataset_version(version)
+
 st.sidebar.markdown('''---''')
 st.sidebar.markdown('### Powered by Robson ❤️')
 
 # =========================
 # Filtros
 # =========================
-# Filtro de data
-linhas_selecionadas = df1['Order_Date'] < date_slider
-df1 = df1.loc[linhas_selecionadas, :]
-
-# Filtro de tânsito
-linhas_selecionadas = df1['Road_traffic_density'].isin(traffic_options)
-df1 = df1.loc[linhas_selecionadas, :]
+# Filtro de período e de trânsito
+df1, filters = page_sources(date_start, date_slider, traffic_options)
 
 # ===============================================================================
 # layout - Streamlit
 # ===============================================================================
 
-tab1, tab2, tab3 = st.tabs(['Visão Gerencial', '_', '_'])
+def visao_gerencial():
+    metrics = courier_metrics(df1, filters)
 
-with tab1:
     with st.container():
         st.title('Overall Metrics')
         col1, col2, col3, col4 = st.columns(4, gap='large')
@@ -152,26 +170,22 @@ with tab1:
         with col1:
             # st.subheader('Maior idade')
             # Maior idade dos entregadores
-            maior_idade = df1.loc[:, 'Delivery_person_Age'].max()
-            col1.metric(' Maior Idade', maior_idade)
+            col1.metric(' Maior Idade', metrics['maior_idade'])
 
         with col2:
             # st.subheader('Menor idade')
             # Menor idade dos entregadores
-            menor_idade = df1.loc[:, 'Delivery_person_Age'].min()
-            col2.metric(' Menor idade', menor_idade)
+            col2.metric(' Menor idade', metrics['menor_idade'])
 
         with col3:
             # st.subheader('Melhor condição de veículos')
             # condições dos veiculos
-            melhor_condicao = df1.loc[:, 'Vehicle_condition'].max()
-            col3.metric('Melhor condição de veículo', melhor_condicao)
+            col3.metric('Melhor condição de veículo', metrics['melhor_condicao'])
 
         with col4:
             # st.subheader('Pior condição de veículos')
             # condições dos veiculos
-            pior_condicao = df1.loc[:, 'Vehicle_condition'].min()
-            col4.metric('Pior condição de veículo', pior_condicao)
+            col4.metric('Pior condição de veículo', metrics['pior_condicao'])
 
     with st.container():
         st.markdown('''---''')
@@ -181,44 +195,33 @@ with tab1:
 
         with col1:
             st.markdown('##### Avalicao medias por Entregador')
-            df_avg_ratings_per_deliver = (df1.loc[:, ['Delivery_person_Ratings', 'Delivery_person_ID']]
-                                          .groupby('Delivery_person_ID')
-                                          .mean()
-                                          .reset_index())
-            st.dataframe(df_avg_ratings_per_deliver)
+            st.dataframe(avg_ratings_per_deliver(metrics))
 
         with col2:
             st.markdown(' ##### Avalisção média por transito')
-            df_avg_std_rating_by_traffic = (df1.loc[:, ['Delivery_person_Ratings', 'Road_traffic_density']].groupby(
-                'Road_traffic_density').agg({'Delivery_person_Ratings': ['mean', 'std']}))
-
-            df_avg_std_rating_by_traffic.columns = [
-                'delirery_mean', 'delirery_std']
-
-            df_avg_std_rating_by_traffic.reset_index()
-            st.dataframe(df_avg_std_rating_by_traffic)
+            st.dataframe(avg_std_rating(metrics, 'traffic'))
 
             st.markdown(' ##### Avalisção média por clima')
-            df_avg_std_rating_by_wather = df1.loc[:, ['Delivery_person_Ratings', 'Weatherconditions']].groupby(
-                'Weatherconditions').agg({'Delivery_person_Ratings': ['mean', 'std']})
-
-            df_avg_std_rating_by_wather.columns = [
-                'delirery_mean', 'delirery_std']
-
-            df_avg_std_rating_by_wather.reset_index()
-            st.dataframe(df_avg_std_rating_by_wather)
+            st.dataframe(avg_std_rating(metrics, 'weather'))
 
     with st.container():
         st.markdown('''---''')
         st.title('Velocidade de Entrega')
 
+        metric = st.selectbox('Métrica do tempo de entrega', list(RANKING_METRICS))
+        df_fastest, df_slowest = courier_ranking(df1, filters, metric)
+
         col1, col2 = st.columns(2)
         with col1:
             st.subheader('Top entregadores mais rápidos')
-            df2 = top_delivers(df1, top_asc=True)
-            st.dataframe(df2)
+            st.dataframe(df_fastest)
 
         with col2:
             st.subheader('Top entregadores mais lentos')
-            df2 = top_delivers(df1, top_asc=False)
-            st.dataframe(df2)
+            st.dataframe(df_slowest)
+
+
+# As abas '_' não tinham conteúdo e foram removidas
+render_tabs({'Visão Gerencial': visao_gerencial}, lazy=lazy_tabs)
+
+render_profile()
@@ -1,11 +1,20 @@
 from datetime import datetime
-from haversine import haversine
 from PIL import Image
 import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import streamlit as st
+from utils.aggregate import aggregate
+from utils.cache import memoize
+from utils.data import dataset_version, load_rollup, pin_dataset
+from utils.layout import render_dataset_version, render_profile, render_tabs
+from utils.profiling import profiled, start_trace
+from utils.refresh import start_refresher
+from utils.rollup import count_couriers, filter_rollup
+from utils.sketch import (DISTANCE_EDGES, HLL_ERROR, TIME_EDGES, hist_exceed, hist_merge,
+                          hist_quantiles)
+from utils.sqlstore import filtered_source
 
 st.set_page_config(page_title='Visão Restaurante',
                    page_icon='🍽️', layout='wide')
@@ -15,174 +24,211 @@ st.set_page_config(page_title='Visão Restaurante',
 # =======================================================================
 
 
-def clean_database(dataframe):
-    '''Esta função tem a responsabilidade de limpar o dataframe
-        Tipos de limpeza:
-        1 - Remoção dos dados NaN
-        2 - Mudança do tipo da coluna de dados
-        3 - Remoção dos espaços das variáveis de texto
-        4 - Formatação da coluna de datas
-        5 - Limpeza da coluna de tempo (remoção do texto da variável numérica)
+@profiled
+def distance(df):
+    # Distância média por cidade (distance_km já vem calculada na ingestão)
+    metrics = aggregate(df, {'distance_km': ('mean', 'distance_km', 'City')})
+    avg_distance = metrics['distance_km'].reset_index()
 
-        Input: Dataframe
-        Output: Dataframe
-    '''
-    # Removendo linhas com NaN da base de dados
-    linhas_selecionadas = dataframe['Delivery_person_Age'] != 'NaN '
-    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
+    # Avg_distance
+    fig = go.Figure(data=[go.Pie(labels=avg_distance['City'],
+                    values=avg_distance['distance_km'], pull=[0, 0.1, 0])])
+    return fig
 
-    linhas_selecionadas = dataframe['multiple_deliveries'] != 'NaN '
-    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
 
-    linhas_selecionadas = dataframe['Road_traffic_density'] != 'NaN '
-    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
+# Métricas do cabeçalho (nome -> função, coluna, agrupamento)
+FESTIVAL_METRICS = {
+    'delivery_unique': ('nunique', 'Delivery_person_ID', None),
+    'avg_distance': ('mean', 'distance_km', None),
+    'avg_time': ('mean', 'Time_taken(min)', 'Festival'),
+    'std_time': ('std', 'Time_taken(min)', 'Festival'),
+}
 
-    linhas_selecionadas = dataframe['City'] != 'NaN '
-    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
 
-    linhas_selecionadas = dataframe['Festival'] != 'NaN '
-    dataframe = dataframe.loc[linhas_selecionadas, :].copy()
+@profiled
+def festival_stats(df):
+    """ Está função calcula, em uma única passada, os indicadores do cabeçalho:
+        entregadores únicos, distância média e o tempo médio e o desvio padrão
+        do tempo de entrega com e sem festival.
+        Prâmentros:
+            Input:
+                - df: DataFrame com os dados necesários para o calculo
+            Output:
+                - dict: 'delivery_unique', 'avg_distance' e, para cada valor
+                  de Festival ('Yes'/'No'), 'avg_time' e 'std_time'
+                """
+    metrics = aggregate(df, FESTIVAL_METRICS)
 
-    # Remover o texto de numeros --> '(min) 24'
-    dataframe['Time_taken(min)'] = dataframe['Time_taken(min)'].apply(
-        lambda x: x.split('(min) ')[1])
+    stats = {'delivery_unique': int(metrics['delivery_unique']),
+             'avg_distance': np.round(metrics['avg_distance'], 2)}
+    for festival in ('Yes', 'No'):
+        for op in ('avg_time', 'std_time'):
+            stats[festival, op] = np.round(metrics[op].get(festival, np.nan), 2)
 
-    # Converter os tipos das colunas
-    dataframe['Delivery_person_Age'] = dataframe['Delivery_person_Age'].astype(
-        int)
+    return stats
 
-    dataframe['multiple_deliveries'] = dataframe['multiple_deliveries'].astype(
-        int)
 
-    dataframe['Delivery_person_Ratings'] = dataframe['Delivery_person_Ratings'].astype(
-        float)
+def time_stats(df, by):
+    # Média e desvio do tempo de entrega por agrupamento, em uma passada
+    # (no backend SQL, uma consulta agrupada)
+    metrics = aggregate(df, {'avg_time': ('mean', 'Time_taken(min)', by),
+                             'std_time': ('std', 'Time_taken(min)', by)})
 
-    dataframe['Time_taken(min)'] = dataframe['Time_taken(min)'].astype(int)
+    return pd.DataFrame(metrics).reset_index()
 
-    # Precisa usar a biblioteca pandas quando se trata de converter em data
-    dataframe['Order_Date'] = pd.to_datetime(
-        dataframe['Order_Date'], format='%d-%m-%Y')
 
-    # Resetar o index
-    dataframe = dataframe.reset_index(drop=True)
+@profiled
+def avg_std_time_graph(df):
+    df_aux = time_stats(df, 'City')
+    fig = go.Figure()
+    fig.add_trace(go.Bar(name='Control',
+                         x=df_aux['City'],
+                         y=df_aux['avg_time'],
+                         error_y=dict(type='data', array=df_aux['std_time'])))
+    fig.update_layout(barmode='group')
 
-    # Remover os espaços em branco dentro das strings de ID
-    dataframe.loc[:, 'ID'] = dataframe.loc[:, 'ID'].str.strip()
-    dataframe.loc[:, 'Road_traffic_density'] = dataframe.loc[:,
-                                                             'Road_traffic_density'].str.strip()
-    dataframe.loc[:, 'Type_of_order'] = dataframe.loc[:,
-                                                      'Type_of_order'].str.strip()
-    dataframe.loc[:, 'Type_of_vehicle'] = dataframe.loc[:,
-                                                        'Type_of_vehicle'].str.strip()
-    dataframe.loc[:, 'City'] = dataframe.loc[:, 'City'].str.strip()
-    dataframe.loc[:, 'Festival'] = dataframe.loc[:, 'Festival'].str.strip()
+    return fig
 
-    return dataframe
 
+@profiled
+def avg_std_time_on_order(df):
+    df_aux = time_stats(df, ('City', 'Type_of_order'))
 
-def top_delivers(df, top_asc):
-    df = df.loc[:, ['Delivery_person_ID', 'City', 'Time_taken(min)']].groupby(
-        ['City', 'Delivery_person_ID']).max().sort_values(['City', 'Time_taken(min)'], ascending=top_asc).reset_index()
+    return df_aux
 
-    df_aux1 = df.loc[df['City'] == 'Metropolitian', :].head(10)
-    df_aux2 = df.loc[df['City'] == 'Urban', :].head(10)
-    df_aux3 = df.loc[df['City'] == 'Semi-Urban', :].head(10)
 
-    df = pd.concat([df_aux1, df_aux2, df_aux3]).reset_index()
+@profiled
+def avg_std_time_on_traffic(df):
+    df_aux = time_stats(df, ('City', 'Road_traffic_density'))
 
-    return df
+    fig = px.sunburst(df_aux, path=['City', 'Road_traffic_density'], values='avg_time',
+                      color='std_time', color_continuous_scale='RdBu',
+                      color_continuous_midpoint=np.average(df_aux['std_time']))
+    return fig
 
+# Percentis exibidos para tempo de entrega e distância
+PERCENTILES = [0.5, 0.9, 0.99]
 
-def distance(df, fig):
-    if not fig:
-        cols = ['Restaurant_latitude', 'Restaurant_longitude',
-                'Delivery_location_latitude', 'Delivery_location_longitude']
 
-        df['distance_km'] = df.loc[:, cols].apply(lambda x: haversine(
-            (x['Restaurant_latitude'], x['Restaurant_longitude']), (x['Delivery_location_latitude'], x['Delivery_location_longitude'])), axis=1)
+@profiled
+def percentile_time_graph(cube):
+    # Percentis por cidade somando os histogramas das células do cubo, sem
+    # ordenar os pedidos (minutos inteiros: percentis exatos)
+    rows = []
+    for city, cells in cube.groupby('City', observed=True):
+        counts = hist_merge(cells['time_hist'], TIME_EDGES)
+        values = hist_quantiles(counts, TIME_EDGES, PERCENTILES, interpolate=False)
+        rows += [{'City': city, 'percentil': f'p{round(q * 100)}', 'time': value}
+                 for q, value in zip(PERCENTILES, values)]
 
-        avg_distance = np.round(df['distance_km'].mean(), 2)
+    df_aux = pd.DataFrame(rows, columns=['City', 'percentil', 'time'])
+    fig = px.bar(df_aux, x='City', y='time', color='percentil', barmode='group')
 
-        return avg_distance
+    return fig
 
-    else:
-        cols = ['Restaurant_latitude', 'Restaurant_longitude',
-                'Delivery_location_latitude', 'Delivery_location_longitude']
 
-        df['distance'] = df.loc[:, cols].apply(lambda x: haversine(
-            (x['Restaurant_latitude'], x['Restaurant_longitude']), (x['Delivery_location_latitude'], x['Delivery_location_longitude'])), axis=1)
+@profiled
+def distance_percentiles(cube):
+    rows = {}
+    for city, cells in cube.groupby('City', observed=True):
+        counts = hist_merge(cells['distance_hist'], DISTANCE_EDGES)
+        rows[city] = np.round(hist_quantiles(counts, DISTANCE_EDGES, PERCENTILES), 2)
 
-        avg_distance = df.loc[:, ['City', 'distance']
-                              ].groupby('City').mean().reset_index()
+    df_aux = pd.DataFrame.from_dict(rows, orient='index',
+                                    columns=[f'p{round(q * 100)}_km' for q in PERCENTILES])
 
-        # Avg_distance
-        fig = go.Figure(data=[go.Pie(labels=avg_distance['City'],
-                        values=avg_distance['distance'], pull=[0, 0.1, 0])])
-        return fig
+    return df_aux
 
 
-def avd_std_delivery(df, festival, op):
-    """ Está função calcula o tempo médio e o desvio padrão do tempo de entrega.
-        Prâmentros:
-            Input:
-                - df: DataFrame com os dados necesários para o calculo
-                - op: Tipo de operação que precisa ser calculado
-                 'avg_time': Calcula o tempo médio
-                 'std_time': Calcula o desvio padrão do tempo
-            Output:
-                - df: DaraFrame com 2 colunas e 1 linha
-                """
-    df_aux = df.loc[:, ['Festival', 'Time_taken(min)']].groupby(
-        ['Festival']).agg({'Time_taken(min)': ['mean', 'std']})
-
-    df_aux.columns = ['avg_time', 'std_time']
+@profiled
+def sla_breach(cube, sla):
+    # Fração das entregas acima do SLA, no total e por cidade
+    rows = {'Todas': hist_exceed(hist_merge(cube['time_hist'], TIME_EDGES), TIME_EDGES, sla)}
+    for city, cells in cube.groupby('City', observed=True):
+        rows[city] = hist_exceed(hist_merge(cells['time_hist'], TIME_EDGES), TIME_EDGES, sla)
 
-    df_aux = df_aux.reset_index()
-    df_aux = np.round(
-        df_aux.loc[df_aux['Festival'] == festival, 'avg_time'], 2)
+    df_aux = pd.Series(rows, name='fora_do_sla').to_frame()
 
     return df_aux
 
 
-def avg_std_time_graph(df):
-    df_aux = df.loc[:, ['City', 'Time_taken(min)']].groupby(
-        'City').agg({'Time_taken(min)': ['mean', 'std']})
-    df_aux.columns = ['avg_time', 'std_time']
-    df_aux = df_aux.reset_index()
-    fig = go.Figure()
-    fig.add_trace(go.Bar(name='Control',
-                         x=df_aux['City'],
-                         y=df_aux['avg_time'],
-                         error_y=dict(type='data', array=df_aux['std_time'])))
-    fig.update_layout(barmode='group')
+# ============================================================================
+# Import datasett
+# ===============================================================================
 
-    return fig
 
+# Import dataset (somente as colunas usadas nesta página)
+COLUMNS = ['Delivery_person_ID', 'Order_Date', 'City', 'Road_traffic_density',
+           'Festival', 'Type_of_order', 'Time_taken(min)', 'distance_km']
 
-def avg_std_time_on_traffic(df):
-    df_aux = df.loc[:, ['City', 'Road_traffic_density', 'Time_taken(min)']].groupby(
-        ['City', 'Road_traffic_density']).agg({'Time_taken(min)': ['mean', 'std']})
+# SLA de entrega (min): mínimo, máximo e valor inicial do slider
+SLA_RANGE = (10, 60, 30)
 
-    df_aux.columns = ['avg_time', 'std_time']
 
-    df_aux = df_aux.reset_index()
-    df_aux.head()
+# ===============================================================================
+# Dados das abas (guardados por estado dos filtros)
+# ===============================================================================
 
-    fig = px.sunburst(df_aux, path=['City', 'Road_traffic_density'], values='avg_time',
-                      color='std_time', color_continuous_scale='RdBu',
-                      color_continuous_midpoint=np.average(df_aux['std_time']))
-    return fig
+def page_sources(date_start, date_slider, traffic_options):
+    '''Fontes da página para um estado dos filtros da barra lateral: pedidos
+        filtrados (Dataframe compartilhado entre as sessões ou consulta no
+        banco), fatia do cubo diário e chave do cache de gráficos.
+
+        Input: data inicial, data limite e condições de trânsito
+        Output: (pedidos, cubo, filtros)
+    '''
+    df1 = filtered_source(COLUMNS, date_slider, traffic_options, date_start)
+    cube = filter_rollup(load_rollup(), date_slider, traffic_options, date_start)
+
+    # Chave do cache de gráficos: versão do dataset + filtros da barra lateral
+    filters = (dataset_version(), date_start, date_slider,
+               tuple(sorted(traffic_options)))
+
+    return df1, cube, filters
+
+
+def header_stats(df1, cube, filters, exact):
+    # Os seis indicadores saem de uma única passada; entregadores únicos
+    # exatos (da mesma passada) ou estimados pelos sketches do cubo
+    stats = memoize('festival_stats', filters, festival_stats, df1)
+    if exact:
+        return stats, stats['delivery_unique']
+
+    return stats, memoize('delivery_unique_hll', filters, count_couriers, cube)
+
+
+def time_charts(df1, filters):
+    # Tempo por cidade, por tipo de pedido e por trânsito e distância por cidade
+    return (memoize('avg_std_time_graph', filters, avg_std_time_graph, df1),
+            memoize('avg_std_time_on_order', filters, avg_std_time_on_order, df1),
+            memoize('distance_graph', filters, distance, df1),
+            memoize('avg_std_time_on_traffic', filters, avg_std_time_on_traffic, df1))
 
-# ============================================================================
-# Import datasett
-# ===============================================================================
 
+def percentile_charts(cube, filters):
+    # Percentis do tempo e da distância a partir dos histogramas do cubo
+    return (memoize('percentile_time_graph', filters, percentile_time_graph, cube),
+            memoize('distance_percentiles', filters, distance_percentiles, cube))
 
-# Import dataset
-df = pd.read_csv('./dataset/train.csv')
 
-# Limpando os dados
-df1 = clean_database(df)
+def sla_table(cube, filters, sla):
+    # Fração das entregas acima do SLA, guardada por filtros e SLA
+    return memoize(f'sla_breach_{sla}', filters, sla_breach, cube, sla)
+
+
+def precompute_page(date_start, date_slider, traffic_options):
+    '''Calcula todos os gráficos e tabelas da página para um estado dos
+        filtros, com o valor inicial dos widgets das abas, sem executar o
+        layout (ver utils.precompute).
+
+        Input: data inicial, data limite e condições de trânsito
+    '''
+    df1, cube, filters = page_sources(date_start, date_slider, traffic_options)
+
+    header_stats(df1, cube, filters, exact=False)
+    time_charts(df1, filters)
+    percentile_charts(cube, filters)
+    sla_table(cube, filters, SLA_RANGE[2])
 
 # ===============================================================================
 # Barra lateral - Streamlit
@@ -199,10 +245,10 @@ st.sidebar.markdown('## Fastest Delivery in Town')
 st.sidebar.markdown('''---''')
 
 
-st.sidebar.markdown('## Selecione uma data limite')
-date_slider = st.sidebar.slider(
-    'Até qual valor?',
-    value=datetime(2022, 4, 13),
+st.sidebar.markdown('## Selecione o período')
+date_start, date_slider = st.sidebar.slider(
+    'De qual data até qual valor?',
+    value=(datetime(2022, 2, 11), datetime(2022, 4, 13)),
     min_value=datetime(2022, 2, 11),
     max_value=datetime(2022, 4, 6),
     format='DD-MM-YYYY'
@@ -216,54 +262,69 @@ traffic_options = st.sidebar.multiselect(
     default=['Low', 'Medium', 'High', 'Jam']
 )
 
+st.sidebar.markdown('''---''')
+
+# Entregadores únicos exatos ou aproximados (sketches do cubo diário)
+exact_counts = st.sidebar.checkbox('Contagem exata de entregadores únicos', value=False)
+
+# Somente a aba selecionada é calculada (desligado: todas as abas, como no st.tabs)
+lazy_tabs = st.sidebar.checkbox('Calcular somente a aba selecionada', value=True)
+
+# Painel de depuração: tempo, linhas e alocações de cada etapa do rerun
+debug = st.sidebar.checkbox('Painel de depuração', value=False)
+debug_memory = debug and st.sidebar.checkbox('Medir alocações (mais lento)', value=False)
+start_trace(debug, memory=debug_memory, name='03_visao_restaurante')
+
+# Versão do dataset fixada para todo o rerun; as versões novas são abertas
+# em segundo plano e trocadas atomicamente (ver utils.refresh)
+start_refresher()
+version = pin_dataset()
+
+# Versão do dataset usada neste rerun
+render_dataset_version(version)
+
 st.sidebar.markdown('''---''')
 st.sidebar.markdown('### Powered by Robson ❤️')
 
 # =========================
 # Filtros
 # =========================
-# Filtro de data
-linhas_selecionadas = df1['Order_Date'] < date_slider
-df1 = df1.loc[linhas_selecionadas, :]
-
-# Filtro de tânsito
-linhas_selecionadas = df1['Road_traffic_density'].isin(traffic_options)
-df1 = df1.loc[linhas_selecionadas, :]
+# Filtro de período e de trânsito aplicado aos pedidos e ao cubo diário
+df1, cube, filters = page_sources(date_start, date_slider, traffic_options)
 
 # ===============================================================================
 # layout - Streamlit
 # ===============================================================================
 
-tab1, tab2, tab3 = st.tabs(['Visão Gerencial', '_', '_'])
-
-with tab1:
+def visao_gerencial():
     with st.container():
         st.title('Overal Metrics')
         col1, col2, col3, col4, col5, col6 = st.columns(6)
+        stats, delivery_unique = header_stats(df1, cube, filters, exact_counts)
+
         with col1:
-            delivery_unique = df1.loc[:, ['Delivery_person_ID', 'ID']].groupby(
-                'Delivery_person_ID').nunique().count()
-            st.metric('Entregadores únicos', delivery_unique)
+            if exact_counts:
+                st.metric('Entregadores únicos', delivery_unique)
+            else:
+                st.metric('Entregadores únicos', delivery_unique,
+                          help=f'Estimativa HyperLogLog, erro padrão ~{HLL_ERROR:.1%}')
 
         with col2:
-            avg_distance = distance(df1, fig=False)
-            st.metric('A distancia média', avg_distance)
+            st.metric('A distancia média', stats['avg_distance'])
 
         with col3:
-            df_aux = avd_std_delivery(df1, 'Yes', 'avg_time')
-            col3.metric('Tempo médio', df_aux)
+            col3.metric('Tempo médio', stats['Yes', 'avg_time'])
 
         with col4:
-            df_aux = avd_std_delivery(df1, 'Yes', 'std_time')
-            col4.metric('STD entrega', df_aux)
+            col4.metric('STD entrega', stats['Yes', 'std_time'])
 
         with col5:
-            df_aux = avd_std_delivery(df1, 'No', 'avg_time')
-            col5.metric('Tempo médio', df_aux)
+            col5.metric('Tempo médio', stats['No', 'avg_time'])
 
         with col6:
-            df_aux = avd_std_delivery(df1, 'No', 'std_time')
-            col6.metric('STD entrega', df_aux)
+            col6.metric('STD entrega', stats['No', 'std_time'])
+
+    fig_city, df_order, fig_distance, fig_traffic = time_charts(df1, filters)
 
     with st.container():
         st.markdown('''---''')
@@ -272,18 +333,11 @@ with tab1:
 
         with col1:
             st.title('Tempo médio de entrega por cidade')
-            fig = avg_std_time_graph(df1)
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(fig_city, use_container_width=True)
 
         with col2:
             st.title('Distribuição da distância')
-            df_aux = df1.loc[:, ['City', 'Type_of_order', 'Time_taken(min)']].groupby(
-                ['City', 'Type_of_order']).agg({'Time_taken(min)': ['mean', 'std']})
-
-            df_aux.columns = ['avg_time', 'std_time']
-
-            df_aux = df_aux.reset_index()
-            st.dataframe(df_aux)
+            st.dataframe(df_order)
 
     with st.container():
         st.title('Distribuição do tempo')
@@ -291,9 +345,32 @@ with tab1:
         col1, col2 = st.columns(2)
 
         with col1:
-            fig = distance(df1, fig=True)
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(fig_distance, use_container_width=True)
 
         with col2:
-            fig = avg_std_time_on_traffic(df1)
+            st.plotly_chart(fig_traffic, use_container_width=True)
+
+    with st.container():
+        st.markdown('''---''')
+        st.title('Percentis e SLA')
+
+        col1, col2 = st.columns(2)
+        with col1:
+            fig, df_aux = percentile_charts(cube, filters)
+            st.markdown('##### Percentis do tempo de entrega por cidade')
             st.plotly_chart(fig, use_container_width=True)
+
+            st.markdown('##### Percentis da distância por cidade')
+            st.dataframe(df_aux)
+
+        with col2:
+            sla = st.slider('SLA de entrega (min)', *SLA_RANGE)
+            df_aux = sla_table(cube, filters, sla)
+            st.metric('Entregas fora do SLA', f"{df_aux.loc['Todas', 'fora_do_sla']:.1%}")
+            st.dataframe(df_aux)
+
+
+# As abas '_' não tinham conteúdo e foram removidas
+render_tabs({'Visão Gerencial': visao_gerencial}, lazy=lazy_tabs)
+
+render_profile()
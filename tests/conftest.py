@@ -0,0 +1,15 @@
+import pytest
+
+from benchmarks.synthetic import write_orders
+from utils.data import build_store
+
+
+@pytest.fixture(scope='session')
+def dataset_path(tmp_path_factory):
+    # CSV sintético pequeno (mesmo formato sujo do train.csv) com o arquivo
+    # colunar já gravado
+    path = str(tmp_path_factory.mktemp('dataset') / 'train.csv')
+    write_orders(path, 6000, seed=7)
+    build_store(path)
+
+    return path
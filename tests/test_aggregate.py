@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.aggregate import aggregate
+
+FUNCS = ['count', 'sum', 'mean', 'std', 'min', 'max', 'nunique']
+
+BY = [None, 'City', 'Type_of_order', ('City', 'Type_of_order')]
+
+
+@pytest.fixture(scope='module')
+def orders():
+    # Pedidos com nulos nos valores e nas chaves, categoria sem pedidos,
+    # grupo só com nulos e grupo de uma linha (desvio indefinido)
+    rng = np.random.default_rng(4)
+    n = 2000
+
+    city = rng.choice(['Metropolitian', 'Urban', 'Semi-Urban'], n, p=[0.6, 0.39, 0.01]).astype(object)
+    city[rng.random(n) < 0.05] = np.nan
+    order_type = rng.choice(['Buffet', 'Drinks', 'Meal', 'Snack'], n).astype(object)
+    order_type[rng.random(n) < 0.05] = None
+
+    time = rng.integers(10, 55, n).astype('float64')
+    time[rng.random(n) < 0.1] = np.nan
+    # Média alta e variância pequena: expõe cancelamento numérico no desvio
+    rating = 1e6 + rng.normal(0, 0.01, n)
+    rating[rng.random(n) < 0.1] = np.nan
+    age = rng.integers(18, 50, n)
+    courier = pd.Series(rng.choice([f'COURIER{i:03d}' for i in range(300)], n), dtype='string')
+    courier[rng.random(n) < 0.05] = pd.NA
+
+    df = pd.DataFrame({
+        'City': pd.Categorical(city, categories=['Metropolitian', 'Rural', 'Semi-Urban', 'Urban']),
+        'Type_of_order': order_type,
+        'Time_taken(min)': time,
+        'Delivery_person_Ratings': rating,
+        'Delivery_person_Age': age,
+        'Delivery_person_ID': courier,
+    })
+
+    # Grupo só com nulos e grupo de uma única linha
+    semi_urban = df['City'] == 'Semi-Urban'
+    df.loc[semi_urban, 'Time_taken(min)'] = np.nan
+    df.loc[semi_urban, 'Delivery_person_Ratings'] = np.nan
+    df.loc[df.index[semi_urban][0], 'Delivery_person_Ratings'] = 1e6
+
+    return df
+
+
+def _plain(series):
+    # Índice como texto: categorias e rótulos comuns se comparam iguais
+    index = [tuple(map(str, key)) if isinstance(key, tuple) else str(key) for key in series.index]
+    return pd.Series(series.to_numpy(dtype='float64'), index=index)
+
+
+def _expected(df, func, column, by):
+    if by is None:
+        return df[column].agg(func)
+
+    keys = list(by) if isinstance(by, tuple) else by
+    return df.groupby(keys, observed=True)[column].agg(func)
+
+
+@pytest.mark.parametrize('by', BY)
+@pytest.mark.parametrize('column', ['Time_taken(min)', 'Delivery_person_Ratings',
+                                    'Delivery_person_Age'])
+@pytest.mark.parametrize('func', FUNCS)
+def test_matches_groupby(orders, func, column, by):
+    result = aggregate(orders, {'metric': (func, column, by)})['metric']
+    expected = _expected(orders, func, column, by)
+
+    if by is None:
+        np.testing.assert_allclose(result, expected, rtol=1e-9)
+    else:
+        pd.testing.assert_series_equal(_plain(result), _plain(expected), rtol=1e-9)
+
+
+@pytest.mark.parametrize('by', BY)
+def test_nunique_of_text(orders, by):
+    result = aggregate(orders, {'metric': ('nunique', 'Delivery_person_ID', by)})['metric']
+    expected = _expected(orders, 'nunique', 'Delivery_person_ID', by)
+
+    if by is None:
+        assert result == expected
+    else:
+        pd.testing.assert_series_equal(_plain(result), _plain(expected))
+
+
+def test_shared_accumulators(orders):
+    # Várias métricas da mesma coluna e agrupamento dão o mesmo que separadas
+    metrics = {func: (func, 'Delivery_person_Ratings', 'City') for func in FUNCS}
+    together = aggregate(orders, metrics)
+
+    for func in FUNCS:
+        alone = aggregate(orders, {func: metrics[func]})[func]
+        pd.testing.assert_series_equal(together[func], alone)
+
+
+def test_integer_extremes_stay_integer(orders):
+    result = aggregate(orders, {'min': ('min', 'Delivery_person_Age', None),
+                                'max': ('max', 'Delivery_person_Age', None)})
+
+    assert result['min'] == orders['Delivery_person_Age'].min()
+    assert isinstance(result['max'], np.integer)
+
+
+def test_empty_frame(orders):
+    empty = orders.iloc[:0]
+    result = aggregate(empty, {func: (func, 'Time_taken(min)', 'City') for func in FUNCS})
+
+    for func in FUNCS:
+        assert len(result[func]) == 0
+    assert np.isnan(aggregate(empty, {'mean': ('mean', 'Time_taken(min)', None)})['mean'])
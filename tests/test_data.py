@@ -0,0 +1,88 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import write_orders
+from utils import data
+from utils.data import (append_batch, load_dataset, load_filtered, pin_dataset,
+                        refresh_dataset, watch_dataset)
+
+TRAFFIC = ['Low', 'Medium', 'High', 'Jam']
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    return write_orders(str(tmp_path / 'train.csv'), 2000, seed=3)
+
+
+def test_opening_a_dataset_does_not_block_others(csv_path, dataset_path, monkeypatch):
+    # Enquanto um dataset é aberto (e reconstruído) os outros continuam sendo lidos
+    opening, release = threading.Event(), threading.Event()
+    open_dataset = data._open_dataset
+
+    def slow_open(path):
+        if path == csv_path:
+            opening.set()
+            release.wait(10)
+        return open_dataset(path)
+
+    monkeypatch.setattr(data, '_open_dataset', slow_open)
+
+    with ThreadPoolExecutor(2) as pool:
+        slow = pool.submit(load_dataset, ['City'], path=csv_path)
+        assert opening.wait(10)
+
+        other = pool.submit(load_filtered, ['City'], datetime(2022, 4, 13), TRAFFIC,
+                            path=dataset_path)
+        assert len(other.result(timeout=5)) > 0
+        assert not slow.done()
+
+        release.set()
+        assert len(slow.result(timeout=30)) > 0
+
+
+def test_concurrent_first_loads_open_once(csv_path, monkeypatch):
+    calls = []
+    open_dataset = data._open_dataset
+
+    def counted_open(path):
+        calls.append(path)
+        return open_dataset(path)
+
+    monkeypatch.setattr(data, '_open_dataset', counted_open)
+
+    def load(_):
+        return load_filtered(['City', 'Time_taken(min)'], datetime(2022, 3, 20),
+                             ['Jam', 'Low'], datetime(2022, 3, 1), path=csv_path)
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(load, range(16)))
+
+    assert calls == [csv_path]
+    for result in results[1:]:
+        pd.testing.assert_frame_equal(result, results[0])
+
+
+def test_refresh_swaps_the_published_version(csv_path, tmp_path):
+    watch_dataset(csv_path)
+    before = pin_dataset(csv_path)
+    rows = len(load_dataset(['ID'], path=csv_path))
+
+    # Lote com pedidos novos: a versão publicada só muda no refresh
+    batch = write_orders(str(tmp_path / 'batch.csv'), 200, seed=4)
+    frame = pd.read_csv(batch)
+    frame['ID'] = [f'0xbatch{number:x} ' for number in range(len(frame))]
+    frame.to_csv(batch, index=False)
+    appended = append_batch(batch, csv_path)
+
+    assert refresh_dataset(csv_path)
+    assert not refresh_dataset(csv_path)
+
+    # A sessão continua na versão fixada até fixar de novo
+    assert len(load_dataset(['ID'], path=csv_path)) == rows
+    after = pin_dataset(csv_path)
+    assert after['number'] == before['number'] + 1
+    assert len(load_dataset(['ID'], path=csv_path)) == rows + appended
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from utils.geo import build_grid_index, haversine_km, nearest_query, radius_query
+
+# Centros das consultas: Índia, perto do antimeridiano (dos dois lados), perto
+# dos polos e sobre o meridiano de Greenwich
+CENTERS = [(20.0, 79.0), (-16.5, 179.8), (65.0, -179.9), (10.0, 180.0),
+           (88.5, 30.0), (-89.0, -120.0), (0.0, 0.0)]
+
+
+@pytest.fixture(scope='module')
+def points():
+    # Pontos espalhados no globo e uma faixa densa em volta de ±180°
+    rng = np.random.default_rng(11)
+    lat = np.degrees(np.arcsin(rng.uniform(-1, 1, 4000)))
+    lon = rng.uniform(-180, 180, 4000)
+
+    band_lat = rng.uniform(-70, 70, 2000)
+    band_lon = rng.uniform(177, 183, 2000)
+    band_lon = np.where(band_lon > 180, band_lon - 360, band_lon)
+
+    return np.concatenate([lat, band_lat]), np.concatenate([lon, band_lon])
+
+
+@pytest.fixture(scope='module')
+def grid(points):
+    return build_grid_index(*points)
+
+
+def _brute_force(points, lat, lon):
+    dist = haversine_km(lat, lon, *points)
+    order = np.argsort(dist, kind='stable')
+    return order, dist[order]
+
+
+@pytest.mark.parametrize('center', CENTERS)
+@pytest.mark.parametrize('radius_km', [5, 80, 400, 2500, 21000])
+def test_radius_query_matches_brute_force(points, grid, center, radius_km):
+    positions, dist = radius_query(grid, *center, radius_km)
+    order, expected = _brute_force(points, *center)
+    inside = expected <= radius_km
+
+    assert set(positions) == set(order[inside])
+    np.testing.assert_allclose(dist, expected[inside])
+    assert np.all(np.diff(dist) >= 0)
+
+
+@pytest.mark.parametrize('center', CENTERS)
+@pytest.mark.parametrize('k', [1, 7, 50])
+def test_nearest_query_matches_brute_force(points, grid, center, k):
+    positions, dist = nearest_query(grid, *center, k)
+    order, expected = _brute_force(points, *center)
+
+    np.testing.assert_array_equal(positions, order[:k])
+    np.testing.assert_allclose(dist, expected[:k])
+
+
+def test_nearest_query_with_fewer_points_than_k():
+    grid = build_grid_index(np.array([10.0, -10.0]), np.array([179.9, -179.9]))
+    positions, dist = nearest_query(grid, 0.0, 180.0, 5)
+
+    assert sorted(positions) == [0, 1]
+    np.testing.assert_allclose(dist, haversine_km(0.0, 180.0, np.array([10.0, -10.0]),
+                                                  np.array([179.9, -179.9])))
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import write_orders
+from utils.data import append_batch, build_store, load_dataset
+from utils.rollup import ROLLUP_COLUMNS, ROLLUP_KEYS, build_rollup, merge_rollup
+from utils.store import read_rollup, rollup_path
+
+
+def _canonical(cube):
+    # Células em ordem fixa e chaves como texto (categorias podem diferir)
+    cube = cube.assign(**{key: cube[key].astype(str) for key in ROLLUP_KEYS})
+    return cube.sort_values(ROLLUP_KEYS).reset_index(drop=True)
+
+
+def _assert_same_cube(result, expected):
+    result, expected = _canonical(result), _canonical(expected)
+
+    pd.testing.assert_frame_equal(result.loc[:, ROLLUP_KEYS + ['orders', 'week_of_day']],
+                                  expected.loc[:, ROLLUP_KEYS + ['orders', 'week_of_day']],
+                                  check_dtype=False)
+    for column in ['couriers', 'hll', 'time_hist', 'distance_hist']:
+        for left, right in zip(result[column], expected[column]):
+            np.testing.assert_array_equal(np.asarray(left), np.asarray(right))
+
+
+def _write_lines(path, header, lines):
+    with open(path, 'w', newline='') as file:
+        file.writelines([header, *lines])
+
+    return str(path)
+
+
+def test_merge_equals_full_build(dataset_path):
+    # Lotes sorteados: as mesmas células aparecem em vários lotes
+    dataframe = load_dataset(ROLLUP_COLUMNS, path=dataset_path)
+    batch = np.random.default_rng(1).integers(0, 3, len(dataframe))
+    cubes = [build_rollup(dataframe.loc[batch == number, :]) for number in range(3)]
+
+    expected = build_rollup(dataframe)
+    _assert_same_cube(merge_rollup(merge_rollup(cubes[0], cubes[1]), cubes[2]), expected)
+    _assert_same_cube(merge_rollup(cubes[0], merge_rollup(cubes[2], cubes[1])), expected)
+
+
+def test_merge_with_empty_cube(dataset_path):
+    dataframe = load_dataset(ROLLUP_COLUMNS, path=dataset_path)
+    cube = build_rollup(dataframe)
+
+    _assert_same_cube(merge_rollup(cube, build_rollup(dataframe.iloc[:0])), cube)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_append_equals_rebuild(tmp_path, workers):
+    full = str(tmp_path / 'full.csv')
+    write_orders(full, 3000, seed=11)
+    build_store(full)
+
+    with open(full, newline='') as file:
+        header, *lines = file.readlines()
+
+    # Base parcial e lotes com sobreposição de pedidos e um lote repetido
+    base = _write_lines(tmp_path / 'train.csv', header, lines[:1000])
+    build_store(base, chunk_size=64 * 1024, workers=workers)
+    batches = [lines[800:1800], lines[1800:2500], lines[1800:2500], lines[2400:]]
+
+    appended = [append_batch(_write_lines(tmp_path / f'batch{number}.csv', header, batch), base)
+                for number, batch in enumerate(batches)]
+
+    assert appended[2] == 0
+    assert len(load_dataset(['ID'], path=base)) == len(load_dataset(['ID'], path=full))
+    _assert_same_cube(read_rollup(rollup_path(base)), read_rollup(rollup_path(full)))
+    _assert_same_cube(read_rollup(rollup_path(base)),
+                      build_rollup(load_dataset(ROLLUP_COLUMNS, path=base)))
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from utils.sketch import (DISTANCE_EDGES, HLL_ERROR, TIME_EDGES, approx_unique, hash_values,
+                          hist_merge, hist_quantiles, histograms_by_group, hll_count,
+                          hll_merge, hll_registers_by_group)
+
+PERCENTILES = [0.25, 0.5, 0.9, 0.99]
+
+
+def _ids(start, stop):
+    return np.array([f'COURIER{number:07d}' for number in range(start, stop)], dtype=object)
+
+
+def _sketch(values):
+    return hll_registers_by_group(hash_values(values), np.zeros(len(values), dtype='intp'), 1)[0]
+
+
+def test_hll_small_sets_are_exact():
+    # Contagem linear: conjuntos pequenos saem praticamente exatos
+    for n in (1, 10, 100):
+        assert abs(hll_count(_sketch(_ids(0, n))) - n) <= max(1, n * 0.01)
+
+
+@pytest.mark.parametrize('n', [2_000, 20_000, 200_000])
+def test_hll_error_bound(n):
+    # Cada estimativa fica a até 3 erros padrão da contagem exata
+    estimate = hll_count(_sketch(_ids(0, n)))
+    assert abs(estimate - n) / n <= 3 * HLL_ERROR
+
+
+def test_hll_error_is_the_documented_standard_error():
+    # Erro relativo quadrático médio de 40 conjuntos disjuntos próximo de HLL_ERROR
+    errors = [(hll_count(_sketch(_ids(i * 10_000, (i + 1) * 10_000))) - 10_000) / 10_000
+              for i in range(40)]
+    assert np.sqrt(np.mean(np.square(errors))) <= 1.5 * HLL_ERROR
+
+
+def test_hll_merge_equals_sketch_of_union():
+    a, b, c = _ids(0, 6_000), _ids(4_000, 9_000), _ids(8_500, 12_000)
+    union = np.unique(np.concatenate([a, b, c]))
+
+    merged = hll_merge([_sketch(a), _sketch(b), _sketch(c)])
+
+    np.testing.assert_array_equal(merged, _sketch(union))
+    assert approx_unique([_sketch(a), _sketch(b), _sketch(c)]) == hll_count(_sketch(union))
+
+
+def test_hll_by_group_matches_single_sketches():
+    values = np.concatenate([_ids(0, 3_000), _ids(2_000, 5_000)])
+    groups = np.repeat([0, 1], 3_000)
+
+    registers = hll_registers_by_group(hash_values(values), groups, 2)
+
+    np.testing.assert_array_equal(registers[0], _sketch(values[:3_000]))
+    np.testing.assert_array_equal(registers[1], _sketch(values[3_000:]))
+
+
+def test_histogram_merge_equals_histogram_of_concatenation():
+    rng = np.random.default_rng(3)
+    values = rng.integers(5, 60, 5_000).astype('float64')
+    groups = rng.integers(0, 4, 5_000)
+
+    per_group = histograms_by_group(values, groups, 4, TIME_EDGES)
+    whole = histograms_by_group(values, np.zeros(len(values)), 1, TIME_EDGES)[0]
+
+    np.testing.assert_array_equal(hist_merge(per_group, TIME_EDGES), whole)
+
+
+def test_time_quantiles_are_exact():
+    # Minutos inteiros com bins unitários: o percentil sem interpolação é o
+    # percentil exato por posto
+    rng = np.random.default_rng(5)
+    values = rng.integers(10, 55, 7_001).astype('float64')
+    counts = histograms_by_group(values, np.zeros(len(values)), 1, TIME_EDGES)[0]
+
+    expected = np.quantile(values, PERCENTILES, method='inverted_cdf')
+    np.testing.assert_array_equal(hist_quantiles(counts, TIME_EDGES, PERCENTILES,
+                                                 interpolate=False), expected)
+
+
+def test_distance_quantiles_within_one_bin():
+    # Com interpolação o erro é no máximo a largura do bin (250 m)
+    rng = np.random.default_rng(9)
+    values = rng.gamma(2.0, 4.0, 20_000)
+    values = values[values < DISTANCE_EDGES[-1]]
+    counts = histograms_by_group(values, np.zeros(len(values)), 1, DISTANCE_EDGES)[0]
+
+    result = hist_quantiles(counts, DISTANCE_EDGES, PERCENTILES)
+    expected = np.quantile(values, PERCENTILES)
+    assert np.all(np.abs(result - expected) <= DISTANCE_EDGES[1] - DISTANCE_EDGES[0])
+
+
+def test_empty_histogram_has_no_quantiles():
+    counts = np.zeros(len(TIME_EDGES), dtype='int64')
+    assert np.isnan(hist_quantiles(counts, TIME_EDGES, PERCENTILES)).all()
@@ -0,0 +1,99 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.aggregate import aggregate
+from utils.data import load_filtered
+from utils.precompute import page_functions
+from utils.ranking import RANKING_METRICS, top_couriers
+from utils.sqlstore import build_database, open_query
+
+COLUMNS = ['Delivery_person_ID', 'Delivery_person_Age', 'Delivery_person_Ratings',
+           'Vehicle_condition', 'Weatherconditions', 'Order_Date', 'City',
+           'Road_traffic_density', 'Time_taken(min)', 'distance_km', 'Festival',
+           'Type_of_order', 'Restaurant_latitude', 'Restaurant_longitude',
+           'Delivery_location_latitude', 'Delivery_location_longitude']
+
+METRICS = {
+    'max_age': ('max', 'Delivery_person_Age', None),
+    'min_condition': ('min', 'Vehicle_condition', None),
+    'unique': ('nunique', 'Delivery_person_ID', None),
+    'distance': ('mean', 'distance_km', None),
+    'count_city': ('count', 'Delivery_person_Ratings', 'City'),
+    'sum_time': ('sum', 'Time_taken(min)', 'City'),
+    'rating': ('mean', 'Delivery_person_Ratings', 'Delivery_person_ID'),
+    'std_traffic': ('std', 'Delivery_person_Ratings', 'Road_traffic_density'),
+    'std_weather': ('std', 'Delivery_person_Ratings', 'Weatherconditions'),
+    'unique_city': ('nunique', 'Delivery_person_ID', 'City'),
+    'time_order': ('mean', 'Time_taken(min)', ('City', 'Type_of_order')),
+    'std_festival': ('std', 'Time_taken(min)', 'Festival'),
+}
+
+# (data inicial, data limite, condições de trânsito)
+FILTERS = [
+    (datetime(2022, 2, 11), datetime(2022, 4, 13), ['Low', 'Medium', 'High', 'Jam']),
+    (datetime(2022, 3, 1), datetime(2022, 3, 20), ['Jam', 'Low']),
+    (None, datetime(2022, 3, 15), ['High']),
+    (datetime(2022, 3, 1), datetime(2022, 3, 1), ['Low']),
+]
+
+
+@pytest.fixture(scope='module')
+def database(dataset_path):
+    return build_database(dataset_path)
+
+
+@pytest.fixture(scope='module')
+def page01():
+    return page_functions('pages/01_visao_empresa.py')
+
+
+def _sources(path, filters):
+    date_start, date_slider, traffic = filters
+    df = load_filtered(COLUMNS, date_slider, traffic, date_start, path=path)
+    query = open_query(date_slider, traffic, date_start, path=path)
+    assert query is not None
+
+    return df, query
+
+
+def _assert_same(expected, result):
+    if isinstance(expected, pd.Series):
+        assert list(expected.index) == list(result.index)
+        np.testing.assert_allclose(result.to_numpy(dtype='float64'),
+                                   expected.to_numpy(dtype='float64'), rtol=1e-9)
+    elif isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(expected.reset_index(drop=True),
+                                      result.reset_index(drop=True),
+                                      check_dtype=False, check_categorical=False,
+                                      check_index_type=False)
+    else:
+        np.testing.assert_allclose(result, expected, rtol=1e-9)
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_aggregate(dataset_path, database, filters):
+    df, query = _sources(dataset_path, filters)
+    expected, result = aggregate(df, METRICS), aggregate(query, METRICS)
+
+    for name in METRICS:
+        _assert_same(expected[name], result[name])
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+@pytest.mark.parametrize('metric', RANKING_METRICS.values())
+def test_top_couriers(dataset_path, database, filters, metric):
+    df, query = _sources(dataset_path, filters)
+
+    for expected, result in zip(top_couriers(df, 5, metric), top_couriers(query, 5, metric)):
+        _assert_same(expected, result)
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+@pytest.mark.parametrize('helper', ['map_medians', 'map_points', 'map_density'])
+def test_map_helpers(dataset_path, database, page01, filters, helper):
+    df, query = _sources(dataset_path, filters)
+
+    _assert_same(page01[helper](df), page01[helper](query))
@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+from utils.profiling import profiled
+from utils.sqlstore import SqlQuery, sql_aggregate
+
+# Acumuladores necessários para cada função de agregação
+ACCUMULATORS = {'count': {'count'}, 'sum': {'count', 'sum'},
+                'mean': {'count', 'sum'}, 'std': {'count', 'sum', 'sumsq'},
+                'min': {'min'}, 'max': {'max'}, 'nunique': {'distinct'}}
+
+
+def _group_codes(series):
+    # Códigos inteiros do agrupamento (-1 = vazio) e os rótulos dos grupos
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories
+
+    codes, labels = pd.factorize(series, sort=True)
+    return codes, labels
+
+
+def _group_keys(df, by):
+    # Agrupamento por uma coluna ou por uma tupla de colunas; na tupla os
+    # códigos são combinados na ordem das colunas (como no groupby)
+    if not isinstance(by, tuple):
+        codes, labels = _group_codes(df[by])
+        return codes, pd.Index(labels, name=by)
+
+    codes, levels = np.zeros(len(df), dtype='int64'), []
+    for column in by:
+        column_codes, labels = _group_codes(df[column])
+        codes = np.where((codes >= 0) & (column_codes >= 0),
+                         codes * len(labels) + column_codes, -1)
+        levels.append(labels)
+
+    return codes, pd.MultiIndex.from_product(levels, names=list(by))
+
+
+def _accumulate(values, codes, groups, needed):
+    # Uma passada sobre a coluna preenche todos os acumuladores pedidos
+    valid = ~np.isnan(values)
+    if codes is not None:
+        valid &= codes >= 0
+    x = values[valid]
+    keys = codes[valid] if codes is not None else np.zeros(len(x), dtype='int64')
+
+    acc = {'count': np.bincount(keys, minlength=groups).astype('float64')}
+
+    if needed & {'sum', 'sumsq'}:
+        # Valores deslocados pelo primeiro valor: evita o cancelamento
+        # numérico de sumsq - sum² / n quando a média é grande
+        acc['shift'] = x[0] if len(x) else 0.0
+        shifted = x - acc['shift']
+        acc['sum'] = np.bincount(keys, weights=shifted, minlength=groups)
+        if 'sumsq' in needed:
+            acc['sumsq'] = np.bincount(keys, weights=shifted * shifted, minlength=groups)
+
+    if 'min' in needed:
+        acc['min'] = np.full(groups, np.inf)
+        np.fmin.at(acc['min'], keys, x)
+    if 'max' in needed:
+        acc['max'] = np.full(groups, -np.inf)
+        np.fmax.at(acc['max'], keys, x)
+
+    return acc
+
+
+def _distinct(series, codes, groups):
+    # Valores distintos por grupo: pares (grupo, valor) distintos
+    values, labels = _group_codes(series)
+    valid = values >= 0
+    if codes is not None:
+        valid &= codes >= 0
+    keys = codes[valid] if codes is not None else np.zeros(valid.sum(), dtype='int64')
+
+    pairs = np.unique(keys.astype('int64') * len(labels) + values[valid])
+    return {'distinct': np.bincount(pairs // max(len(labels), 1), minlength=groups)}
+
+
+def _finalize(func, acc):
+    # Métrica final a partir dos acumuladores compartilhados
+    if func == 'nunique':
+        return acc['distinct']
+
+    n = acc['count']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if func == 'count':
+            return n
+        if func == 'sum':
+            return acc['sum'] + acc['shift'] * n
+        if func == 'mean':
+            return np.where(n > 0, acc['sum'] / n + acc['shift'], np.nan)
+        if func == 'std':
+            var = (acc['sumsq'] - acc['sum'] ** 2 / n) / (n - 1)
+            return np.where(n > 1, np.sqrt(np.maximum(var, 0)), np.nan)
+
+    return np.where(n > 0, acc[func], np.nan)
+
+
+@profiled
+def aggregate(df, metrics):
+    '''Calcula uma lista declarativa de métricas em uma única varredura de
+        cada coluna: métricas sobre a mesma coluna e o mesmo agrupamento
+        compartilham os acumuladores (contagem, soma, soma dos quadrados,
+        mínimo, máximo e valores distintos), e médias e desvios saem da
+        mesma soma.
+        Valores nulos são ignorados, como no pandas; desvio padrão amostral.
+
+        Com o backend SQL (ver utils.sqlstore) as métricas viram consultas
+        agrupadas no banco.
+
+        Input: Dataframe (ou consulta SQL filtrada) e dict nome -> (função,
+               coluna, agrupamento), com função em 'count', 'sum', 'mean',
+               'std', 'min', 'max', 'nunique' e agrupamento None, uma
+               coluna ou uma tupla de colunas
+        Output: dict nome -> escalar (sem agrupamento) ou Series indexada
+                pelos grupos presentes nos dados
+    '''
+    if isinstance(df, SqlQuery):
+        return sql_aggregate(df, metrics)
+
+    # Acumuladores necessários por (coluna, agrupamento)
+    plan = {}
+    for func, column, by in metrics.values():
+        plan.setdefault((column, by), set()).update(ACCUMULATORS[func])
+
+    groups = {}
+    for by in {by for _, by in plan if by is not None}:
+        codes, labels = _group_keys(df, by)
+        rows = np.bincount(codes[codes >= 0], minlength=len(labels))
+        groups[by] = (codes, labels, rows > 0)
+
+    accumulators = {}
+    for (column, by), needed in plan.items():
+        codes, labels, _ = groups[by] if by is not None else (None, [None], None)
+
+        acc = {}
+        if 'distinct' in needed:
+            acc.update(_distinct(df[column], codes, len(labels)))
+        if needed - {'distinct'}:
+            values = df[column].to_numpy(dtype='float64', na_value=np.nan)
+            acc.update(_accumulate(values, codes, len(labels), needed))
+
+        accumulators[column, by] = acc
+
+    results = {}
+    for name, (func, column, by) in metrics.items():
+        result = _finalize(func, accumulators[column, by])
+        if by is None:
+            value = result[0]
+            # Mínimo e máximo de colunas inteiras continuam inteiros
+            if func in ('min', 'max') and df[column].dtype.kind in 'iu' and not np.isnan(value):
+                value = df[column].dtype.type(value)
+            results[name] = value
+        else:
+            codes, labels, observed = groups[by]
+            results[name] = pd.Series(result[observed], name=column,
+                                      index=labels[observed])
+
+    return results
@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+from utils.profiling import stage
+from utils.snapshot import MISSING, is_recording, read_snapshot, write_snapshot
+
+# Limites padrão do cache de gráficos e tabelas
+MAX_ENTRIES = 512
+MAX_BYTES = 128 * 1024 * 1024
+TTL_SECONDS = 6 * 60 * 60
+
+
+def _size_of(value):
+    # Tamanho aproximado: JSON do gráfico, memória da tabela ou dos arrays
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(deep=True)))
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+
+    if isinstance(value, dict):
+        return sum(_size_of(item) for item in value.values())
+
+    if isinstance(value, (tuple, list)):
+        return sum(_size_of(item) for item in value)
+
+    if hasattr(value, 'to_plotly_json'):
+        return len(pio.to_json(value, validate=False))
+
+    return 64
+
+
+class LRUCache:
+    '''Cache LRU compartilhado entre as sessões, limitado por quantidade de
+        itens, por bytes e por tempo de vida (TTL). Contabiliza acertos,
+        falhas e descartes.
+    '''
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES,
+                 ttl=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, func, *args, **kwargs):
+        '''Devolve o valor guardado para a chave ou calcula func(*args) e
+            guarda o resultado.
+
+            Input: chave, função e argumentos
+            Output: valor calculado ou guardado
+        '''
+        now = time.monotonic()
+
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and now - item[1] <= self.ttl:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[0]
+
+            self.misses += 1
+
+        # O cálculo fica fora do lock para não bloquear as outras sessões
+        value = func(*args, **kwargs)
+        size = _size_of(value)
+
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+
+            self._items[key] = (value, now, size)
+            self._bytes += size
+            self._evict(now)
+
+        return value
+
+    def _evict(self, now):
+        # Primeiro os itens vencidos, depois os menos usados até caber
+        for key in [k for k, item in self._items.items() if now - item[1] > self.ttl]:
+            self._bytes -= self._items.pop(key)[2]
+            self.evictions += 1
+
+        while self._items and (len(self._items) > self.max_entries
+                               or self._bytes > self.max_bytes):
+            self._bytes -= self._items.popitem(last=False)[1][2]
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self):
+        '''Contadores do cache.
+
+            Output: dict com acertos, falhas, descartes, itens e bytes
+        '''
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._items), 'bytes': self._bytes}
+
+
+# Cache do processo usado pelas páginas
+figure_cache = LRUCache()
+
+
+def _snapshot_or_compute(key, func, *args, **kwargs):
+    # Falha no cache do processo: tenta o snapshot pré-calculado em disco
+    value = read_snapshot(key)
+    if value is MISSING:
+        value = func(*args, **kwargs)
+        if is_recording():
+            write_snapshot(key, value)
+
+    return value
+
+
+def memoize(chart_id, filters, func, *args, snapshot=True, **kwargs):
+    '''Calcula um gráfico ou tabela somente na primeira vez para cada estado
+        dos filtros; os reruns e as outras sessões com os mesmos filtros
+        reaproveitam o resultado. Antes de calcular, procura o snapshot
+        gravado por utils.precompute para a mesma chave.
+
+        Input: identificador do gráfico, chave dos filtros (inclui a versão
+               do dataset), função, argumentos e snapshot=False para manter
+               o resultado só no cache do processo (intermediários com uma
+               linha por pedido, que não valem o disco)
+        Output: gráfico ou tabela
+    '''
+    with stage(f'cache: {chart_id}'):
+        key = (chart_id, filters)
+        if not snapshot:
+            return figure_cache.get_or_compute(key, func, *args, **kwargs)
+
+        return figure_cache.get_or_compute(key, _snapshot_or_compute, key,
+                                           func, *args, **kwargs)
+
+
+def cache_stats():
+    '''Contadores de acertos/falhas do cache de gráficos e tabelas.
+
+        Output: dict
+    '''
+    return figure_cache.stats()
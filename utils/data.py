@@ -0,0 +1,713 @@
+import io
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+
+from utils.geo import delivery_distance
+from utils.index import (build_category_index, build_date_index, date_range,
+                         is_sorted, select_rows)
+from utils.profiling import profiled
+from utils.rollup import ROLLUP_COLUMNS, build_rollup, merge_rollup
+from utils.store import (clear_parts, column_to_pandas, is_stale, list_parts,
+                         open_store, order_days, parts_path, read_rollup,
+                         rollup_path, store_path, to_arrow, write_part,
+                         write_rollup, write_store, write_store_tables)
+
+# Com copy-on-write os DataFrames derivados (filtros, cópias rasas) nunca
+# alteram o DataFrame compartilhado que fica no cache do processo.
+pd.set_option('mode.copy_on_write', True)
+
+DATASET_PATH = './dataset/train.csv'
+
+# Cache do processo: caminho do CSV -> versão aberta do arquivo colunar.
+# O lock global só protege os dicionários do módulo e nunca fica preso
+# durante a abertura de uma versão ou a conversão de colunas
+_cache = {}
+_cache_lock = threading.Lock()
+
+# Um lock por caminho: somente uma thread abre (e reconstrói) cada dataset,
+# as demais esperam por ela sem bloquear os outros caminhos
+_open_locks = {}
+
+# Versão fixada por rerun: cada sessão roda o script na própria thread
+_local = threading.local()
+
+# Caminhos atualizados em segundo plano (ver utils.refresh): as páginas não
+# consultam os arquivos nem reconstroem o dataset durante o rerun
+_watched = set()
+
+# Quantidade de versões publicadas por caminho (mostrada na barra lateral)
+_numbers = {}
+
+# Quantidade de combinações de filtros mantidas por versão do dataset
+FILTER_CACHE_SIZE = 16
+
+
+# Sentinela de dado ausente usado pelo export ('NaN' seguido de espaço)
+NAN_TEXT = 'NaN '
+
+# Linhas com qualquer uma destas colunas ausente são descartadas
+REQUIRED_COLUMNS = ['Delivery_person_Age', 'multiple_deliveries',
+                    'Road_traffic_density', 'City', 'Festival']
+
+# Colunas de texto (poucos valores distintos) com espaços sobrando no final
+STRIP_COLUMNS = ['Road_traffic_density', 'Type_of_order',
+                 'Type_of_vehicle', 'City', 'Festival']
+
+# Tipos definidos já na leitura do CSV
+CSV_TYPES = {
+    'ID': pa.string(),
+    'Delivery_person_ID': pa.string(),
+    'Delivery_person_Age': pa.float64(),
+    'Delivery_person_Ratings': pa.float64(),
+    'Restaurant_latitude': pa.float64(),
+    'Restaurant_longitude': pa.float64(),
+    'Delivery_location_latitude': pa.float64(),
+    'Delivery_location_longitude': pa.float64(),
+    'Order_Date': pa.timestamp('ns'),
+    'Time_Orderd': pa.string(),
+    'Time_Order_picked': pa.string(),
+    'Weatherconditions': pa.string(),
+    'Road_traffic_density': pa.string(),
+    'Vehicle_condition': pa.int64(),
+    'Type_of_order': pa.string(),
+    'Type_of_vehicle': pa.string(),
+    'multiple_deliveries': pa.float64(),
+    'Festival': pa.string(),
+    'City': pa.string(),
+    'Time_taken(min)': pa.string(),
+}
+
+TIME_TAKEN_PREFIX = '(min) '
+
+# Tamanho (em bytes do CSV) de cada pedaço lido na ingestão em streaming
+CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def _csv_convert_options():
+    # O sentinela 'NaN ' vira NaN somente nas colunas numéricas, nas colunas
+    # de texto ele continua como texto e é tratado pelo clean_database
+    return pv.ConvertOptions(column_types=CSV_TYPES,
+                             null_values=[NAN_TEXT],
+                             strings_can_be_null=False,
+                             timestamp_parsers=['%d-%m-%Y'])
+
+
+@profiled
+def read_database(filepath_or_buffer):
+    '''Lê o CSV de pedidos já com os tipos das colunas definidos.
+        A leitura é feita pelo parser multi-thread do pyarrow, o sentinela
+        'NaN ' vira NaN nas colunas numéricas e a coluna Order_Date já é
+        convertida para data.
+
+        Input: caminho (ou buffer) do CSV
+        Output: Dataframe bruto tipado
+    '''
+    table = pv.read_csv(filepath_or_buffer,
+                        convert_options=_csv_convert_options())
+    return table.to_pandas()
+
+
+def _csv_ranges(path, chunk_size):
+    # Intervalos de bytes [início, fim) de aproximadamente chunk_size bytes,
+    # terminando sempre em fim de linha (o export não tem quebras de linha
+    # dentro dos campos), junto com o cabeçalho do CSV
+    with open(path, 'rb') as file:
+        header = file.readline()
+        start = file.tell()
+        size = os.fstat(file.fileno()).st_size
+
+        # CSV só com o cabeçalho: um intervalo vazio, que vira a tabela vazia
+        # com o schema (e o cubo vazio) em vez de nenhum pedaço
+        if start >= size:
+            yield header, start, start
+
+        while start < size:
+            file.seek(start + chunk_size)
+            file.readline()
+            end = min(file.tell(), size)
+
+            yield header, start, end
+            start = end
+
+
+def _read_range(path, header, start, end):
+    # Lê um intervalo de linhas do CSV como se fosse um CSV completo
+    with open(path, 'rb') as file:
+        file.seek(start)
+        block = file.read(end - start)
+
+    return read_database(io.BytesIO(header + block))
+
+
+def read_database_chunks(path, chunk_size=CHUNK_SIZE):
+    '''Lê o CSV de pedidos em pedaços de aproximadamente chunk_size bytes,
+        com os mesmos tipos do read_database. Somente um pedaço fica em
+        memória por vez (o leitor em streaming do pyarrow lê o arquivo
+        adiante sem limite, por isso a divisão é feita aqui, por linhas).
+
+        Input: caminho do CSV e tamanho do pedaço em bytes
+        Output: gerador de Dataframes brutos tipados
+    '''
+    for header, start, end in _csv_ranges(path, chunk_size):
+        yield _read_range(path, header, start, end)
+
+
+def _is_missing(column):
+    if column.dtype == object:
+        return column.isna() | (column == NAN_TEXT)
+
+    return column.isna()
+
+
+def _map_unique(column, func):
+    # Aplica a função somente nos valores distintos e expande pelos códigos:
+    # o custo por linha fica restrito ao factorize
+    codes, uniques = pd.factorize(column)
+    return pd.Series(func(uniques).to_numpy()[codes],
+                     index=column.index, name=column.name)
+
+
+@profiled
+def clean_database(dataframe):
+    '''Esta função tem a responsabilidade de limpar o dataframe
+        Tipos de limpeza:
+        1 - Remoção dos dados NaN
+        2 - Mudança do tipo da coluna de dados
+        3 - Remoção dos espaços das variáveis de texto
+        4 - Formatação da coluna de datas
+        5 - Limpeza da coluna de tempo (remoção do texto da variável numérica)
+
+        Aceita tanto o Dataframe do read_database quanto o do pd.read_csv
+        puro. Todas as linhas inválidas saem com uma única máscara e uma
+        única seleção, sem cópias intermediárias.
+
+        Input: Dataframe
+        Output: Dataframe
+    '''
+    # Removendo linhas com NaN da base de dados (máscara única)
+    linhas_invalidas = _is_missing(dataframe[REQUIRED_COLUMNS[0]])
+    for column in REQUIRED_COLUMNS[1:]:
+        linhas_invalidas |= _is_missing(dataframe[column])
+
+    dataframe = dataframe.loc[~linhas_invalidas.to_numpy(), :]
+    dataframe = dataframe.reset_index(drop=True)
+
+    # Remover o texto de numeros --> '(min) 24'
+    time_taken = dataframe['Time_taken(min)']
+    if time_taken.dtype == object:
+        time_taken = _map_unique(
+            time_taken, lambda x: x.str.slice(len(TIME_TAKEN_PREFIX)))
+
+    # Converter os tipos das colunas
+    dataframe['Time_taken(min)'] = time_taken.astype('int64')
+    dataframe['Delivery_person_Age'] = dataframe['Delivery_person_Age'].astype(
+        'int64')
+    dataframe['multiple_deliveries'] = dataframe['multiple_deliveries'].astype(
+        'int64')
+    dataframe['Delivery_person_Ratings'] = dataframe['Delivery_person_Ratings'].astype(
+        'float64')
+
+    if not pd.api.types.is_datetime64_any_dtype(dataframe['Order_Date']):
+        dataframe['Order_Date'] = pd.to_datetime(
+            dataframe['Order_Date'], format='%d-%m-%Y')
+
+    # Remover os espaços em branco dentro das strings
+    dataframe['ID'] = dataframe['ID'].str.strip()
+    for column in STRIP_COLUMNS:
+        dataframe[column] = _map_unique(dataframe[column],
+                                        lambda x: x.str.strip())
+
+    return dataframe
+
+
+def _file_key(path):
+    # Somente os metadados do arquivo são consultados, o conteúdo não é lido
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _dataset_key(path):
+    # O cubo é regravado a cada lote anexado e funciona como marcador de versão
+    return (_file_key(path), _file_key(store_path(path)),
+            _file_key(rollup_path(path)))
+
+
+def _prepare(dataframe):
+    # Distância restaurante -> entrega calculada uma única vez
+    dataframe['distance_km'] = delivery_distance(dataframe)
+    return dataframe
+
+
+@profiled
+def build_store(path=DATASET_PATH, chunk_size=CHUNK_SIZE, workers=1):
+    '''Etapa de ingestão: lê o CSV em pedaços, limpa cada pedaço com as
+        mesmas regras do clean_database, calcula a distância de cada entrega
+        e grava o resultado no arquivo colunar (.feather) ao lado do CSV,
+        junto com o cubo diário. O pico de memória é limitado pelo tamanho
+        do pedaço e não pelo tamanho do CSV. Os lotes anexados anteriormente
+        são descartados, pois o CSV é considerado o export completo.
+        Com workers > 1 os pedaços são processados em paralelo (ver
+        _build_store_parallel).
+
+        Input: caminho do arquivo CSV, tamanho do pedaço em bytes e
+               quantidade de processos
+        Output: caminho do arquivo colunar gravado
+    '''
+    if workers > 1:
+        return _build_store_parallel(path, chunk_size, workers)
+
+    cube = None
+    store_dir = os.path.dirname(store_path(path)) or '.'
+
+    # Cada pedaço limpo vai para um arquivo temporário e é lido de volta via
+    # memory-map; o arquivo colunar é gravado a partir deles (ver
+    # write_store_tables), como na ingestão paralela
+    with tempfile.TemporaryDirectory(dir=store_dir) as tmp_dir:
+        def tables():
+            nonlocal cube
+            for number, raw in enumerate(read_database_chunks(path, chunk_size)):
+                dataframe = _prepare(clean_database(raw))
+
+                # O cubo é acumulado pedaço a pedaço (o tamanho dele depende
+                # dos dias e cidades, não da quantidade de pedidos)
+                chunk_cube = build_rollup(dataframe)
+                cube = chunk_cube if cube is None else merge_rollup(cube, chunk_cube)
+
+                table_path = os.path.join(tmp_dir, f'{number:06d}.table')
+                yield open_store(write_store(to_arrow(dataframe), table_path))
+
+        clear_parts(parts_path(path))
+        store = write_store_tables(tables(), store_path(path))
+
+    write_rollup(cube, rollup_path(path))
+
+    return store
+
+
+def _ingest_range(path, header, start, end, out_path):
+    # Executado em um processo do pool: limpa e pré-agrega um pedaço do CSV.
+    # O pedaço e o cubo parcial voltam como arquivos Arrow IPC, e não como
+    # Dataframes serializados pelo pickle
+    dataframe = _prepare(clean_database(_read_range(path, header, start, end)))
+
+    write_store(to_arrow(dataframe), f'{out_path}.table')
+    write_rollup(build_rollup(dataframe), f'{out_path}.rollup')
+
+    return f'{out_path}.table', f'{out_path}.rollup'
+
+
+def _build_store_parallel(path, chunk_size, workers):
+    # Os pedaços do CSV (intervalos de linhas) são distribuídos entre os
+    # processos; o processo principal lê os resultados via memory-map, na
+    # ordem do CSV, grava o arquivo colunar e combina os cubos parciais
+    cube = None
+    store_dir = os.path.dirname(store_path(path)) or '.'
+
+    with tempfile.TemporaryDirectory(dir=store_dir) as tmp_dir, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_ingest_range, path, header, start, end,
+                               os.path.join(tmp_dir, f'{number:06d}'))
+                   for number, (header, start, end) in enumerate(_csv_ranges(path, chunk_size))]
+
+        def tables():
+            nonlocal cube
+            for future in futures:
+                table_path, cube_path = future.result()
+
+                chunk_cube = read_rollup(cube_path)
+                cube = chunk_cube if cube is None else merge_rollup(cube, chunk_cube)
+
+                yield open_store(table_path)
+
+        clear_parts(parts_path(path))
+        store = write_store_tables(tables(), store_path(path))
+
+    write_rollup(cube, rollup_path(path))
+
+    return store
+
+
+@profiled
+def append_batch(batch_path, path=DATASET_PATH):
+    '''Anexa um lote de pedidos novos ao dataset. Somente o lote é lido e
+        limpo; pedidos com ID já existente (no dataset ou repetidos no
+        próprio lote) são descartados. O lote é gravado como um novo arquivo
+        e o cubo diário é atualizado somando o cubo do lote.
+
+        Input: caminho do CSV do lote e caminho do CSV do dataset
+        Output: quantidade de pedidos anexados
+    '''
+    if is_stale(path, store_path(path)):
+        build_store(path)
+
+    batch = _prepare(clean_database(read_database(batch_path)))
+    batch = batch.drop_duplicates('ID', keep='last')
+
+    # Lote vazio ou com todas as linhas descartadas pela limpeza
+    if len(batch) == 0:
+        return 0
+
+    # Busca dos IDs do lote na coluna ID do dataset (memory-map)
+    parts = list_parts(parts_path(path))
+    existing = open_store(store_path(path), parts)
+    linhas_novas = ~pc.is_in(pa.array(batch['ID'].to_numpy(), type=pa.string()),
+                             value_set=existing.column('ID').combine_chunks()).to_numpy(
+                                 zero_copy_only=False)
+    batch = batch.loc[linhas_novas, :].reset_index(drop=True)
+
+    if len(batch) == 0:
+        return 0
+
+    write_part(to_arrow(batch), parts_path(path))
+
+    # Lote com datas anteriores à última já gravada: as linhas deixariam de
+    # estar ordenadas por data e os lotes são incorporados ao arquivo principal
+    if existing.num_rows > 0 \
+            and batch['Order_Date'].min() < pd.Timestamp(existing.column('Order_Date')[-1].as_py()):
+        merge_parts(path)
+
+    if os.path.exists(rollup_path(path)):
+        cube = merge_rollup(read_rollup(rollup_path(path)), build_rollup(batch))
+    else:
+        dataset = {'table': open_store(store_path(path), list_parts(parts_path(path))),
+                   'columns': {}, 'lock': threading.RLock()}
+        cube = build_rollup(_get_columns(dataset, ROLLUP_COLUMNS))
+    write_rollup(cube, rollup_path(path))
+
+    return len(batch)
+
+
+def merge_parts(path=DATASET_PATH):
+    '''Incorpora os lotes anexados ao arquivo colunar principal, com as
+        linhas intercaladas por Order_Date (ver write_store_tables). Usado
+        quando um lote traz datas anteriores às já gravadas; os lotes com
+        datas novas continuam como arquivos separados.
+
+        Input: caminho do arquivo CSV
+        Output: caminho do arquivo colunar
+    '''
+    parts = list_parts(parts_path(path))
+    if not parts:
+        return store_path(path)
+
+    tables = [open_store(name) for name in [store_path(path), *parts]]
+    merged = write_store_tables(tables, f'{store_path(path)}.merge')
+
+    # Os lotes saem antes da troca do arquivo principal: quem abrir o dataset
+    # no meio enxerga a versão anterior sem os lotes e é reaberto em seguida
+    # (o arquivo principal faz parte da chave), nunca linhas duplicadas
+    clear_parts(parts_path(path))
+    os.replace(merged, store_path(path))
+
+    return store_path(path)
+
+
+def _open_dataset(path):
+    if is_stale(path, store_path(path)):
+        build_store(path)
+
+    # As linhas são gravadas ordenadas por Order_Date, então um intervalo de
+    # datas é sempre uma fatia contígua do arquivo mapeado; aqui só é
+    # conferido (lotes fora de ordem de uma anexação interrompida são
+    # incorporados ao arquivo principal)
+    if not is_sorted(order_days(open_store(store_path(path), list_parts(parts_path(path))))):
+        merge_parts(path)
+
+    # A chave é lida antes dos arquivos: uma alteração durante a abertura
+    # gera uma chave diferente e a versão é aberta de novo
+    key = _dataset_key(path)
+    parts = list_parts(parts_path(path))
+    table = open_store(store_path(path), parts)
+
+    # O lock da versão protege a conversão de colunas, os índices, o cubo
+    # e o cache de filtros dela
+    dataset = {'key': key,
+               'table': table,
+               'columns': {},
+               'filtered': OrderedDict(),
+               'lock': threading.RLock(),
+               'loaded_at': time.time()}
+
+    # O cubo é lido junto com a tabela: uma versão fixada por uma sessão
+    # não enxerga o cubo regravado por um lote anexado depois
+    if os.path.exists(rollup_path(path)):
+        dataset['rollup'] = read_rollup(rollup_path(path))
+
+    return dataset
+
+
+def _publish(path, dataset):
+    # Chamar sempre com _cache_lock adquirido; a troca de versão é atômica
+    name = os.path.abspath(path)
+    _numbers[name] = _numbers.get(name, 0) + 1
+    dataset['number'] = _numbers[name]
+    _cache[name] = dataset
+
+    return dataset
+
+
+def _path_lock(name):
+    with _cache_lock:
+        return _open_locks.setdefault(name, threading.Lock())
+
+
+def _current(path):
+    # Versão publicada, se ainda vale (o dataset atualizado em segundo plano
+    # não consulta os arquivos)
+    name = os.path.abspath(path)
+    with _cache_lock:
+        dataset = _cache.get(name)
+        watched = name in _watched
+
+    if dataset is not None and (watched or dataset['key'] == _dataset_key(path)):
+        return dataset
+
+    return None
+
+
+def _get_dataset(path):
+    name = os.path.abspath(path)
+    pinned = getattr(_local, 'pinned', {}).get(name)
+    if pinned is not None:
+        return pinned
+
+    dataset = _current(path)
+    if dataset is not None:
+        return dataset
+
+    # Abertura fora do lock global; quem esperava pelo lock do caminho
+    # recebe a versão aberta pela outra thread
+    with _path_lock(name):
+        dataset = _current(path)
+        if dataset is None:
+            dataset = _open_dataset(path)
+            with _cache_lock:
+                _publish(path, dataset)
+
+    return dataset
+
+
+def _get_columns(dataset, columns):
+    # Colunas já convertidas são lidas sem lock; as que faltam são
+    # convertidas sob o lock da versão e publicadas uma a uma (atribuição
+    # atômica no dicionário)
+    missing = [name for name in columns if name not in dataset['columns']]
+    if missing:
+        with dataset['lock']:
+            for name in missing:
+                if name not in dataset['columns']:
+                    dataset['columns'][name] = column_to_pandas(dataset['table'], name)
+
+    # Sem cópia: com copy-on-write qualquer alteração feita pela página fica
+    # restrita a ela e as colunas do cache permanecem intactas
+    return pd.DataFrame({name: dataset['columns'][name] for name in columns},
+                        copy=False)
+
+
+def watch_dataset(path=DATASET_PATH):
+    '''Passa a atualização do dataset para o segundo plano: as páginas
+        recebem sempre a versão publicada e somente refresh_dataset abre
+        uma versão nova.
+
+        Input: caminho do arquivo CSV
+    '''
+    with _cache_lock:
+        _watched.add(os.path.abspath(path))
+
+
+@profiled
+def refresh_dataset(path=DATASET_PATH):
+    '''Abre a versão nova do dataset fora do caminho das requisições:
+        reconstrói o arquivo colunar se o CSV mudou, lê o cubo, converte as
+        colunas e monta os índices já usados pela versão atual e só então
+        troca a versão publicada. As sessões com a versão anterior fixada
+        continuam com ela até o próximo rerun.
+
+        Input: caminho do arquivo CSV
+        Output: True se uma nova versão foi publicada
+    '''
+    name = os.path.abspath(path)
+    with _path_lock(name):
+        with _cache_lock:
+            current = _cache.get(name)
+
+        if current is not None and current['key'] == _dataset_key(path):
+            return False
+
+        dataset = _open_dataset(path)
+
+        # Aquecimento: a versão nova não é publicada ainda, então não há
+        # concorrência com as sessões
+        if current is not None:
+            _get_columns(dataset, list(current['columns']))
+            if 'traffic_index' in current:
+                _build_indexes(dataset)
+
+        with _cache_lock:
+            _publish(path, dataset)
+
+    return True
+
+
+def pin_dataset(path=DATASET_PATH):
+    '''Fixa a versão publicada do dataset para o restante do rerun: todas
+        as leituras da sessão (colunas, filtros, cubo e chave do cache)
+        usam a mesma versão, mesmo que outra seja publicada no meio.
+
+        Input: caminho do arquivo CSV
+        Output: dict com o número da versão, a chave e o horário da carga
+    '''
+    name = os.path.abspath(path)
+    if not hasattr(_local, 'pinned'):
+        _local.pinned = {}
+
+    _local.pinned.pop(name, None)
+    dataset = _get_dataset(path)
+    _local.pinned[name] = dataset
+
+    return {'number': dataset['number'], 'key': dataset['key'],
+            'loaded_at': dataset['loaded_at']}
+
+
+def dataset_version(path=DATASET_PATH):
+    '''Identificador da versão atual do dataset (metadados dos arquivos).
+        Muda sempre que o CSV é substituído ou um lote é anexado.
+
+        Input: caminho do arquivo CSV
+        Output: tupla comparável
+    '''
+    return _get_dataset(path)['key']
+
+
+@profiled
+def load_dataset(columns=None, path=DATASET_PATH):
+    '''Carrega o dataset limpo, compartilhado entre todas as páginas e sessões.
+        O CSV só é lido e limpo quando o arquivo colunar (.feather) não
+        existe ou está mais antigo que ele. O arquivo colunar é aberto via
+        memory-map uma vez por versão (data de modificação e tamanho) e cada
+        coluna é convertida para pandas somente na primeira vez em que
+        alguma página a pede. Os reruns do Streamlit recebem as colunas
+        direto da memória.
+
+        Input: lista de colunas usadas pela página (None = todas) e caminho
+               do arquivo CSV
+        Output: Dataframe limpo (somente leitura)
+    '''
+    dataset = _get_dataset(path)
+
+    if columns is None:
+        columns = dataset['table'].column_names
+
+    return _get_columns(dataset, columns)
+
+
+def load_table(path=DATASET_PATH):
+    '''Tabela Arrow da versão atual do dataset (memory-map, sem conversão
+        para pandas), junto com a versão.
+
+        Input: caminho do arquivo CSV
+        Output: (versão, pyarrow.Table)
+    '''
+    dataset = _get_dataset(path)
+    return dataset['key'], dataset['table']
+
+
+@profiled
+def load_rollup(path=DATASET_PATH):
+    '''Carrega o cubo diário de pedidos (ver utils.rollup), persistido pela
+        ingestão e lido uma única vez por versão do dataset.
+
+        Input: caminho do arquivo CSV
+        Output: Dataframe do cubo (somente leitura)
+    '''
+    dataset = _get_dataset(path)
+
+    # Sem cubo persistido (lido na abertura) ele é montado das colunas
+    if 'rollup' not in dataset:
+        with dataset['lock']:
+            if 'rollup' not in dataset:
+                dataset['rollup'] = build_rollup(
+                    _get_columns(dataset, ROLLUP_COLUMNS))
+
+    return dataset['rollup'].copy(deep=False)
+
+
+def _build_indexes(dataset):
+    # Os dois índices são publicados juntos, o de trânsito por último
+    keys = _get_columns(dataset, ['Order_Date', 'Road_traffic_density'])
+    dataset.update(date_index=build_date_index(keys['Order_Date']),
+                   traffic_index=build_category_index(keys['Road_traffic_density']))
+
+
+def _filter_rows(dataset, date_start, date_slider, traffic_options):
+    if 'traffic_index' not in dataset:
+        with dataset['lock']:
+            if 'traffic_index' not in dataset:
+                _build_indexes(dataset)
+
+    start, end = date_range(dataset['date_index'], date_start, date_slider)
+
+    return select_rows(dataset['traffic_index'], start, end, traffic_options)
+
+
+@profiled
+def load_filtered(columns, date_slider, traffic_options, date_start=None,
+                  path=DATASET_PATH):
+    '''Aplica os filtros da barra lateral (período e condições de trânsito)
+        sobre o dataset compartilhado. As linhas estão ordenadas por data, o
+        período vira uma fatia contígua encontrada por busca binária e o
+        trânsito usa as posições pré-calculadas de cada condição. O
+        resultado de cada combinação de filtros é calculado uma única vez e
+        reaproveitado por todas as sessões, então a memória não cresce com
+        a quantidade de usuários. Com todas as condições de trânsito
+        marcadas o resultado é uma fatia das colunas compartilhadas, sem
+        cópia.
+
+        Input: colunas usadas pela página, data limite (exclusiva),
+               condições de trânsito, data inicial (inclusiva, opcional) e
+               caminho do arquivo CSV
+        Output: Dataframe filtrado (somente leitura)
+    '''
+    key = (tuple(columns), pd.Timestamp(date_slider),
+           tuple(sorted(traffic_options)),
+           None if date_start is None else pd.Timestamp(date_start))
+
+    dataset = _get_dataset(path)
+    filtered = dataset['filtered']
+
+    with dataset['lock']:
+        if key in filtered:
+            filtered.move_to_end(key)
+            # Cópia rasa: colunas adicionadas pela página não afetam as outras sessões
+            return filtered[key].copy(deep=False)
+
+    # O filtro é montado fora do lock; se outra sessão montou o mesmo filtro
+    # antes, fica valendo o dela
+    dataframe = _get_columns(dataset, columns)
+    rows = _filter_rows(dataset, date_start, date_slider, traffic_options)
+
+    if isinstance(rows, slice):
+        if rows != slice(0, len(dataframe)):
+            dataframe = dataframe.iloc[rows]
+    else:
+        dataframe = dataframe.take(rows)
+
+    with dataset['lock']:
+        dataframe = filtered.setdefault(key, dataframe)
+        while len(filtered) > FILTER_CACHE_SIZE:
+            filtered.popitem(last=False)
+
+    return dataframe.copy(deep=False)
@@ -0,0 +1,201 @@
+import numpy as np
+import pandas as pd
+
+from utils.profiling import profiled
+
+# Mesmo raio médio usado pelo pacote haversine
+EARTH_RADIUS_KM = 6371.0088
+
+DISTANCE_COLUMNS = ['Restaurant_latitude', 'Restaurant_longitude',
+                    'Delivery_location_latitude', 'Delivery_location_longitude']
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    '''Distância do grande círculo (fórmula de haversine) entre pares de
+        pontos, calculada de uma vez sobre arrays inteiros de coordenadas.
+        Reproduz o resultado do pacote haversine, ponto a ponto.
+
+        Input: arrays de latitude/longitude (graus) das origens e destinos
+        Output: array com as distâncias em km
+    '''
+    lat1 = np.radians(np.asarray(lat1, dtype='float64'))
+    lon1 = np.radians(np.asarray(lon1, dtype='float64'))
+    lat2 = np.radians(np.asarray(lat2, dtype='float64'))
+    lon2 = np.radians(np.asarray(lon2, dtype='float64'))
+
+    d = (np.sin((lat2 - lat1) * 0.5) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) * 0.5) ** 2)
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(d))
+
+
+def delivery_distance(dataframe):
+    '''Distância entre o restaurante e o local de entrega de cada pedido.
+
+        Input: Dataframe com as colunas de coordenadas
+        Output: array com as distâncias em km
+    '''
+    return haversine_km(*(dataframe[column].to_numpy()
+                          for column in DISTANCE_COLUMNS))
+
+
+# Lado padrão (graus) da célula da grade espacial usada nas consultas
+GRID_CELL_DEG = 0.1
+
+# Quilômetros por grau ao longo de um meridiano
+KM_PER_DEG = np.pi * EARTH_RADIUS_KM / 180
+
+
+def _cell_keys(lat, lon, cell_deg):
+    # Chave inteira de cada célula: linha * largura + coluna
+    offset = int(np.ceil(180 / cell_deg)) + 1
+    row = np.floor(np.asarray(lat, dtype='float64') / cell_deg).astype('int64') + offset
+    col = np.floor(np.asarray(lon, dtype='float64') / cell_deg).astype('int64') + offset
+
+    return row * (2 * offset) + col, offset
+
+
+def grid_density(lat, lon, cell_deg):
+    '''Contagem de pontos por célula de uma grade uniforme de lat/lon,
+        calculada no servidor: o navegador recebe uma linha por célula não
+        vazia, qualquer que seja a quantidade de pontos.
+
+        Input: arrays de latitude/longitude (graus) e lado da célula (graus)
+        Output: Dataframe com o centro de cada célula e a contagem
+    '''
+    keys, offset = _cell_keys(lat, lon, cell_deg)
+    cells, counts = np.unique(keys, return_counts=True)
+
+    return density_frame(cells, counts, cell_deg)
+
+
+def density_frame(cells, counts, cell_deg):
+    '''Centro e contagem de cada célula a partir das chaves inteiras das
+        células (linha * largura + coluna), também usado pelo backend SQL.
+
+        Input: chaves das células (ordenadas), contagens e lado da célula
+        Output: Dataframe com o centro de cada célula e a contagem
+    '''
+    offset = int(np.ceil(180 / cell_deg)) + 1
+    row, col = np.divmod(np.asarray(cells, dtype='int64'), 2 * offset)
+
+    return pd.DataFrame({'lat': ((row - offset + 0.5) * cell_deg).round(6),
+                         'lon': ((col - offset + 0.5) * cell_deg).round(6),
+                         'count': counts})
+
+
+def build_grid_index(lat, lon, cell_deg=GRID_CELL_DEG):
+    '''Índice espacial em grade uniforme de lat/lon: os pontos ficam
+        ordenados por célula e cada célula aponta para um intervalo contíguo
+        dessa ordem (mesma ideia do índice de datas).
+
+        Input: arrays de latitude/longitude (graus) e lado da célula (graus)
+        Output: dict com as células distintas, as posições iniciais de cada
+                célula, a permutação dos pontos e as coordenadas
+    '''
+    lat = np.asarray(lat, dtype='float64')
+    lon = np.asarray(lon, dtype='float64')
+
+    keys, offset = _cell_keys(lat, lon, cell_deg)
+    order = np.argsort(keys, kind='stable')
+    cells, starts = np.unique(keys[order], return_index=True)
+
+    return {'cell_deg': cell_deg, 'offset': offset, 'cells': cells,
+            'offsets': np.append(starts, len(keys)), 'order': order,
+            'lat': lat, 'lon': lon}
+
+
+def grid_cells(grid):
+    '''Centro e quantidade de pontos de cada célula não vazia do índice.
+
+        Input: índice em grade
+        Output: Dataframe com o centro de cada célula e a contagem
+    '''
+    cell_deg, offset = grid['cell_deg'], grid['offset']
+    row, col = np.divmod(grid['cells'], 2 * offset)
+
+    return pd.DataFrame({'lat': ((row - offset + 0.5) * cell_deg).round(6),
+                         'lon': ((col - offset + 0.5) * cell_deg).round(6),
+                         'count': np.diff(grid['offsets'])})
+
+
+def _box_positions(grid, lat_min, lat_max, lon_min, lon_max):
+    # Pontos das células que cruzam a caixa: em cada linha da grade as
+    # células da caixa são um intervalo de chaves, achado por busca binária
+    cell_deg, offset = grid['cell_deg'], grid['offset']
+    width = 2 * offset
+
+    rows = np.arange(int(np.floor(lat_min / cell_deg)), int(np.floor(lat_max / cell_deg)) + 1) + offset
+    col_min = int(np.floor(lon_min / cell_deg)) + offset
+    col_max = int(np.floor(lon_max / cell_deg)) + offset
+
+    lo = grid['offsets'][np.searchsorted(grid['cells'], rows * width + col_min, 'left')]
+    hi = grid['offsets'][np.searchsorted(grid['cells'], rows * width + col_max, 'right')]
+
+    parts = [grid['order'][start:end] for start, end in zip(lo, hi) if end > start]
+    if not parts:
+        return np.empty(0, dtype='int64')
+
+    return np.concatenate(parts)
+
+
+@profiled
+def radius_query(grid, lat, lon, radius_km):
+    '''Pontos a até radius_km de (lat, lon). Só as células da caixa que
+        envolve o círculo são visitadas; a distância exata (haversine) é
+        calculada apenas para os candidatos dessas células.
+
+        Input: índice em grade, coordenadas do centro (graus) e raio em km
+        Output: (posições dos pontos, distâncias em km), por distância
+    '''
+    dlat = radius_km / KM_PER_DEG
+    lat_min, lat_max = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+
+    # Maior diferença de longitude dentro do círculo; perto dos polos
+    # (ou com raio muito grande) a caixa cobre todas as longitudes
+    if lat_min <= -90.0 or lat_max >= 90.0:
+        dlon = 180.0
+    else:
+        ratio = np.sin(radius_km / EARTH_RADIUS_KM) / np.cos(np.radians(lat))
+        dlon = 180.0 if ratio >= 1 else np.degrees(np.arcsin(ratio))
+
+    # Caixa que passa do antimeridiano é dividida em duas
+    lon_min, lon_max = lon - dlon, lon + dlon
+    if dlon >= 180.0:
+        boxes = [(-180.0, 180.0)]
+    elif lon_min < -180.0:
+        boxes = [(-180.0, lon_max), (lon_min + 360.0, 180.0)]
+    elif lon_max > 180.0:
+        boxes = [(lon_min, 180.0), (-180.0, lon_max - 360.0)]
+    else:
+        boxes = [(lon_min, lon_max)]
+
+    candidates = np.concatenate([_box_positions(grid, lat_min, lat_max, *box)
+                                 for box in boxes])
+    dist = haversine_km(lat, lon, grid['lat'][candidates], grid['lon'][candidates])
+
+    inside = dist <= radius_km
+    positions, dist = candidates[inside], dist[inside]
+    order = np.argsort(dist, kind='stable')
+
+    return positions[order], dist[order]
+
+
+@profiled
+def nearest_query(grid, lat, lon, k):
+    '''Os k pontos mais próximos de (lat, lon). O raio de busca começa em
+        uma célula e dobra até conter k pontos; como a consulta por raio é
+        exata, os k primeiros desse raio são os k vizinhos.
+
+        Input: índice em grade, coordenadas (graus) e quantidade de vizinhos
+        Output: (posições dos pontos, distâncias em km), por distância
+    '''
+    k = min(int(k), len(grid['lat']))
+    radius = grid['cell_deg'] * KM_PER_DEG
+
+    while True:
+        positions, dist = radius_query(grid, lat, lon, radius)
+        if len(positions) >= k or radius > np.pi * EARTH_RADIUS_KM:
+            return positions[:k], dist[:k]
+
+        radius *= 2
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+
+def is_sorted(days):
+    '''Indica se as linhas estão em ordem de data.
+
+        Input: array com os dias de cada pedido (inteiros ou datetime64)
+        Output: bool
+    '''
+    return len(days) == 0 or bool(np.all(days[1:] >= days[:-1]))
+
+
+def sort_order(days):
+    '''Permutação que ordena as linhas por data (estável). Quando as linhas
+        já estão em ordem devolve None e nenhuma cópia é necessária.
+
+        Input: array com os dias de cada pedido (inteiros ou datetime64)
+        Output: array de posições ou None
+    '''
+    if is_sorted(days):
+        return None
+
+    return np.argsort(days, kind='stable')
+
+
+def build_date_index(dates):
+    '''Índice data -> posição da primeira linha daquela data, sobre a coluna
+        Order_Date já ordenada.
+
+        Input: Series de datas ordenada
+        Output: (array de datas distintas, array de posições iniciais com o
+                 total de linhas no final)
+    '''
+    values = dates.to_numpy()
+    unique_dates, starts = np.unique(values, return_index=True)
+
+    return unique_dates, np.append(starts, len(values))
+
+
+def date_range(date_index, date_start, date_end):
+    '''Resolve um intervalo de datas [date_start, date_end) em um intervalo
+        contíguo de linhas por busca binária, O(log n).
+
+        Input: índice de datas, data inicial (inclusiva, None = sem limite) e
+               data final (exclusiva)
+        Output: (primeira linha, linha final exclusiva)
+    '''
+    unique_dates, offsets = date_index
+
+    start = 0
+    if date_start is not None:
+        start = np.searchsorted(unique_dates, np.datetime64(pd.Timestamp(date_start)), 'left')
+    end = np.searchsorted(unique_dates, np.datetime64(pd.Timestamp(date_end)), 'left')
+
+    return int(offsets[start]), int(offsets[max(start, end)])
+
+
+def build_category_index(series):
+    '''Posições (ordenadas) das linhas de cada categoria de uma coluna.
+
+        Input: Series categórica
+        Output: dict categoria -> array de posições
+    '''
+    codes = series.cat.codes.to_numpy()
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(series.cat.categories) + 1))
+
+    return {category: order[bounds[i]:bounds[i + 1]]
+            for i, category in enumerate(series.cat.categories)}
+
+
+def select_rows(category_index, start, end, options):
+    '''Combina o intervalo de datas com as categorias escolhidas. Com todas
+        as categorias o resultado é o próprio intervalo (fatia, sem cópia);
+        senão cada categoria contribui só com as posições dentro do
+        intervalo, localizadas por busca binária.
+
+        Input: índice de categorias, intervalo de linhas e categorias
+        Output: slice ou array de posições
+    '''
+    if set(category_index).issubset(options):
+        return slice(start, end)
+
+    parts = [positions[np.searchsorted(positions, start):np.searchsorted(positions, end)]
+             for category, positions in category_index.items()
+             if category in options]
+
+    if not parts:
+        return np.empty(0, dtype='int64')
+
+    return np.sort(np.concatenate(parts))
@@ -0,0 +1,64 @@
+'''Ingestão do dataset: gera o arquivo colunar (.feather) usado pelas páginas
+ou anexa lotes de pedidos novos a ele.
+
+Uso: python -m utils.ingest [--csv ./dataset/train.csv] [--workers 4]
+     python -m utils.ingest --append lote_2022-04-07.csv [lote2.csv ...]
+     python -m utils.ingest --append lote.csv --precompute
+     python -m utils.ingest --sqlite
+'''
+import argparse
+import time
+
+from utils.data import CHUNK_SIZE, DATASET_PATH, append_batch, build_store
+from utils.sqlstore import BACKEND, build_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--csv', default=DATASET_PATH,
+                        help='CSV de pedidos exportado')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE // 2**20,
+                        help='tamanho (MB) de cada pedaço lido do CSV')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processos usados para limpar e agregar os pedaços')
+    parser.add_argument('--append', nargs='+', metavar='LOTE',
+                        help='CSVs de lotes novos a anexar ao dataset')
+    parser.add_argument('--sqlite', action='store_true', default=BACKEND == 'sqlite',
+                        help='grava também o banco do backend SQL (padrão com CURRY_BACKEND=sqlite)')
+    parser.add_argument('--precompute', action='store_true',
+                        help='regrava os snapshots das páginas ao final (utils.precompute)')
+    args = parser.parse_args()
+
+    # As páginas leem o dataset padrão, então só ele tem snapshots
+    if args.precompute and args.csv != DATASET_PATH:
+        parser.error('--precompute só vale para o dataset padrão')
+
+    if not args.append:
+        start = time.perf_counter()
+        path = build_store(args.csv, chunk_size=args.chunk_size * 2**20,
+                           workers=args.workers)
+        print(f'{path} gravado em {time.perf_counter() - start:.2f} s')
+    else:
+        for batch_path in args.append:
+            start = time.perf_counter()
+            n_rows = append_batch(batch_path, args.csv)
+            print(f'{batch_path}: {n_rows} pedidos anexados em '
+                  f'{time.perf_counter() - start:.2f} s')
+
+    if args.sqlite:
+        start = time.perf_counter()
+        database = build_database(args.csv)
+        print(f'{database} gravado em {time.perf_counter() - start:.2f} s')
+
+    if args.precompute:
+        # Importado só aqui: a pré-computação carrega as páginas (e o Streamlit)
+        from utils.precompute import precompute
+
+        start = time.perf_counter()
+        result = precompute()
+        print(f'{result["snapshots"]} snapshots gravados em '
+              f'{time.perf_counter() - start:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import json
+import time
+
+import streamlit as st
+
+from utils.cache import cache_stats
+from utils.profiling import finish_trace, stage, trace_frame
+
+
+def render_tabs(tabs, lazy=True, key=None):
+    '''Desenha as abas da página. No modo lazy somente a aba selecionada é
+        calculada e desenhada (o st.tabs executa o código de todas as abas
+        em todo rerun); a seleção é feita por um seletor horizontal, omitido
+        quando a página tem uma única aba. Abaixo de cada aba desenhada é
+        exibido o tempo gasto nela.
+
+        Input: dict nome da aba -> função que desenha a aba, modo lazy e
+               chave do seletor
+        Output: dict nome da aba -> tempo de cálculo (segundos)
+    '''
+    labels = list(tabs)
+
+    if lazy:
+        # Com uma única aba não há o que selecionar
+        selected = labels[0]
+        if len(labels) > 1:
+            selected = st.radio('Aba', labels, horizontal=True,
+                                label_visibility='collapsed', key=key)
+        containers = [(selected, st.container())]
+    else:
+        containers = zip(labels, st.tabs(labels))
+
+    timings = {}
+    for label, container in containers:
+        with container:
+            start = time.perf_counter()
+            with stage(f'aba: {label}'):
+                tabs[label]()
+            timings[label] = time.perf_counter() - start
+
+            st.caption(f'{label}: calculado em {timings[label] * 1000:.0f} ms')
+
+    return timings
+
+
+def render_profile():
+    '''Encerra o trace do rerun e, quando ligado, mostra na barra lateral
+        as etapas medidas (tempo, linhas e alocações), os contadores do cache
+        de gráficos do processo e botões para exportar o trace em JSON e CSV.
+
+        Input: None
+        Output: None
+    '''
+    trace = finish_trace()
+    if trace is None:
+        return
+
+    df_aux = trace_frame(trace)
+    df_aux['stage'] = ['  ' * depth + name for depth, name in zip(df_aux['depth'], df_aux['stage'])]
+    total = df_aux.loc[df_aux['depth'] == 0, 'seconds'].sum()
+
+    with st.sidebar.expander('Depuração', expanded=True):
+        st.caption(f'{len(df_aux)} etapas, {total * 1000:.0f} ms no nível superior')
+        st.dataframe(df_aux.drop(columns='depth'), hide_index=True)
+
+        # Acertos e falhas acumulados desde o início do processo (todas as sessões)
+        stats = cache_stats()
+        lookups = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / lookups if lookups else 0.0
+        st.caption(f'Cache de gráficos: {stats["hits"]} acertos, {stats["misses"]} falhas '
+                   f'({hit_rate:.0%} de acerto), {stats["entries"]} itens '
+                   f'({stats["bytes"] / 2**20:.1f} MB), {stats["evictions"]} descartes')
+        st.download_button('Trace JSON', json.dumps(trace, ensure_ascii=False, default=str),
+                           file_name='trace.json', mime='application/json')
+        st.download_button('Trace CSV', df_aux.to_csv(index=False),
+                           file_name='trace.csv', mime='text/csv')
+
+
+def render_dataset_version(version):
+    '''Mostra na barra lateral a versão do dataset usada no rerun.
+
+        Input: dict devolvido por pin_dataset
+        Output: None
+    '''
+    loaded_at = time.strftime('%d/%m %H:%M:%S', time.localtime(version['loaded_at']))
+    st.sidebar.caption(f'Dados: versão {version["number"]} (carregada em {loaded_at})')
@@ -0,0 +1,115 @@
+'''Pré-computação dos gráficos e tabelas das páginas para os filtros padrão,
+sem navegador. Cada página expõe precompute_page(date_start, date_slider,
+traffic_options), que calcula pelo mesmo memoize das abas todos os gráficos
+e tabelas de um estado dos filtros, com cada opção dos widgets das abas; a
+página é carregada sem executar o layout (page_functions). Tudo o que passa
+pelo memoize é gravado no diretório de snapshots (ver utils.snapshot), que
+as páginas leem antes de calcular. Pode rodar no cron ou após a ingestão.
+
+Uso: python -m utils.precompute [--pages 01 03] [--presets todos Jam]
+'''
+import argparse
+import ast
+import glob
+import os
+import time
+from datetime import datetime
+
+import streamlit.logger
+
+from utils.data import pin_dataset
+from utils.snapshot import (SNAPSHOT_DIR, prune_snapshots, record_snapshots,
+                            snapshot_count)
+
+PAGES_DIR = 'pages'
+
+# Valores padrão da barra lateral das páginas
+DATE_RANGE = (datetime(2022, 2, 11), datetime(2022, 4, 13))
+TRAFFIC = ['Low', 'Medium', 'High', 'Jam']
+
+# Presets: período completo com todo o trânsito e com cada condição isolada
+PRESETS = {'todos': TRAFFIC, **{traffic: [traffic] for traffic in TRAFFIC}}
+
+
+def page_functions(path):
+    '''Carrega só os imports, as constantes e as funções de uma página, sem
+        executar o layout do Streamlit.
+
+        Input: caminho da página
+        Output: dict nome -> objeto definido pela página
+    '''
+    tree = ast.parse(open(path, encoding='utf-8').read())
+    tree.body = [node for node in tree.body
+                 if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef))
+                 or (isinstance(node, ast.Assign)
+                     and all(isinstance(target, ast.Name) and target.id.isupper()
+                             for target in node.targets))]
+
+    namespace = {}
+    exec(compile(tree, path, 'exec'), namespace)
+
+    return namespace
+
+
+def run_page(path, traffic):
+    '''Calcula os gráficos e tabelas de uma página para um preset de trânsito.
+
+        Input: caminho da página e condições de trânsito selecionadas
+    '''
+    page_functions(path)['precompute_page'](*DATE_RANGE, list(traffic))
+
+
+def precompute(pages=None, presets=None):
+    '''Grava os snapshots de todas as páginas para os presets e remove os das
+        versões antigas do dataset.
+
+        Input: prefixos das páginas (None: todas) e nomes dos presets
+               (None: todos)
+        Output: dict com versão, snapshots gravados e tempo por página
+    '''
+    # Todas as páginas e presets usam a mesma versão do dataset
+    version = pin_dataset()['key']
+
+    paths = sorted(glob.glob(os.path.join(PAGES_DIR, '*.py')))
+    if pages:
+        paths = [path for path in paths
+                 if os.path.basename(path).startswith(tuple(pages))]
+
+    timings = {}
+    record_snapshots(True)
+    try:
+        for name, traffic in PRESETS.items():
+            if presets and name not in presets:
+                continue
+            for path in paths:
+                start = time.perf_counter()
+                run_page(path, traffic)
+                page = os.path.basename(path)
+                timings[page] = timings.get(page, 0.0) + time.perf_counter() - start
+    finally:
+        record_snapshots(False)
+
+    return {'version': version, 'removed': prune_snapshots(version),
+            'snapshots': snapshot_count(version), 'timings': timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', nargs='+', metavar='PREFIXO',
+                        help='páginas a pré-calcular (ex.: 01 03)')
+    parser.add_argument('--presets', nargs='+', choices=list(PRESETS),
+                        help='presets de filtros a pré-calcular')
+    args = parser.parse_args()
+
+    # Sem servidor o Streamlit registra avisos de contexto ausente; só os erros interessam
+    streamlit.logger.set_log_level('error')
+
+    result = precompute(args.pages, args.presets)
+    for page, seconds in result['timings'].items():
+        print(f'{page}: {seconds:.2f} s')
+    print(f'{result["snapshots"]} snapshots em {SNAPSHOT_DIR} '
+          f'({result["removed"]} versões antigas removidas)')
+
+
+if __name__ == '__main__':
+    main()
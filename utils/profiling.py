@@ -0,0 +1,196 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Diretório onde o trace de cada rerun é gravado automaticamente (opcional)
+TRACE_DIR = os.environ.get('CURRY_TRACE_DIR')
+
+TRACE_COLUMNS = ['stage', 'depth', 'seconds', 'rows_in', 'rows_out',
+                 'alloc_mb', 'peak_mb']
+
+# Trace do rerun atual: cada sessão do Streamlit roda o script na sua thread
+_local = threading.local()
+
+# O tracemalloc é global ao processo: contagem das sessões que medem
+# alocações, para que só a última a terminar o desligue
+_memory_lock = threading.Lock()
+_memory_sessions = 0
+_memory_started = False
+
+
+def _acquire_memory():
+    global _memory_sessions, _memory_started
+    with _memory_lock:
+        if _memory_sessions == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _memory_started = True
+        _memory_sessions += 1
+
+
+def _release_memory():
+    global _memory_sessions, _memory_started
+    with _memory_lock:
+        _memory_sessions -= 1
+        # Só desliga o que foi ligado aqui (não o python -X tracemalloc)
+        if _memory_sessions == 0 and _memory_started:
+            tracemalloc.stop()
+            _memory_started = False
+
+
+def start_trace(enabled, memory=False, name='page'):
+    '''Inicia o registro das etapas do rerun da thread atual. Desligado, as
+        funções instrumentadas apenas consultam um atributo e seguem.
+
+        O tracemalloc é ligado enquanto houver alguma sessão medindo
+        alocações e desligado pelo finish_trace da última delas.
+
+        Input: liga/desliga, medir alocações (tracemalloc, mais lento) e
+               nome do trace
+        Output: lista de etapas (None quando desligado)
+    '''
+    # Rerun anterior interrompido antes do finish_trace
+    if getattr(_local, 'memory', False):
+        _release_memory()
+    _local.memory = False
+
+    if not enabled:
+        _local.trace = None
+        return None
+
+    if memory:
+        _acquire_memory()
+        _local.memory = True
+
+    _local.trace = []
+    _local.depth = 0
+    _local.name = name
+
+    return _local.trace
+
+
+def _rows(value):
+    # Linhas de Dataframes, Series e arrays; None para os demais valores
+    if isinstance(value, (pd.DataFrame, pd.Series)) or hasattr(value, 'shape'):
+        return len(value)
+
+    return None
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    '''Mede uma etapa: tempo de parede, linhas de entrada/saída e, com
+        medição de alocações ligada, o saldo e o pico de alocação. O
+        tracemalloc é do processo: saldo e pico incluem as alocações das
+        outras sessões no mesmo intervalo, e o pico zerado a cada etapa
+        (reset_peak) também é o delas. Os valores são confiáveis com uma
+        sessão medindo por vez; o pico de etapas com etapas internas é
+        aproximado.
+
+        Input: nome da etapa e linhas de entrada
+        Output: registro da etapa (dict) ou None quando desligado
+    '''
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        yield None
+        return
+
+    record = {'stage': name, 'depth': _local.depth, 'rows_in': rows_in, 'rows_out': None}
+    trace.append(record)
+
+    memory = _local.memory
+    if memory:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+
+    _local.depth += 1
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        _local.depth -= 1
+
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            record['alloc_mb'] = (current - before) / 2**20
+            record['peak_mb'] = (peak - before) / 2**20
+
+
+def profiled(func=None, *, name=None):
+    '''Decorador que registra cada chamada da função como uma etapa do
+        trace (linhas de entrada = primeiro argumento, de saída = retorno).
+
+        Input: função (uso @profiled) ou nome da etapa (@profiled(name=...))
+        Output: função instrumentada
+    '''
+    if func is None:
+        return functools.partial(profiled, name=name)
+
+    label = name or func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if getattr(_local, 'trace', None) is None:
+            return func(*args, **kwargs)
+
+        with stage(label, _rows(args[0]) if args else None) as record:
+            result = func(*args, **kwargs)
+            record['rows_out'] = _rows(result)
+
+        return result
+
+    return wrapper
+
+
+def trace_frame(trace):
+    '''Trace como Dataframe, uma linha por etapa na ordem de início.
+
+        Input: lista de etapas
+        Output: Dataframe com as colunas TRACE_COLUMNS
+    '''
+    return pd.DataFrame(trace, columns=TRACE_COLUMNS)
+
+
+def export_trace(trace, path):
+    '''Grava o trace em JSON ou CSV, conforme a extensão do arquivo.
+
+        Input: lista de etapas e caminho (.json ou .csv)
+        Output: caminho gravado
+    '''
+    if path.endswith('.csv'):
+        trace_frame(trace).to_csv(path, index=False)
+    else:
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(trace, file, ensure_ascii=False, indent=2, default=str)
+
+    return path
+
+
+def finish_trace():
+    '''Encerra o trace do rerun atual (desligando o tracemalloc se esta era
+        a última sessão medindo alocações); com CURRY_TRACE_DIR definido,
+        grava o trace em JSON nesse diretório.
+
+        Input: None
+        Output: lista de etapas (None quando desligado)
+    '''
+    trace = getattr(_local, 'trace', None)
+    _local.trace = None
+
+    # Libera somente a medição de alocações desta sessão
+    if getattr(_local, 'memory', False):
+        _local.memory = False
+        _release_memory()
+
+    if trace is not None and TRACE_DIR:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        export_trace(trace, os.path.join(TRACE_DIR, f'{_local.name}-{stamp}-{time.perf_counter_ns()}.json'))
+
+    return trace
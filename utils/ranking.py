@@ -0,0 +1,80 @@
+import numpy as np
+
+from utils.profiling import profiled
+from utils.sqlstore import SqlQuery, categorical_index, sql_aggregate, sql_quantile
+
+# Métricas de tempo de entrega usadas no ranking (rótulo -> métrica)
+RANKING_METRICS = {'Máximo': 'max', 'Média': 'mean',
+                   'Mediana': 'p50', 'Percentil 90': 'p90'}
+
+
+def courier_times(df, metric='max'):
+    '''Tempo de entrega de cada entregador em cada cidade, resumido pela
+        métrica escolhida ('max', 'mean' ou percentil 'pNN'). Com o backend
+        SQL o agrupamento é feito no banco.
+
+        Input: Dataframe (ou consulta SQL filtrada) com City,
+               Delivery_person_ID e Time_taken(min)
+        Output: Series indexada por (City, Delivery_person_ID)
+    '''
+    if isinstance(df, SqlQuery):
+        by = ('City', 'Delivery_person_ID')
+        if metric.startswith('p'):
+            return sql_quantile(df, 'Time_taken(min)', by, int(metric[1:]) / 100)
+
+        times = sql_aggregate(df, {metric: (metric, 'Time_taken(min)', by)})[metric]
+        times.index = categorical_index(df, times.index)
+        # O máximo mantém o tipo inteiro da coluna, como no groupby
+        return times.astype(df.dtypes['Time_taken(min)']) if metric == 'max' else times
+
+    grouped = df.loc[:, ['City', 'Delivery_person_ID', 'Time_taken(min)']].groupby(
+        ['City', 'Delivery_person_ID'], observed=True)['Time_taken(min)']
+
+    if metric.startswith('p'):
+        return grouped.quantile(int(metric[1:]) / 100)
+
+    return grouped.agg(metric)
+
+
+def _select(values, k, largest):
+    # Seleção parcial (argpartition, O(n)) e ordenação só dos k escolhidos
+    if largest:
+        values = -values
+
+    if len(values) > k:
+        chosen = np.argpartition(values, k - 1)[:k]
+    else:
+        chosen = np.arange(len(values))
+
+    return chosen[np.lexsort((chosen, values[chosen]))]
+
+
+@profiled
+def top_couriers(df, k=10, metric='max'):
+    '''Os k entregadores mais rápidos e os k mais lentos de cada cidade
+        presente nos dados, calculados na mesma passada: a métrica é
+        calculada uma vez e cada cidade usa seleção parcial nos dois
+        sentidos, sem ordenar o resultado inteiro.
+
+        Input: Dataframe, quantidade por cidade e métrica do ranking
+        Output: (Dataframe dos mais rápidos, Dataframe dos mais lentos)
+    '''
+    times = courier_times(df, metric)
+
+    # groupby ordena pela cidade: cada cidade é um intervalo contíguo
+    cities = times.index.get_level_values('City')
+    values = times.to_numpy(dtype='float64')
+    bounds = np.append(np.flatnonzero(np.r_[True, cities[1:] != cities[:-1]]), len(values))
+    if len(values) == 0:
+        bounds = bounds[-1:]
+
+    fastest, slowest = [], []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        fastest.append(start + _select(values[start:end], k, largest=False))
+        slowest.append(start + _select(values[start:end], k, largest=True))
+
+    def frame(parts):
+        positions = np.concatenate(parts) if parts else np.empty(0, dtype='int64')
+        return times.iloc[positions].reset_index()
+
+    return frame(fastest), frame(slowest)
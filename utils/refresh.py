@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+import traceback
+
+from streamlit import runtime
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from utils.data import DATASET_PATH, refresh_dataset, watch_dataset
+from utils.sqlstore import BACKEND, build_database
+from utils.store import parts_path, rollup_path, store_path
+
+# Segundos sem alterações nos arquivos antes de abrir a versão nova (o CSV
+# ou um lote podem estar sendo gravados em várias escritas)
+REFRESH_DELAY = 2.0
+
+# Atualizadores do processo: caminho do CSV -> (observer, thread)
+_refreshers = {}
+_refreshers_lock = threading.Lock()
+
+
+class DatasetHandler(FileSystemEventHandler):
+    '''Sinaliza alterações no CSV, no arquivo colunar, no cubo ou nos lotes
+        anexados; os demais arquivos do diretório são ignorados.
+    '''
+
+    def __init__(self, path, pending):
+        self.files = {os.path.abspath(name)
+                      for name in (path, store_path(path), rollup_path(path))}
+        self.parts_dir = os.path.abspath(parts_path(path))
+        self.pending = pending
+
+    def _is_dataset_file(self, name):
+        name = os.path.abspath(name)
+        return (name in self.files or name == self.parts_dir
+                or name.startswith(self.parts_dir + os.sep))
+
+    def on_any_event(self, event):
+        names = [event.src_path, getattr(event, 'dest_path', '')]
+        if any(name and self._is_dataset_file(name) for name in names):
+            self.pending.set()
+
+
+def _refresh_loop(path, pending):
+    while True:
+        pending.wait()
+
+        # Espera os arquivos ficarem REFRESH_DELAY segundos sem alteração
+        while pending.is_set():
+            pending.clear()
+            time.sleep(REFRESH_DELAY)
+
+        try:
+            refresh_dataset(path)
+
+            # O banco do backend SQL da versão publicada também sai do
+            # caminho das requisições (nada é feito se ele já existe)
+            if BACKEND == 'sqlite':
+                build_database(path)
+        except Exception:
+            # Arquivo inválido ou incompleto: a versão publicada continua
+            # valendo e a próxima alteração tenta de novo
+            traceback.print_exc()
+
+
+def start_refresher(path=DATASET_PATH):
+    '''Inicia (uma vez por processo) a atualização do dataset em segundo
+        plano: o diretório do CSV é observado (watchdog) e, quando o CSV é
+        substituído ou um lote é anexado, a versão nova é reconstruída e
+        aquecida fora das requisições e trocada atomicamente. Com o backend
+        SQL, o banco de cada versão também é gravado aqui. Sem o servidor
+        do Streamlit (scripts, pré-computação) não faz nada.
+
+        Input: caminho do arquivo CSV
+        Output: True se o atualizador foi iniciado nesta chamada
+    '''
+    if not runtime.exists():
+        return False
+
+    name = os.path.abspath(path)
+    with _refreshers_lock:
+        if name in _refreshers:
+            return False
+
+        watch_dataset(path)
+        pending = threading.Event()
+
+        observer = Observer()
+        observer.schedule(DatasetHandler(path, pending),
+                          os.path.dirname(name), recursive=True)
+        observer.daemon = True
+        observer.start()
+
+        thread = threading.Thread(target=_refresh_loop, args=(path, pending),
+                                  name='dataset-refresher', daemon=True)
+        thread.start()
+
+        # Banco do backend SQL da versão atual, gravado logo na partida
+        if BACKEND == 'sqlite':
+            pending.set()
+
+        _refreshers[name] = (observer, thread)
+
+    return True
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+from utils.profiling import profiled
+from utils.sketch import (DISTANCE_EDGES, TIME_EDGES, approx_unique, hash_values, hist_merge,
+                          histograms_by_group, hll_merge, hll_registers_by_group)
+
+# Chaves do cubo diário
+ROLLUP_KEYS = ['Order_Date', 'City', 'Road_traffic_density']
+
+# Um entregador por célula: chave dos pares distintos (célula, entregador)
+COURIER_KEYS = ROLLUP_KEYS + ['Delivery_person_ID']
+
+# Colunas lidas para montar o cubo
+ROLLUP_COLUMNS = COURIER_KEYS + ['Time_taken(min)', 'distance_km']
+
+
+def _union(codes):
+    return np.unique(np.concatenate(list(codes)))
+
+
+def _time_merge(histograms):
+    return hist_merge(histograms, TIME_EDGES)
+
+
+def _distance_merge(histograms):
+    return hist_merge(histograms, DISTANCE_EDGES)
+
+
+@profiled
+def build_rollup(dataframe):
+    '''Pré-agrega os pedidos por (Order_Date, City, Road_traffic_density).
+        Cada célula do cubo guarda a quantidade de pedidos, o conjunto de
+        entregadores distintos (como array ordenado de IDs) e o sketch
+        HyperLogLog desses entregadores, o que permite calcular os
+        entregadores únicos de qualquer recorte unindo as células, de forma
+        exata (conjuntos) ou aproximada (sketches, ver utils.sketch). Guarda
+        também histogramas fixos do tempo de entrega e da distância, somados
+        para obter percentis de qualquer recorte.
+
+        Input: Dataframe limpo com as colunas ROLLUP_COLUMNS
+        Output: Dataframe do cubo (uma linha por célula)
+    '''
+    keys = dataframe.loc[:, ROLLUP_KEYS]
+
+    orders = keys.groupby(ROLLUP_KEYS, observed=True).size()
+
+    # Histogramas de todas as células em uma passada (mesma ordem das células)
+    rows = keys.groupby(ROLLUP_KEYS, observed=True).ngroup().to_numpy()
+    time_hist = histograms_by_group(dataframe['Time_taken(min)'].to_numpy(dtype='float64', na_value=np.nan),
+                                    rows, len(orders), TIME_EDGES)
+    distance_hist = histograms_by_group(dataframe['distance_km'].to_numpy(dtype='float64', na_value=np.nan),
+                                        rows, len(orders), DISTANCE_EDGES)
+
+    # Pares (célula, entregador) distintos, agrupados por célula
+    pairs = dataframe.loc[:, COURIER_KEYS].drop_duplicates()
+    cells = pairs.groupby(ROLLUP_KEYS, observed=True).ngroup().to_numpy()
+    ids = pairs['Delivery_person_ID'].to_numpy(dtype=object)
+
+    # Entregadores ordenados dentro de cada célula (mesma ordem das células)
+    order = np.lexsort((ids, cells))
+    bounds = np.searchsorted(cells[order], np.arange(len(orders) + 1))
+    couriers = pd.Series([ids[order[start:end]] for start, end in zip(bounds[:-1], bounds[1:])],
+                         index=orders.index, dtype=object)
+
+    # Sketches de todas as células em uma passada
+    registers = hll_registers_by_group(hash_values(pairs['Delivery_person_ID']),
+                                       cells, len(orders))
+    sketches = pd.Series(list(registers), index=orders.index, dtype=object)
+
+    cube = pd.DataFrame({'orders': orders, 'couriers': couriers, 'hll': sketches,
+                         'time_hist': pd.Series(list(time_hist), index=orders.index, dtype=object),
+                         'distance_hist': pd.Series(list(distance_hist), index=orders.index, dtype=object)}
+                        ).reset_index()
+    cube['week_of_day'] = cube['Order_Date'].dt.strftime('%U')
+
+    return cube
+
+
+def merge_rollup(cube, other):
+    '''Combina dois cubos: soma os pedidos e os histogramas, une os
+        conjuntos de entregadores e os sketches das células que existem nos
+        dois.
+
+        Input: dois Dataframes de cubo
+        Output: Dataframe do cubo combinado
+    '''
+    cube = pd.concat([cube, other], ignore_index=True)
+
+    merged = (cube.groupby(ROLLUP_KEYS + ['week_of_day'], observed=True)
+              .agg(orders=('orders', 'sum'), couriers=('couriers', _union),
+                   hll=('hll', hll_merge), time_hist=('time_hist', _time_merge),
+                   distance_hist=('distance_hist', _distance_merge))
+              .reset_index())
+
+    return merged.loc[:, ROLLUP_KEYS + ['orders', 'couriers', 'hll', 'time_hist',
+                                        'distance_hist', 'week_of_day']]
+
+
+@profiled
+def filter_rollup(cube, date_slider, traffic_options, date_start=None):
+    '''Aplica os filtros da barra lateral sobre o cubo (poucas centenas de
+        linhas) em vez de sobre os pedidos.
+
+        Input: cubo, data limite (exclusiva), condições de trânsito e data
+               inicial (inclusiva, opcional)
+        Output: fatia do cubo
+    '''
+    linhas_selecionadas = ((cube['Order_Date'] < date_slider)
+                           & cube['Road_traffic_density'].isin(traffic_options))
+    if date_start is not None:
+        linhas_selecionadas &= cube['Order_Date'] >= date_start
+
+    return cube.loc[linhas_selecionadas, :]
+
+
+def unique_couriers(couriers):
+    '''Quantidade de entregadores distintos em um conjunto de células.
+
+        Input: Series com os arrays de entregadores de cada célula
+        Output: int
+    '''
+    if len(couriers) == 0:
+        return 0
+
+    return len(_union(couriers))
+
+
+def count_couriers(cube, exact=False):
+    '''Entregadores distintos de uma fatia do cubo: exato pela união dos
+        conjuntos ou aproximado pela união dos sketches HyperLogLog.
+
+        Input: fatia do cubo e tipo de contagem
+        Output: int
+    '''
+    if exact:
+        return unique_couriers(cube['couriers'])
+
+    return approx_unique(cube['hll'])
@@ -0,0 +1,38 @@
+import pandas as pd
+import pyarrow as pa
+
+# Versão do schema gravada no arquivo colunar; arquivos de outra versão são
+# reconstruídos automaticamente
+SCHEMA_VERSION = '7'
+
+# Colunas com poucos valores distintos, gravadas como dicionário: na memória
+# viram categorias (códigos inteiros + tabela de valores)
+CATEGORICAL_COLUMNS = ['City', 'Road_traffic_density', 'Weatherconditions',
+                       'Type_of_order', 'Type_of_vehicle', 'Festival',
+                       'Delivery_person_ID', 'Time_Orderd', 'Time_Order_picked']
+
+# Colunas inteiras com faixa de valores pequena. As avaliações continuam
+# float64: em float32 valores como 4.4 voltam como 4.400000095367432
+NARROW_TYPES = {
+    'Delivery_person_Age': pa.int8(),
+    'Vehicle_condition': pa.int8(),
+    'multiple_deliveries': pa.int8(),
+    'Time_taken(min)': pa.int16(),
+}
+
+DATE_COLUMNS = ['Order_Date']
+
+
+def pandas_type(arrow_type):
+    '''Tipo pandas usado para cada tipo Arrow na conversão das colunas:
+        textos de alta cardinalidade (ID) ficam como strings Arrow, que
+        apontam direto para o arquivo mapeado em memória, sem criar um
+        objeto Python por linha.
+
+        Input: pyarrow.DataType
+        Output: dtype pandas (None = conversão padrão)
+    '''
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype('pyarrow')
+
+    return None
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+
+from utils.data import DATASET_PATH
+from utils.store import snapshots_path
+
+# Diretório dos snapshots gerados por utils.precompute
+SNAPSHOT_DIR = snapshots_path(DATASET_PATH)
+
+# Marcador de chave sem snapshot (None é um valor válido de gráfico/tabela)
+MISSING = object()
+
+_recording = False
+
+
+def _digest(value):
+    # repr das chaves (versão do dataset, datas e tuplas) é estável entre processos
+    return hashlib.sha1(repr(value).encode()).hexdigest()
+
+
+def _version_dir(version, directory):
+    return os.path.join(directory, _digest(version))
+
+
+def _entry_path(key, directory):
+    # key = (chart_id, filters) e filters[0] é a versão do dataset
+    return os.path.join(_version_dir(key[1][0], directory), _digest(key) + '.pkl')
+
+
+def record_snapshots(enabled=True):
+    '''Liga ou desliga a gravação em disco de tudo o que o memoize calcular.
+        Usado pela pré-computação (utils.precompute); as páginas só leem.
+
+        Input: True para gravar
+    '''
+    global _recording
+    _recording = enabled
+
+
+def is_recording():
+    return _recording
+
+
+def read_snapshot(key, directory=SNAPSHOT_DIR):
+    '''Lê o gráfico ou tabela pré-calculado para a chave do memoize.
+
+        Input: chave (identificador do gráfico, filtros)
+        Output: valor guardado ou MISSING
+    '''
+    try:
+        with open(_entry_path(key, directory), 'rb') as file:
+            return pickle.load(file)
+    except FileNotFoundError:
+        return MISSING
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        # Snapshot de outra versão do código: é recalculado normalmente
+        return MISSING
+
+
+def write_snapshot(key, value, directory=SNAPSHOT_DIR):
+    '''Grava o gráfico ou tabela da chave do memoize. A escrita vai para um
+        arquivo temporário renomeado no final, então as páginas nunca leem
+        um snapshot pela metade.
+
+        Input: chave (identificador do gráfico, filtros) e valor
+        Output: caminho do arquivo gravado
+    '''
+    path = _entry_path(key, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    return path
+
+
+def prune_snapshots(version, directory=SNAPSHOT_DIR):
+    '''Remove os snapshots de versões antigas do dataset.
+
+        Input: versão atual (dataset_version())
+        Output: quantidade de versões removidas
+    '''
+    if not os.path.isdir(directory):
+        return 0
+
+    current = os.path.basename(_version_dir(version, directory))
+    removed = 0
+    for name in os.listdir(directory):
+        if name != current:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+            removed += 1
+
+    return removed
+
+
+def snapshot_count(version, directory=SNAPSHOT_DIR):
+    '''Quantidade de snapshots gravados para uma versão do dataset.
+
+        Input: versão (dataset_version())
+        Output: inteiro
+    '''
+    path = _version_dir(version, directory)
+    if not os.path.isdir(path):
+        return 0
+
+    return sum(name.endswith('.pkl') for name in os.listdir(path))
@@ -0,0 +1,524 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from utils.data import DATASET_PATH, dataset_version, load_filtered, load_table
+from utils.geo import density_frame
+from utils.profiling import profiled
+from utils.store import column_to_pandas, sorted_dictionaries, sqlite_path, unify_dictionaries
+
+# Backend das páginas: 'pandas' (padrão, Dataframe em memória) ou 'sqlite'
+BACKEND = os.environ.get('CURRY_BACKEND', 'pandas')
+
+# Colunas indexadas no banco (filtros e agrupamentos das páginas)
+INDEXED_COLUMNS = ['Order_Date', 'City', 'Road_traffic_density', 'Delivery_person_ID']
+
+# Linhas convertidas para objetos Python e gravadas por INSERT: limita a
+# memória da gravação, que não depende do tamanho do dataset
+INSERT_ROWS = 10_000
+
+NS_PER_DAY = 86_400 * 10**9
+
+# Bancos mantidos no diretório: o atual e o anterior, ainda usado pelas
+# sessões que fixaram a versão antiga no meio de um rerun
+KEEP_DATABASES = 2
+
+# Esquema de cada banco aberto: caminho -> categorias e tipos das colunas
+_schemas = {}
+_build_lock = threading.Lock()
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def database_path(version, path=DATASET_PATH):
+    '''Caminho do banco SQLite de uma versão do dataset.
+
+        Input: versão (dataset_version()) e caminho do CSV
+        Output: caminho do arquivo .db
+    '''
+    digest = hashlib.sha1(repr(version).encode()).hexdigest()
+    return os.path.join(sqlite_path(path), digest + '.db')
+
+
+def _column_kind(arrow_type):
+    # Tipo da coluna no banco: categorias (códigos), datas (ns) e inteiros
+    # como INTEGER
+    if pa.types.is_floating(arrow_type):
+        return 'REAL'
+
+    if pa.types.is_dictionary(arrow_type) or pa.types.is_integer(arrow_type) \
+            or pa.types.is_date(arrow_type) or pa.types.is_boolean(arrow_type):
+        return 'INTEGER'
+
+    return 'TEXT'
+
+
+def _column_values(column):
+    # Valores de uma coluna de um lote: categorias viram códigos, datas
+    # viram inteiros (ns) e os ausentes viram NULL (NaN também, pelo SQLite)
+    if pa.types.is_dictionary(column.type):
+        column = column.indices
+    elif pa.types.is_date(column.type):
+        column = pc.multiply(column.cast(pa.int32()).cast(pa.int64()), NS_PER_DAY)
+
+    # Pelo numpy a conversão é bem mais rápida; inteiros com ausentes
+    # virariam float, então só eles passam pelo to_pylist (None)
+    if column.null_count and not pa.types.is_floating(column.type):
+        return column.to_pylist()
+
+    return column.to_numpy(zero_copy_only=False).tolist()
+
+
+def _dtype_name(dtype):
+    # 'string' sozinho vira string[python] ao ser lido; o armazenamento é mantido
+    if isinstance(dtype, pd.StringDtype):
+        return f'string[{dtype.storage}]'
+    return str(dtype)
+
+
+def _write_orders(conn, table, version):
+    names = table.column_names
+    dictionaries = sorted_dictionaries([table])
+
+    conn.execute('CREATE TABLE orders ({})'.format(
+        ', '.join(f'{_quote(name)} {_column_kind(table.schema.field(name).type)}'
+                  for name in names)))
+
+    # As linhas entram na ordem da tabela (por data), em lotes de registros
+    # lidos do memory-map: rowid = posição
+    insert = 'INSERT INTO orders VALUES ({})'.format(', '.join('?' * len(names)))
+    for batch in table.to_batches(max_chunksize=INSERT_ROWS):
+        batch = unify_dictionaries(pa.Table.from_batches([batch]), dictionaries)
+        conn.executemany(insert, zip(*(_column_values(batch[name].combine_chunks())
+                                       for name in names)))
+
+    for name in INDEXED_COLUMNS:
+        conn.execute(f'CREATE INDEX {_quote("idx_" + name)} ON orders ({_quote(name)})')
+
+    # Mesmas categorias do Dataframe (column_to_pandas): dicionários unidos
+    # em ordem alfabética
+    conn.execute('CREATE TABLE categories (name TEXT, code INTEGER, label TEXT)')
+    conn.executemany('INSERT INTO categories VALUES (?, ?, ?)',
+                     [(name, code, label)
+                      for name, dictionary in dictionaries.items()
+                      for code, label in enumerate(dictionary.to_pylist())])
+
+    conn.execute('CREATE TABLE columns (name TEXT, dtype TEXT)')
+    conn.executemany('INSERT INTO columns VALUES (?, ?)',
+                     [(name, _dtype_name(column_to_pandas(table.slice(0, 0), name).dtype))
+                      for name in names])
+
+    conn.execute('CREATE TABLE meta (key TEXT, value TEXT)')
+    conn.execute("INSERT INTO meta VALUES ('version', ?)", (repr(version),))
+
+    conn.execute('ANALYZE')
+    conn.commit()
+
+
+def _prune(directory):
+    databases = sorted((name for name in os.listdir(directory) if name.endswith('.db')),
+                       key=lambda name: os.path.getmtime(os.path.join(directory, name)))
+    for name in databases[:-KEEP_DATABASES]:
+        os.remove(os.path.join(directory, name))
+
+
+@profiled
+def build_database(path=DATASET_PATH):
+    '''Grava o dataset limpo da versão atual em um banco SQLite, com índices
+        em Order_Date, City, Road_traffic_density e Delivery_person_ID. As
+        linhas são lidas da tabela Arrow (memory-map) e gravadas em lotes de
+        INSERT_ROWS, na mesma ordem do Dataframe; as categorias são gravadas
+        como códigos inteiros (mesma ordem das categorias do pandas). O
+        banco é gravado em um arquivo temporário renomeado no final; se já
+        existe para a versão, nada é feito. Chamado pela ingestão
+        (utils.ingest) e pelo atualizador em segundo plano (utils.refresh),
+        nunca durante o rerun das páginas.
+
+        Input: caminho do arquivo CSV
+        Output: caminho do banco
+    '''
+    version, table = load_table(path)
+    database = database_path(version, path)
+    if os.path.exists(database):
+        return database
+
+    with _build_lock:
+        if os.path.exists(database):
+            return database
+
+        directory = os.path.dirname(database)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            with closing(sqlite3.connect(tmp_path)) as conn:
+                _write_orders(conn, table, version)
+            os.replace(tmp_path, database)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        _prune(directory)
+
+    return database
+
+
+def _schema(database):
+    # Lido uma vez por banco: os bancos nunca são alterados depois de gravados
+    schema = _schemas.get(database)
+    if schema is None:
+        with closing(sqlite3.connect(f'file:{database}?mode=ro', uri=True)) as conn:
+            labels = {}
+            for name, label in conn.execute(
+                    'SELECT name, label FROM categories ORDER BY name, code'):
+                labels.setdefault(name, []).append(label)
+            dtypes = dict(conn.execute('SELECT name, dtype FROM columns'))
+
+        schema = {'categories': {name: pd.Index(values) for name, values in labels.items()},
+                  'dtypes': dtypes}
+        _schemas[database] = schema
+
+    return schema
+
+
+class SqlQuery:
+    '''Filtros da barra lateral traduzidos para uma cláusula WHERE sobre o
+        banco de uma versão do dataset. As funções sql_* executam a
+        agregação no banco e só o resultado (pequeno) volta para o Python.
+    '''
+
+    def __init__(self, database, where, params):
+        self.database = database
+        self.where = where
+        self.params = params
+
+        schema = _schema(database)
+        self.categories = schema['categories']
+        self.dtypes = schema['dtypes']
+
+    def execute(self, sql, **params):
+        '''Executa uma consulta somente leitura no banco.
+
+            Input: SQL (pode usar a cláusula self.where) e parâmetros extras
+            Output: lista de tuplas
+        '''
+        with closing(sqlite3.connect(f'file:{self.database}?mode=ro', uri=True)) as conn:
+            return conn.execute(sql, {**self.params, **params}).fetchall()
+
+    def decode(self, name, values):
+        '''Converte os valores de uma coluna lidos do banco para o tipo do
+            Dataframe (categorias, datas, inteiros estreitos).
+
+            Input: nome da coluna e lista de valores
+            Output: Series
+        '''
+        dtype = self.dtypes[name]
+        if name in self.categories:
+            codes = np.array([-1 if code is None else code for code in values], dtype='int64')
+            return pd.Series(pd.Categorical.from_codes(codes, categories=self.categories[name]),
+                             name=name)
+
+        if dtype.startswith('datetime64'):
+            return pd.Series(pd.array(values, dtype='Int64'), name=name).astype(dtype)
+
+        if dtype.startswith(('float', 'string')):
+            return pd.Series(values, name=name, dtype=dtype)
+
+        # Inteiros sem ausentes (a limpeza descarta as linhas incompletas)
+        return pd.Series(np.array(values, dtype='int64'), name=name).astype(dtype)
+
+    def labels(self, name, values):
+        # Rótulos de um agrupamento lido do banco (códigos -> categorias)
+        if name in self.categories:
+            return self.categories[name].take(np.array(values, dtype='int64'))
+
+        return pd.Index(self.decode(name, values), name=name)
+
+
+def open_query(date_slider, traffic_options, date_start=None, path=DATASET_PATH):
+    '''Consulta filtrada pelo período e pelas condições de trânsito, sobre
+        o banco da versão do dataset fixada no rerun (ver build_database).
+        Mesma semântica do load_filtered: data inicial inclusiva, data
+        limite exclusiva e, com todas as condições marcadas, nenhum filtro
+        de trânsito.
+
+        Input: data limite (exclusiva), condições de trânsito, data inicial
+               (inclusiva, opcional) e caminho do arquivo CSV
+        Output: SqlQuery ou None quando o banco da versão ainda não foi gravado
+    '''
+    database = database_path(dataset_version(path), path)
+    if not os.path.exists(database):
+        return None
+
+    schema = _schema(database)
+
+    clauses = ['"Order_Date" < :date_end']
+    params = {'date_end': pd.Timestamp(date_slider).value}
+    if date_start is not None:
+        clauses.append('"Order_Date" >= :date_start')
+        params['date_start'] = pd.Timestamp(date_start).value
+
+    labels = schema['categories']['Road_traffic_density']
+    if not set(labels).issubset(traffic_options):
+        codes = [str(code) for code, label in enumerate(labels) if label in traffic_options]
+        clauses.append(f'"Road_traffic_density" IN ({", ".join(codes)})')
+
+    return SqlQuery(database, ' AND '.join(clauses), params)
+
+
+def filtered_source(columns, date_slider, traffic_options, date_start=None,
+                    path=DATASET_PATH):
+    '''Dados filtrados usados pelas funções das páginas: o Dataframe do
+        load_filtered (backend pandas) ou a consulta SQL equivalente
+        (backend sqlite, variável de ambiente CURRY_BACKEND). Enquanto o
+        banco da versão não é gravado em segundo plano, o backend sqlite
+        usa o Dataframe (mesmos resultados).
+
+        Input: colunas usadas pela página, data limite (exclusiva),
+               condições de trânsito, data inicial (inclusiva, opcional) e
+               caminho do arquivo CSV
+        Output: Dataframe ou SqlQuery
+    '''
+    if BACKEND == 'sqlite':
+        query = open_query(date_slider, traffic_options, date_start, path)
+        if query is not None:
+            return query
+
+    return load_filtered(columns, date_slider, traffic_options, date_start, path)
+
+
+def _keys(by):
+    if by is None:
+        return ()
+    return by if isinstance(by, tuple) else (by,)
+
+
+def _group_index(query, by, rows):
+    # Índice dos grupos a partir das primeiras colunas do resultado
+    keys = _keys(by)
+    levels = [query.labels(name, [row[i] for row in rows]) for i, name in enumerate(keys)]
+    if len(keys) == 1:
+        return levels[0].rename(keys[0])
+
+    return pd.MultiIndex.from_arrays(levels, names=list(keys))
+
+
+def categorical_index(query, index):
+    '''Troca os níveis de colunas categóricas do índice por
+        CategoricalIndex com todas as categorias, como no índice do groupby
+        (o aggregate, como o sql_aggregate, devolve rótulos simples).
+
+        Input: SqlQuery e índice (simples ou MultiIndex)
+        Output: índice
+    '''
+    def level(values):
+        if values.name not in query.categories:
+            return values
+        return pd.CategoricalIndex(values, categories=query.categories[values.name],
+                                   name=values.name)
+
+    if isinstance(index, pd.MultiIndex):
+        return pd.MultiIndex.from_arrays(
+            [level(index.get_level_values(i)) for i in range(index.nlevels)],
+            names=index.names)
+
+    return level(index)
+
+
+def _key_filter(query, keys):
+    return ' AND '.join([query.where] + [f'{_quote(name)} IS NOT NULL' for name in keys])
+
+
+@profiled
+def sql_aggregate(query, metrics):
+    '''Mesmas métricas e mesmo resultado do utils.aggregate.aggregate,
+        calculados no banco: uma consulta agrupada por agrupamento. O desvio
+        padrão usa a média do grupo (função de janela) e a raiz é tirada no
+        Python, pois o SQLite não tem SQRT/STDEV.
+
+        Input: SqlQuery e dict nome -> (função, coluna, agrupamento)
+        Output: dict nome -> escalar (sem agrupamento) ou Series indexada
+                pelos grupos presentes nos dados
+    '''
+    plan = {}
+    for func, column, by in metrics.values():
+        plan.setdefault(by, set()).add((func, column))
+
+    values = {}
+    for by, needed in plan.items():
+        keys = _keys(by)
+        columns = sorted({column for _, column in needed})
+        stds = sorted({column for func, column in needed if func == 'std'})
+
+        inner = [f'{_quote(name)} AS k{i}' for i, name in enumerate(keys)]
+        inner += [f'{_quote(name)} AS c{columns.index(name)}' for name in columns]
+        partition = ', '.join(_quote(name) for name in keys)
+        inner += [f'AVG({_quote(name)}) OVER (PARTITION BY {partition}) AS m{columns.index(name)}'
+                  if keys else f'AVG({_quote(name)}) OVER () AS m{columns.index(name)}'
+                  for name in stds]
+
+        expressions = {'count': 'COUNT(c{0})', 'sum': 'TOTAL(c{0})', 'mean': 'AVG(c{0})',
+                       'min': 'MIN(c{0})', 'max': 'MAX(c{0})', 'nunique': 'COUNT(DISTINCT c{0})',
+                       'std': 'SUM((c{0} - m{0}) * (c{0} - m{0}))'}
+        needed = sorted(needed | {('count', column) for func, column in needed if func == 'std'})
+        outer = [f'k{i}' for i in range(len(keys))]
+        outer += [expressions[func].format(columns.index(column)) for func, column in needed]
+
+        sql = (f'SELECT {", ".join(outer)} FROM '
+               f'(SELECT {", ".join(inner)} FROM orders WHERE {_key_filter(query, keys)})')
+        if keys:
+            group = ', '.join(f'k{i}' for i in range(len(keys)))
+            sql += f' GROUP BY {group} ORDER BY {group}'
+
+        rows = query.execute(sql)
+        index = _group_index(query, by, rows) if keys else None
+        for position, (func, column) in enumerate(needed, start=len(keys)):
+            dtype = 'int64' if func == 'nunique' else 'float64'
+            values[func, column, by] = np.array([row[position] for row in rows], dtype=dtype)
+        values[None, None, by] = index
+
+    results = {}
+    for name, (func, column, by) in metrics.items():
+        result = values[func, column, by]
+        if func == 'std':
+            n = values['count', column, by]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result = np.where(n > 1, np.sqrt(np.maximum(result / (n - 1), 0)), np.nan)
+
+        if by is None:
+            value = result[0]
+            # Mínimo e máximo de colunas inteiras continuam inteiros
+            dtype = np.dtype(query.dtypes[column]) if column not in query.categories else None
+            if func in ('min', 'max') and dtype is not None and dtype.kind in 'iu' \
+                    and not np.isnan(value):
+                value = dtype.type(value)
+            results[name] = value
+        else:
+            results[name] = pd.Series(result, name=column, index=values[None, None, by])
+
+    return results
+
+
+@profiled
+def sql_quantile(query, column, by, q, interpolation='linear'):
+    '''Quantil de uma coluna por grupo calculado no banco, com a mesma
+        regra do groupby().quantile() do pandas: a posição q * (n - 1) é
+        localizada com ROW_NUMBER e só os dois valores vizinhos de cada
+        grupo voltam para o Python. interpolation='midpoint' com q=0.5
+        equivale ao groupby().median().
+
+        Input: SqlQuery, coluna, agrupamento (coluna ou tupla), quantil e
+               interpolação ('linear' ou 'midpoint')
+        Output: Series indexada pelos grupos (categorias como no groupby)
+    '''
+    keys = _keys(by)
+    partition = ', '.join(_quote(name) for name in keys)
+    group = ', '.join(f'k{i}' for i in range(len(keys)))
+    columns = ', '.join(f'{_quote(name)} AS k{i}' for i, name in enumerate(keys))
+
+    rows = query.execute(
+        f'SELECT {group}, n, i, x FROM ('
+        f'SELECT {columns}, {_quote(column)} AS x, '
+        f'ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY {_quote(column)}) - 1 AS i, '
+        f'COUNT(*) OVER (PARTITION BY {partition}) AS n '
+        f'FROM orders WHERE {_key_filter(query, keys)} AND {_quote(column)} IS NOT NULL) '
+        f'WHERE i = CAST(:q * (n - 1) AS INTEGER) OR i = CAST(:q * (n - 1) AS INTEGER) + 1 '
+        f'ORDER BY {group}, i', q=q)
+
+    groups, result = [], []
+    width = len(keys)
+    for row in rows:
+        if groups and row[:width] == groups[-1][:width]:
+            # Segundo vizinho do grupo: interpolação
+            low = result[-1]
+            frac = q * (row[width] - 1) % 1
+            if frac != 0:
+                result[-1] = (low + (row[-1] - low) * frac if interpolation == 'linear'
+                              else (low + row[-1]) / 2.0)
+        else:
+            groups.append(row)
+            result.append(float(row[-1]))
+
+    return pd.Series(np.array(result, dtype='float64'), name=column,
+                     index=categorical_index(query, _group_index(query, by, groups)))
+
+
+@profiled
+def sql_grid_density(query, lat, lon, cell_deg):
+    '''Contagem por célula da grade (mesmo resultado do
+        utils.geo.grid_density) agrupada no banco; volta uma linha por
+        célula não vazia.
+
+        Input: SqlQuery, colunas de latitude/longitude e lado da célula
+        Output: Dataframe com o centro de cada célula e a contagem
+    '''
+    # floor() sem as funções matemáticas opcionais do SQLite
+    def floor(name):
+        x = f'({_quote(name)} / :cell)'
+        return f'(CAST({x} AS INTEGER) - ({x} < CAST({x} AS INTEGER)))'
+
+    offset = int(np.ceil(180 / cell_deg)) + 1
+    rows = query.execute(
+        f'SELECT ({floor(lat)} + :offset) * :width + ({floor(lon)} + :offset) AS cell, '
+        f'COUNT(*) FROM orders WHERE {_key_filter(query, (lat, lon))} '
+        f'GROUP BY cell ORDER BY cell',
+        cell=cell_deg, offset=offset, width=2 * offset)
+
+    return density_frame(np.array([row[0] for row in rows], dtype='int64'),
+                         np.array([row[1] for row in rows], dtype='int64'), cell_deg)
+
+
+def _frame(query, columns, rows):
+    return pd.DataFrame({name: query.decode(name, [row[i] for row in rows])
+                         for i, name in enumerate(columns)})
+
+
+@profiled
+def sql_frame(query, columns):
+    '''Linhas filtradas de algumas colunas, na mesma ordem do Dataframe do
+        load_filtered (usado quando a página precisa das linhas, como no
+        índice espacial em grade).
+
+        Input: SqlQuery e colunas
+        Output: Dataframe
+    '''
+    rows = query.execute(f'SELECT {", ".join(_quote(name) for name in columns)} '
+                         f'FROM orders WHERE {query.where} ORDER BY rowid')
+
+    return _frame(query, columns, rows)
+
+
+@profiled
+def sql_sample(query, columns, n, seed=0):
+    '''Amostra de n linhas igual à do DataFrame.sample(n, random_state=seed)
+        sobre o resultado do load_filtered: as posições sorteadas no Python
+        são buscadas no banco (json_each) e só elas voltam.
+
+        Input: SqlQuery, colunas, tamanho da amostra e semente
+        Output: Dataframe (todas as linhas quando há no máximo n)
+    '''
+    total = query.execute(f'SELECT COUNT(*) FROM orders WHERE {query.where}')[0][0]
+    if total <= n:
+        return sql_frame(query, columns)
+
+    positions = np.random.RandomState(seed).choice(total, size=n, replace=False)
+    selected = ', '.join(f'r.{_quote(name)}' for name in columns)
+    rows = query.execute(
+        f'SELECT {selected} FROM (SELECT ROW_NUMBER() OVER (ORDER BY rowid) - 1 AS pos, '
+        f'{", ".join(_quote(name) for name in columns)} FROM orders WHERE {query.where}) AS r '
+        f'JOIN json_each(:positions) AS p ON p.value = r.pos ORDER BY p.key',
+        positions=json.dumps(positions.tolist()))
+
+    return _frame(query, columns, rows)
@@ -0,0 +1,352 @@
+import glob
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+
+from utils.index import sort_order
+from utils.schema import (CATEGORICAL_COLUMNS, DATE_COLUMNS, NARROW_TYPES,
+                          SCHEMA_VERSION, pandas_type)
+
+DICTIONARY_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+STORE_SUFFIX = '.feather'
+PARTS_SUFFIX = '.parts'
+ROLLUP_SUFFIX = '.rollup.feather'
+SNAPSHOTS_SUFFIX = '.snapshots'
+SQLITE_SUFFIX = '.sqlite'
+
+# Linhas (aproximadas) de cada lote de registros gravado no arquivo colunar
+BATCH_ROWS = 64 * 1024
+
+
+def store_path(csv_path):
+    '''Caminho do arquivo colunar correspondente a um CSV.
+
+        Input: caminho do CSV
+        Output: caminho do arquivo .feather
+    '''
+    return os.path.splitext(csv_path)[0] + STORE_SUFFIX
+
+
+def parts_path(csv_path):
+    '''Diretório com os lotes incrementais anexados ao arquivo colunar.
+
+        Input: caminho do CSV
+        Output: caminho do diretório de lotes
+    '''
+    return os.path.splitext(csv_path)[0] + PARTS_SUFFIX
+
+
+def rollup_path(csv_path):
+    '''Caminho do cubo diário persistido (ver utils.rollup).
+
+        Input: caminho do CSV
+        Output: caminho do arquivo do cubo
+    '''
+    return os.path.splitext(csv_path)[0] + ROLLUP_SUFFIX
+
+
+def snapshots_path(csv_path):
+    '''Diretório dos gráficos e tabelas pré-calculados (ver utils.snapshot).
+
+        Input: caminho do CSV
+        Output: caminho do diretório de snapshots
+    '''
+    return os.path.splitext(csv_path)[0] + SNAPSHOTS_SUFFIX
+
+
+def sqlite_path(csv_path):
+    '''Diretório dos bancos SQLite do backend SQL, um por versão do dataset
+        (ver utils.sqlstore).
+
+        Input: caminho do CSV
+        Output: caminho do diretório dos bancos
+    '''
+    return os.path.splitext(csv_path)[0] + SQLITE_SUFFIX
+
+
+def is_stale(csv_path, path):
+    '''Indica se o arquivo colunar precisa ser reconstruído: quando ele não
+        existe, foi gravado com outra versão do schema ou quando o CSV foi
+        modificado depois dele.
+
+        Input: caminho do CSV e do arquivo colunar
+        Output: bool
+    '''
+    if not os.path.exists(path):
+        return True
+
+    metadata = pa.ipc.open_file(pa.memory_map(path, 'r')).schema.metadata or {}
+    if metadata.get(b'schema_version') != SCHEMA_VERSION.encode():
+        return True
+
+    if not os.path.exists(csv_path):
+        return False
+
+    return os.stat(csv_path).st_mtime_ns > os.stat(path).st_mtime_ns
+
+
+def to_arrow(dataframe):
+    '''Converte o Dataframe limpo em uma tabela Arrow tipada conforme o
+        utils.schema: colunas de baixa cardinalidade como dicionário, números
+        com o menor tipo que comporta os valores e datas como date32.
+
+        Input: Dataframe limpo
+        Output: pyarrow.Table
+    '''
+    table = pa.Table.from_pandas(dataframe, preserve_index=False)
+
+    # Pedaço sem nenhuma linha: as colunas de texto chegam sem tipo (null)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(i, field.name, table[field.name].cast(pa.string()))
+
+    for name in CATEGORICAL_COLUMNS:
+        column = table[name]
+        if not pa.types.is_dictionary(column.type):
+            column = pc.dictionary_encode(column)
+
+        # Mesmo tipo de índice em todos os lotes, para poder concatená-los
+        column = column.cast(DICTIONARY_TYPE)
+        table = table.set_column(table.schema.get_field_index(name),
+                                 name, column)
+
+    # A conversão é checada: um valor fora da faixa do tipo gera erro
+    for name, arrow_type in NARROW_TYPES.items():
+        table = table.set_column(table.schema.get_field_index(name),
+                                 name, table[name].cast(arrow_type))
+
+    for name in DATE_COLUMNS:
+        table = table.set_column(table.schema.get_field_index(name),
+                                 name, table[name].cast(pa.date32()))
+
+    return table.replace_schema_metadata({'schema_version': SCHEMA_VERSION})
+
+
+def write_store(table, path):
+    '''Grava a tabela em formato Feather (Arrow IPC) sem compressão, para
+        que possa ser lida via memory-map sem cópias. A escrita é atômica:
+        leitores abertos continuam enxergando a versão anterior.
+
+        Input: pyarrow.Table e caminho de destino
+        Output: caminho gravado
+    '''
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+
+    return path
+
+
+def sorted_dictionaries(tables):
+    '''União dos valores de cada coluna de dicionário de todos os lotes, em
+        ordem alfabética: as categorias não dependem da divisão em pedaços,
+        da quantidade de processos nem da ordem das linhas no CSV.
+
+        Input: lista de pyarrow.Table
+        Output: dict coluna -> dicionário (pyarrow.Array)
+    '''
+    dictionaries = {}
+    for name in CATEGORICAL_COLUMNS:
+        values = [chunk.dictionary for table in tables for chunk in table[name].chunks]
+        values = pc.unique(pa.concat_arrays(values or [pa.array([], pa.string())]))
+        dictionaries[name] = values.take(pc.sort_indices(values))
+
+    return dictionaries
+
+
+def unify_dictionaries(table, dictionaries):
+    '''Reescreve os índices das colunas de dicionário de um lote para os
+        dicionários comuns a todos os lotes (sorted_dictionaries).
+
+        Input: pyarrow.Table e dict coluna -> dicionário
+        Output: pyarrow.Table
+    '''
+    for name in CATEGORICAL_COLUMNS:
+        known = dictionaries[name]
+        chunks = []
+        for chunk in table[name].chunks:
+            if not chunk.dictionary.equals(known):
+                mapping = pc.index_in(chunk.dictionary, value_set=known).cast(pa.int32())
+                chunk = pa.DictionaryArray.from_arrays(mapping.take(chunk.indices), known)
+            chunks.append(chunk)
+
+        table = table.set_column(table.schema.get_field_index(name), name,
+                                 pa.chunked_array(chunks, DICTIONARY_TYPE))
+
+    return table
+
+
+def order_days(table):
+    '''Dia de cada linha da tabela como inteiro (dias desde 1970), lido
+        direto da coluna date32.
+
+        Input: pyarrow.Table
+        Output: array de int32
+    '''
+    return table['Order_Date'].cast(pa.int32()).to_numpy()
+
+
+def _sort_by_date(table):
+    # Pedaço (ou lote) ordenado por Order_Date; o custo é o do próprio pedaço
+    order = sort_order(order_days(table))
+    if order is None:
+        return table
+
+    return table.take(order)
+
+
+def write_store_tables(tables, path):
+    '''Grava o arquivo colunar a partir de tabelas Arrow já tipadas (os
+        pedaços do CSV gravados pela ingestão, serial ou paralela, e lidos
+        via memory-map, ou os lotes anexados). Todos os pedaços passam a
+        usar o mesmo dicionário por coluna, com os valores em ordem
+        alfabética, e as linhas são gravadas ordenadas por Order_Date:
+        cada pedaço é ordenado e os pedaços são intercalados dia a dia, com
+        no máximo um lote de registros (BATCH_ROWS linhas ou um dia) em
+        memória. A escrita é atômica.
+
+        Input: iterável de pyarrow.Table (to_arrow) e caminho de destino
+        Output: caminho gravado
+    '''
+    tables = [_sort_by_date(table) for table in tables]
+    if not tables:
+        raise ValueError('Nenhum pedido para gravar')
+
+    dictionaries = sorted_dictionaries(tables)
+
+    # Primeira linha de cada dia em cada pedaço (busca binária)
+    days = [order_days(table) for table in tables]
+    unique_days = np.unique(np.concatenate(days))
+    bounds = [np.append(np.searchsorted(table_days, unique_days), len(table_days))
+              for table_days in days]
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    writer = None
+
+    def write(pieces):
+        nonlocal writer
+        batch = unify_dictionaries(pa.concat_tables(pieces), dictionaries).combine_chunks()
+        if writer is None:
+            writer = pa.ipc.new_file(tmp_path, batch.schema)
+        writer.write_table(batch)
+
+    try:
+        pieces, n_rows = [], 0
+        for i in range(len(unique_days)):
+            for table, table_bounds in zip(tables, bounds):
+                start, end = table_bounds[i], table_bounds[i + 1]
+                if end > start:
+                    pieces.append(table.slice(start, end - start))
+                    n_rows += end - start
+
+            if n_rows >= BATCH_ROWS:
+                write(pieces)
+                pieces, n_rows = [], 0
+
+        if pieces:
+            write(pieces)
+        elif writer is None:
+            # Nenhuma linha nos pedaços: grava a tabela vazia com o schema
+            write([tables[0]])
+    finally:
+        if writer is not None:
+            writer.close()
+
+    os.replace(tmp_path, path)
+
+    return path
+
+
+def list_parts(parts_dir):
+    '''Lotes incrementais gravados, na ordem em que foram anexados.
+
+        Input: diretório de lotes
+        Output: lista de caminhos
+    '''
+    return sorted(glob.glob(os.path.join(parts_dir, f'*{STORE_SUFFIX}')))
+
+
+def write_part(table, parts_dir):
+    '''Anexa um lote ao dataset gravando-o como um novo arquivo no
+        diretório de lotes. O arquivo principal não é reescrito.
+
+        Input: pyarrow.Table do lote e diretório de lotes
+        Output: caminho do lote gravado
+    '''
+    os.makedirs(parts_dir, exist_ok=True)
+    number = len(list_parts(parts_dir)) + 1
+
+    return write_store_tables([table], os.path.join(parts_dir, f'{number:06d}{STORE_SUFFIX}'))
+
+
+def clear_parts(parts_dir):
+    '''Remove os lotes incrementais (usado quando o dataset é reconstruído
+        a partir de um CSV completo).
+
+        Input: diretório de lotes
+        Output: None
+    '''
+    shutil.rmtree(parts_dir, ignore_errors=True)
+
+
+def open_store(path, parts=()):
+    '''Abre o arquivo colunar e os lotes anexados via memory-map. Nenhuma
+        coluna é lida do disco até ser efetivamente usada.
+
+        Input: caminho do arquivo .feather e lista de lotes
+        Output: pyarrow.Table
+    '''
+    tables = [pa.ipc.open_file(pa.memory_map(name, 'r')).read_all()
+              for name in [path, *parts]]
+
+    if len(tables) == 1:
+        return tables[0]
+
+    return pa.concat_tables(tables)
+
+
+def write_rollup(cube, path):
+    '''Persiste o cubo diário (os conjuntos de entregadores viram listas).
+
+        Input: Dataframe do cubo e caminho de destino
+        Output: caminho gravado
+    '''
+    table = pa.Table.from_pandas(cube, preserve_index=False)
+    return write_store(table, path)
+
+
+def read_rollup(path):
+    '''Lê o cubo diário persistido.
+
+        Input: caminho do arquivo do cubo
+        Output: Dataframe do cubo
+    '''
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+
+def column_to_pandas(table, name):
+    '''Converte uma coluna da tabela para pandas: dicionários viram
+        categorias, textos viram strings Arrow e date32 vira datetime64.
+
+        Input: pyarrow.Table e nome da coluna
+        Output: Series
+    '''
+    series = table.select([name]).to_pandas(date_as_object=False,
+                                            types_mapper=pandas_type)[name]
+
+    if name in DATE_COLUMNS:
+        series = series.astype('datetime64[ns]')
+
+    # Lote anexado com valores novos: os dicionários do arquivo principal e
+    # dos lotes são unidos na leitura e as categorias voltam à ordem alfabética
+    if isinstance(series.dtype, pd.CategoricalDtype) \
+            and not series.cat.categories.is_monotonic_increasing:
+        series = series.cat.reorder_categories(series.cat.categories.sort_values())
+
+    return series